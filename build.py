@@ -205,6 +205,11 @@ def main():
                           'src/webdriver/bots_client.py',
                           'src/webdriver/chrome_resize.py',
                           'src/webdriver/client_logging.py',
+                          'src/webdriver/http_transport.py',
+                          'src/webdriver/layout_blocks.py',
+                          'src/webdriver/layout_pack.py',
+                          'src/webdriver/screenshot_transcode.py',
+                          'src/webdriver/upload_spool.py',
                           'src/webdriver/webdriver_wrapper.py'],
                          'src/webdriver/bots_client.py',
                          options.server_address)
@@ -216,7 +221,8 @@ def main():
     BuildPythonZipBundle('src/appengine/static/browser_install_bundle.zip',
                          ['src/client_setup/chrome_manager.py',
                           'src/client_setup/instance_manager.py',
-                          'src/client_setup/mylogger.py'],
+                          'src/client_setup/mylogger.py',
+                          'src/webdriver/http_transport.py'],
                          'src/client_setup/instance_manager.py',
                          options.server_address)
 
@@ -224,7 +230,8 @@ def main():
     logging.info('Building download_files_bundle.zip')
     BuildPythonZipBundle('src/appengine/static/download_files_bundle.zip',
                          ['src/client_setup/download_files.py',
-                          'src/client_setup/mylogger.py'],
+                          'src/client_setup/mylogger.py',
+                          'src/webdriver/http_transport.py'],
                          'src/client_setup/download_files.py',
                          options.server_address)
 
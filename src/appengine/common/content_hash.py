@@ -0,0 +1,62 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Content fingerprints of captured page data.
+
+Fingerprints are computed once when the data is received, from the data as it
+was sent by the client. Equal fingerprints mean byte-identical captures, which
+lets the comparison skip identical layout table parts and pages.
+"""
+
+
+
+import hashlib
+
+
+def HashContent(content, content_format=None):
+  """Computes the fingerprint of a piece of captured data.
+
+  Args:
+    content: The data as sent by the client (a string).
+    content_format: Optional string describing the format of the data. Data
+      in different formats never has the same fingerprint.
+
+  Returns:
+    A hex digest string.
+  """
+  if isinstance(content, unicode):
+    content = content.encode('utf-8')
+  digest = hashlib.sha1()
+  digest.update(content_format or '')
+  digest.update('\n')
+  digest.update(content)
+  return digest.hexdigest()
+
+
+def AllEqual(hashes1, hashes2, count):
+  """Checks if two lists of fingerprints are complete and equal.
+
+  Args:
+    hashes1: A list of fingerprints, with empty strings for missing data.
+    hashes2: A list of fingerprints, with empty strings for missing data.
+    count: The number of fingerprints of a complete list.
+
+  Returns:
+    True if both lists have all the count fingerprints and they are equal.
+  """
+  return (len(hashes1) == count and '' not in hashes1 and
+          list(hashes1) == list(hashes2))
@@ -0,0 +1,56 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Tests for content_hash."""
+
+
+
+import unittest
+
+from common import content_hash
+
+
+class ContentHashTest(unittest.TestCase):
+
+  def testHashContent(self):
+    self.assertEqual(content_hash.HashContent('[[1, 2]]', 'rle'),
+                     content_hash.HashContent(u'[[1, 2]]', 'rle'))
+    self.assertNotEqual(content_hash.HashContent('[[1, 2]]', 'rle'),
+                        content_hash.HashContent('[[1, 3]]', 'rle'))
+
+  def testHashContent_Format(self):
+    self.assertNotEqual(content_hash.HashContent('[[1, 2]]', 'rle'),
+                        content_hash.HashContent('[[1, 2]]', 'dense'))
+    self.assertEqual(content_hash.HashContent('[]'),
+                     content_hash.HashContent('[]', None))
+
+  def testAllEqual(self):
+    self.assertTrue(content_hash.AllEqual(['a', 'b'], ['a', 'b'], 2))
+    self.assertFalse(content_hash.AllEqual(['a', 'b'], ['a', 'c'], 2))
+
+  def testAllEqual_Incomplete(self):
+    self.assertFalse(content_hash.AllEqual(['a', ''], ['a', ''], 2))
+    self.assertFalse(content_hash.AllEqual(['a'], ['a'], 2))
+    self.assertFalse(content_hash.AllEqual([], [], 2))
+
+
+def main():
+  unittest.main()
+
+
+if __name__ == '__main__':
+  main()
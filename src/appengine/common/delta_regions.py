@@ -0,0 +1,96 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Region based storage of layout deltas.
+
+The compare engines report differing pixels as horizontal spans:
+    (x, y, length, nid1, nid2)
+
+Spans of the same node pair that are stacked on consecutive rows are merged
+into rectangles, which is the format the delta entries are stored in:
+    [x, y, width, height, nid1, nid2]
+
+Entries stored in the legacy format hold one (x, y, nid1, nid2) tuple per
+pixel; they are read as 1x1 rectangles.
+"""
+
+
+
+
+DELTA_FORMAT_PIXELS = 'pixels'
+DELTA_FORMAT_RECTS = 'rects'
+
+
+class DeltaFormatError(Exception):
+  pass
+
+
+def MergeSpans(spans):
+  """Merges horizontal spans into rectangles.
+
+  A span is merged into the rectangle right above it if both cover the same
+  columns and belong to the same node pair.
+
+  Args:
+    spans: A list of (x, y, length, nid1, nid2) spans in row-major order.
+
+  Returns:
+    A list of [x, y, width, height, nid1, nid2] rectangles.
+  """
+  rects = []
+  # Maps (x, width, nid1, nid2) to the rectangle that ends on the last row.
+  open_rects = {}
+  for x, y, length, nid1, nid2 in spans:
+    key = (x, length, nid1, nid2)
+    rect = open_rects.get(key)
+    if rect is not None and rect[1] + rect[3] == y:
+      rect[3] += 1
+    else:
+      rect = [x, y, length, 1, nid1, nid2]
+      rects.append(rect)
+      open_rects[key] = rect
+  return rects
+
+
+def GetPixelCount(rects):
+  """Returns the number of pixels covered by a list of rectangles."""
+  count = 0
+  for rect in rects:
+    count += rect[2] * rect[3]
+  return count
+
+
+def ToRects(data, delta_format):
+  """Converts delta entry data in the given format to rectangles.
+
+  Args:
+    data: The decoded content of a delta entry.
+    delta_format: The format of the data, DELTA_FORMAT_RECTS or
+      DELTA_FORMAT_PIXELS. None is treated as DELTA_FORMAT_PIXELS.
+
+  Returns:
+    A list of [x, y, width, height, nid1, nid2] rectangles.
+
+  Raises:
+    DeltaFormatError: The delta format is not supported.
+  """
+  if delta_format == DELTA_FORMAT_RECTS:
+    return data
+  elif delta_format is None or delta_format == DELTA_FORMAT_PIXELS:
+    return [[pix[0], pix[1], 1, 1, pix[2], pix[3]] for pix in data]
+  else:
+    raise DeltaFormatError('Unknown delta format: %s' % delta_format)
@@ -0,0 +1,59 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Tests for delta_regions."""
+
+
+
+import unittest
+
+from common import delta_regions
+
+
+class DeltaRegionsTest(unittest.TestCase):
+
+  def testMergeSpans(self):
+    spans = [(0, 0, 4, 1, 2), (6, 0, 2, 3, 4),
+             (0, 1, 4, 1, 2), (6, 1, 2, 3, 5),
+             (0, 2, 3, 1, 2),
+             (0, 4, 4, 1, 2)]
+    self.assertEqual([[0, 0, 4, 2, 1, 2], [6, 0, 2, 1, 3, 4],
+                      [6, 1, 2, 1, 3, 5], [0, 2, 3, 1, 1, 2],
+                      [0, 4, 4, 1, 1, 2]],
+                     delta_regions.MergeSpans(spans))
+
+  def testGetPixelCount(self):
+    self.assertEqual(0, delta_regions.GetPixelCount([]))
+    self.assertEqual(10, delta_regions.GetPixelCount(
+        [[0, 0, 4, 2, 1, 2], [6, 0, 2, 1, 3, 4]]))
+
+  def testToRects(self):
+    rects = [[0, 0, 4, 2, 1, 2]]
+    self.assertEqual(rects, delta_regions.ToRects(
+        rects, delta_regions.DELTA_FORMAT_RECTS))
+    self.assertEqual([[3, 4, 1, 1, 5, 6]],
+                     delta_regions.ToRects([[3, 4, 5, 6]], None))
+    self.assertRaises(delta_regions.DeltaFormatError,
+                      delta_regions.ToRects, [], 'unknown')
+
+
+def main():
+  unittest.main()
+
+
+if __name__ == '__main__':
+  main()
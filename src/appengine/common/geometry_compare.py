@@ -0,0 +1,185 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Approximate page comparison based on the nodes tables only.
+
+Nodes of the test and reference page are matched by selector first and by
+geometry second. A node is mismatched if no node of the other page has the
+same geometry, i.e. it was moved, resized, added or removed. The painted area
+of all mismatched nodes, computed with a sweep-line rectangle union, estimates
+the number of differing pixels without reading the layout tables.
+
+Node positions are the offsets sent by the client, so the estimate is only an
+approximation of the pixel comparison.
+"""
+
+
+
+
+def _GetGeometry(node):
+  return (node['w'], node['h'], node['x'], node['y'])
+
+
+def FindMismatchedNodes(test_nodes_table, ref_nodes_table):
+  """Matches the nodes of two pages and lists the nodes without a match.
+
+  Nodes are paired by lowercase selector first, in document order; a pair with
+  the same geometry is a match. Every other node is matched by geometry: it is
+  a match if any node of the other page has the same geometry, since the pixel
+  comparison considers such nodes the same (see layout_compare.AreNodesSame).
+
+  Args:
+    test_nodes_table: The nodes table of the test page.
+    ref_nodes_table: The nodes table of the reference page.
+
+  Returns:
+    A (test_mismatched, ref_mismatched) tuple of lists of node ids.
+  """
+  ref_by_selector = {}
+  ref_geometries = set()
+  for nid in range(len(ref_nodes_table)):
+    node = ref_nodes_table[nid]
+    ref_by_selector.setdefault(node['p'].lower(), []).append(nid)
+    ref_geometries.add(_GetGeometry(node))
+
+  test_geometries = set()
+  ref_matched = set()
+  test_unpaired = []
+  for nid in range(len(test_nodes_table)):
+    node = test_nodes_table[nid]
+    geometry = _GetGeometry(node)
+    test_geometries.add(geometry)
+    candidates = ref_by_selector.get(node['p'].lower())
+    if candidates:
+      ref_nid = candidates.pop(0)
+      if _GetGeometry(ref_nodes_table[ref_nid]) == geometry:
+        ref_matched.add(ref_nid)
+        continue
+    test_unpaired.append(nid)
+
+  test_mismatched = [nid for nid in test_unpaired
+                     if _GetGeometry(test_nodes_table[nid])
+                     not in ref_geometries]
+  ref_mismatched = [nid for nid in range(len(ref_nodes_table))
+                    if nid not in ref_matched and
+                    _GetGeometry(ref_nodes_table[nid]) not in test_geometries]
+  return test_mismatched, ref_mismatched
+
+
+def GetNodeRects(nodes_table, nids, width, height):
+  """Returns the rectangles painted by the given nodes, clipped to the page.
+
+  Args:
+    nodes_table: A nodes table.
+    nids: A list of node ids.
+    width: The page width.
+    height: The page height.
+
+  Returns:
+    A list of (x1, y1, x2, y2) rectangles with a non-empty area.
+  """
+  rects = []
+  for nid in nids:
+    node = nodes_table[nid]
+    x1 = max(node['x'], 0)
+    y1 = max(node['y'], 0)
+    x2 = min(node['x'] + node['w'], width)
+    y2 = min(node['y'] + node['h'], height)
+    if x1 < x2 and y1 < y2:
+      rects.append((x1, y1, x2, y2))
+  return rects
+
+
+def ComputeUnionArea(rects):
+  """Computes the area covered by the union of rectangles.
+
+  Sweeps a vertical line over the x coordinates of the rectangle edges and
+  keeps the covered length of the line in a segment tree over the compressed
+  y coordinates, which takes O(n log n) time for n rectangles.
+
+  Args:
+    rects: A list of (x1, y1, x2, y2) rectangles.
+
+  Returns:
+    The covered area.
+  """
+  if not rects:
+    return 0
+
+  ys = set()
+  events = []
+  for x1, y1, x2, y2 in rects:
+    ys.add(y1)
+    ys.add(y2)
+    events.append((x1, 1, y1, y2))
+    events.append((x2, -1, y1, y2))
+  ys = sorted(ys)
+  y_index = {}
+  for i in range(len(ys)):
+    y_index[ys[i]] = i
+  events.sort()
+
+  # Segment tree over the len(ys) - 1 elementary intervals. count holds how
+  # many rectangles fully cover a node's interval, covered its covered length.
+  num_intervals = len(ys) - 1
+  count = [0] * (4 * num_intervals)
+  covered = [0] * (4 * num_intervals)
+
+  def Update(node, low, high, start, end, delta):
+    if end <= low or high <= start:
+      return
+    if start <= low and high <= end:
+      count[node] += delta
+    else:
+      middle = (low + high) / 2
+      Update(2 * node + 1, low, middle, start, end, delta)
+      Update(2 * node + 2, middle, high, start, end, delta)
+    if count[node]:
+      covered[node] = ys[high] - ys[low]
+    elif high - low == 1:
+      covered[node] = 0
+    else:
+      covered[node] = covered[2 * node + 1] + covered[2 * node + 2]
+
+  area = 0
+  last_x = events[0][0]
+  for x, delta, y1, y2 in events:
+    area += covered[0] * (x - last_x)
+    last_x = x
+    Update(0, 0, num_intervals, y_index[y1], y_index[y2], delta)
+  return area
+
+
+def Compare(test_nodes_table, ref_nodes_table, width, height):
+  """Estimates the number of differing pixels between two pages.
+
+  Args:
+    test_nodes_table: The nodes table of the test page.
+    ref_nodes_table: The nodes table of the reference page.
+    width: The page width.
+    height: The page height.
+
+  Returns:
+    A (area, test_mismatched, ref_mismatched) tuple, where area is the painted
+    area of all mismatched nodes and test_mismatched and ref_mismatched are
+    the lists of mismatched node ids.
+  """
+  test_mismatched, ref_mismatched = FindMismatchedNodes(test_nodes_table,
+                                                        ref_nodes_table)
+  rects = (GetNodeRects(test_nodes_table, test_mismatched, width, height) +
+           GetNodeRects(ref_nodes_table, ref_mismatched, width, height))
+  return ComputeUnionArea(rects), test_mismatched, ref_mismatched
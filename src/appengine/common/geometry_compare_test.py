@@ -0,0 +1,89 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Tests for geometry_compare."""
+
+
+
+import random
+import unittest
+
+from common import geometry_compare
+
+
+def _Node(selector, w=10, h=10, x=0, y=0):
+  return {'p': selector, 'w': w, 'h': h, 'x': x, 'y': y}
+
+
+class GeometryCompareTest(unittest.TestCase):
+
+  def testFindMismatchedNodes(self):
+    test_nt = [_Node('BODY', w=100, h=100), _Node('DIV', x=5),
+               _Node('P', x=50), _Node('SPAN', x=20, y=20)]
+    ref_nt = [_Node('body', w=100, h=100), _Node('DIV', x=7),
+              _Node('IMG', x=50), _Node('A', x=70, y=70)]
+    test_mismatched, ref_mismatched = geometry_compare.FindMismatchedNodes(
+        test_nt, ref_nt)
+    self.assertEqual([1, 3], test_mismatched)
+    self.assertEqual([1, 3], ref_mismatched)
+
+  def testFindMismatchedNodes_Same(self):
+    nt = [_Node('BODY'), _Node('DIV', x=5)]
+    self.assertEqual(([], []), geometry_compare.FindMismatchedNodes(nt, nt))
+
+  def testGetNodeRects(self):
+    nt = [_Node('A', x=-5, y=-5), _Node('B', w=0), _Node('C', x=95, y=95)]
+    self.assertEqual([(0, 0, 5, 5), (95, 95, 100, 100)],
+                     geometry_compare.GetNodeRects(nt, [0, 1, 2], 100, 100))
+
+  def testComputeUnionArea(self):
+    self.assertEqual(0, geometry_compare.ComputeUnionArea([]))
+    self.assertEqual(100, geometry_compare.ComputeUnionArea([(0, 0, 10, 10)]))
+    self.assertEqual(175, geometry_compare.ComputeUnionArea(
+        [(0, 0, 10, 10), (5, 5, 15, 15), (0, 0, 5, 5)]))
+    self.assertEqual(200, geometry_compare.ComputeUnionArea(
+        [(0, 0, 10, 10), (10, 0, 20, 10)]))
+
+  def testComputeUnionArea_MatchesPixelCount(self):
+    rng = random.Random(7)
+    for _ in range(50):
+      rects = []
+      pixels = set()
+      for _ in range(rng.randint(1, 8)):
+        x1 = rng.randint(0, 20)
+        y1 = rng.randint(0, 20)
+        x2 = x1 + rng.randint(1, 10)
+        y2 = y1 + rng.randint(1, 10)
+        rects.append((x1, y1, x2, y2))
+        for x in range(x1, x2):
+          for y in range(y1, y2):
+            pixels.add((x, y))
+      self.assertEqual(len(pixels), geometry_compare.ComputeUnionArea(rects))
+
+  def testCompare(self):
+    test_nt = [_Node('BODY', w=100, h=100), _Node('DIV', x=5)]
+    ref_nt = [_Node('BODY', w=100, h=100), _Node('DIV', x=10)]
+    self.assertEqual((150, [1], [1]),
+                     geometry_compare.Compare(test_nt, ref_nt, 100, 100))
+
+
+def main():
+  unittest.main()
+
+
+if __name__ == '__main__':
+  main()
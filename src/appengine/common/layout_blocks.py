@@ -0,0 +1,87 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Block-structured layout tables produced by the adaptive capture mode.
+
+Instead of hit-testing every pixel, the client samples the corners and the
+center of square blocks and subdivides a block only where the samples differ.
+Every uniform block is sent as a flat list:
+    [nid, x, y, width, height]
+
+The client splits the blocks into the layout table pieces at the same pixel
+rows as the other formats, clipping the blocks that cross a piece boundary, so
+the y coordinates of the blocks of a piece are relative to the first row of
+the piece. Pieces are expanded into run-length encoded rows (see layout_rle)
+before they are compared.
+"""
+
+
+
+
+LAYOUT_FORMAT_BLOCKS = 'blocks'
+
+# Node id of the pixels not covered by any block, i.e. without an element.
+NO_ELEMENT_ID = -2
+
+
+def GetRowCount(blocks):
+  """Returns the number of pixel rows covered by a piece of blocks."""
+  count = 0
+  for block in blocks:
+    count = max(count, int(block[2]) + int(block[4]))
+  return count
+
+
+def ToRuns(blocks):
+  """Expands a piece of blocks into run-length encoded rows.
+
+  Adjacent blocks of the same node are merged into a single run and pixels not
+  covered by any block are given NO_ELEMENT_ID, so the rows are the same as
+  the rows a per-pixel capture produces for the same samples.
+
+  Args:
+    blocks: A list of [nid, x, y, width, height] blocks.
+
+  Returns:
+    A list of flat lists of alternating node ids and run lengths.
+  """
+  rows = [[] for _ in range(GetRowCount(blocks))]
+  for block in blocks:
+    nid, x, y, width, height = [int(value) for value in block]
+    for row in range(y, y + height):
+      rows[row].append((x, width, nid))
+
+  runs = []
+  for row in rows:
+    row.sort()
+    row_runs = []
+    end = 0
+    for x, width, nid in row:
+      if x > end:
+        _AddRun(row_runs, NO_ELEMENT_ID, x - end)
+      _AddRun(row_runs, nid, width)
+      end = x + width
+    runs.append(row_runs)
+  return runs
+
+
+def _AddRun(runs, nid, length):
+  if runs and runs[-2] == nid:
+    runs[-1] += length
+  else:
+    runs.append(nid)
+    runs.append(length)
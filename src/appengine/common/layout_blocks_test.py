@@ -0,0 +1,59 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Tests for layout_blocks."""
+
+
+
+import unittest
+
+from common import layout_blocks
+from common import layout_rle
+
+
+class LayoutBlocksTest(unittest.TestCase):
+
+  def testGetRowCount(self):
+    self.assertEqual(0, layout_blocks.GetRowCount([]))
+    self.assertEqual(6, layout_blocks.GetRowCount(
+        [[1, 0, 0, 4, 4], [2, 4, 2, 2, 4]]))
+
+  def testToRuns(self):
+    blocks = [[1, 0, 0, 2, 2], [1, 2, 0, 2, 1], [3, 2, 1, 1, 1],
+              [1, 3, 1, 1, 1], [4, 0, 2, 4, 1]]
+    self.assertEqual([[1, 4], [1, 2, 3, 1, 1, 1], [4, 4]],
+                     layout_blocks.ToRuns(blocks))
+
+  def testToRuns_FillsGaps(self):
+    self.assertEqual([[-2, 1, 5, 2], [5, 3]],
+                     layout_blocks.ToRuns([[5, 1, 0, 2, 1], [5, 0, 1, 3, 1]]))
+
+  def testToRuns_MatchesDense(self):
+    dense = [[1, 1, 2, 2], [1, 1, 2, 2], [3, 3, 3, 2]]
+    blocks = [[1, 0, 0, 2, 2], [2, 2, 0, 2, 2], [3, 0, 2, 2, 1],
+              [3, 2, 2, 1, 1], [2, 3, 2, 1, 1]]
+    self.assertEqual(layout_rle.ToRuns(dense, layout_rle.LAYOUT_FORMAT_DENSE),
+                     layout_rle.ToRuns(blocks,
+                                       layout_blocks.LAYOUT_FORMAT_BLOCKS))
+
+
+def main():
+  unittest.main()
+
+
+if __name__ == '__main__':
+  main()
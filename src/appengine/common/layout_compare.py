@@ -0,0 +1,291 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Comparison engines for one part of a pair of layout tables.
+
+Every engine takes the run-length encoded rows of the test and reference part
+(see layout_rle), the node index of the two pages (see node_index) and both
+dynamic content sets. It returns
+the differing pixels and the pixels covered by dynamic content, each as a list
+of (x, y, length, nid1, nid2) horizontal spans in row-major order. Adjacent
+pixels of a row with the same node pair always form a single span.
+
+The 'runs' engine is pure Python and walks the rows run against run. The
+'numpy' engine decodes the part into integer arrays and computes both lists
+with vectorized masks; it is only available when NumPy can be imported. The
+App Engine application runs on the 'python' runtime, which cannot import
+NumPy, so the 'numpy' engine only runs off App Engine (e.g. in offline
+comparisons and the tests) and requests for it on App Engine use 'runs'.
+"""
+
+
+
+import logging
+
+from common import layout_rle
+
+# NumPy is optional; the vectorized engine is disabled without it, which is
+# always the case on the App Engine 'python' runtime.
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+
+ENGINE_RUNS = 'runs'
+ENGINE_NUMPY = 'numpy'
+
+ENGINES = [ENGINE_RUNS, ENGINE_NUMPY]
+
+
+def AreNodesSame(node_data_1, node_data_2):
+  """Compares if two nodes are the same.
+
+  Currently using a very basic algorithm: assume the nodes are the same if
+  either their XPaths are the same or their dimension/positions are the same.
+
+  Args:
+    node_data_1: A dictionary of values about a DOM node.
+    node_data_2: A dictionary of values about a DOM node.
+
+  Returns:
+    A boolean indicating whether the two nodes should be considered equivalent.
+  """
+
+  return (node_data_1['p'].lower() == node_data_2['p'].lower() or
+          (node_data_1['w'] == node_data_2['w'] and
+           node_data_1['h'] == node_data_2['h'] and
+           node_data_1['x'] == node_data_2['x'] and
+           node_data_1['y'] == node_data_2['y']))
+
+
+def GetEngine(name):
+  """Returns the compare function for the given engine name.
+
+  Falls back to the 'runs' engine if the requested engine is unknown or its
+  dependencies are not available.
+
+  Args:
+    name: A string naming the engine, one of ENGINES.
+
+  Returns:
+    A function with the same signature as CompareRuns.
+  """
+  if name == ENGINE_NUMPY:
+    if numpy is not None:
+      return CompareVectorized
+    logging.warning('NumPy is not available, using the "%s" engine.',
+                    ENGINE_RUNS)
+  elif name and name != ENGINE_RUNS:
+    logging.warning('Unknown compare engine "%s", using the "%s" engine.',
+                    name, ENGINE_RUNS)
+  return CompareRuns
+
+
+def CompareRuns(rows1, rows2, index, dynamic1, dynamic2, y_offset):
+  """Compares two parts of a layout table by walking the runs of each row.
+
+  Args:
+    rows1: A list of run-length encoded rows from the test page.
+    rows2: A list of run-length encoded rows from the reference page.
+    index: A node_index.NodeIndex object for the test and reference page.
+    dynamic1: A set of dynamic content node ids of the test page, or None.
+    dynamic2: A set of dynamic content node ids of the reference page, or None.
+    y_offset: The y coordinate of the first row of the part.
+
+  Returns:
+    A (diff_list, ignored_list) tuple of (x, y, length, nid1, nid2) lists.
+  """
+  dl = []
+  ignored = []
+  for i in range(min(len(rows1), len(rows2))):
+    y = i + y_offset
+    for x, length, nid1, nid2 in layout_rle.MergeRuns(rows1[i], rows2[i]):
+      if nid1 < 0 or nid2 < 0:
+        continue
+
+      # If element is marked as dynamic content then add it to the ignored
+      # content and continue.
+      if ((dynamic1 and nid1 in dynamic1) or
+          (dynamic2 and nid2 in dynamic2)):
+        _AddSpan(ignored, x, y, length, nid1, nid2)
+        continue
+
+      if not index.Contains(nid1, nid2):
+        continue
+
+      if not index.AreSame(nid1, nid2):
+        _AddSpan(dl, x, y, length, nid1, nid2)
+
+  return dl, ignored
+
+
+def _AddSpan(spans, x, y, length, nid1, nid2):
+  """Adds a span to a list, extending the last span if it is adjacent."""
+  if spans:
+    last = spans[-1]
+    if (last[1] == y and last[0] + last[2] == x and last[3] == nid1 and
+        last[4] == nid2):
+      spans[-1] = (last[0], y, last[2] + length, nid1, nid2)
+      return
+  spans.append((x, y, length, nid1, nid2))
+
+
+def _DecodeRows(rows, num_rows, width):
+  """Decodes run-length encoded rows into a 2D int32 array.
+
+  Pixels beyond the end of a row are set to -1 so they are never compared.
+
+  Args:
+    rows: A list of run-length encoded rows.
+    num_rows: The number of rows to decode.
+    width: The width of the resulting array.
+
+  Returns:
+    A numpy.ndarray of shape (num_rows, width).
+  """
+  grid = numpy.empty((num_rows, width), dtype=numpy.int32)
+  grid.fill(-1)
+  for i in range(num_rows):
+    runs = numpy.asarray(rows[i], dtype=numpy.int32)
+    if not len(runs):
+      continue
+    row = numpy.repeat(runs[0::2], runs[1::2])
+    grid[i, :len(row)] = row
+  return grid
+
+
+def _ToCodeArray(codes):
+  """Converts an array of node codes into an int32 array with a sentinel.
+
+  A trailing sentinel entry of -1 is appended so that the index just past the
+  last node is always valid.
+
+  Args:
+    codes: An array.array of node codes.
+
+  Returns:
+    A numpy.ndarray of int32 codes.
+  """
+  return numpy.append(numpy.asarray(codes.tolist(), dtype=numpy.int32), -1)
+
+
+def _BuildMembershipLookup(grid, members):
+  """Builds a boolean lookup array telling which node ids are in members.
+
+  Args:
+    grid: The non-negative node id array that will be looked up.
+    members: A set of node ids, or None.
+
+  Returns:
+    A boolean numpy array indexed by node id, or None if there are no members.
+  """
+  if not members:
+    return None
+  size = int(grid.max()) + 1 if grid.size else 1
+  size = max(size, max(members) + 1)
+  lookup = numpy.zeros(size, dtype=bool)
+  lookup[[nid for nid in members if nid >= 0]] = True
+  return lookup
+
+
+def _ToSpans(mask, grid1, grid2, y_offset):
+  """Lists the (x, y, length, nid1, nid2) spans of all set pixels of the mask.
+
+  Args:
+    mask: A 2D boolean array.
+    grid1: The 2D node id array of the test page.
+    grid2: The 2D node id array of the reference page.
+    y_offset: The y coordinate of the first row.
+
+  Returns:
+    A list of spans in row-major order.
+  """
+  # A pixel continues the span of its left neighbour if both are set and have
+  # the same node pair.
+  continued = (mask[:, 1:] & mask[:, :-1] &
+               (grid1[:, 1:] == grid1[:, :-1]) &
+               (grid2[:, 1:] == grid2[:, :-1]))
+  starts = mask.copy()
+  starts[:, 1:] &= ~continued
+  ends = mask.copy()
+  ends[:, :-1] &= ~continued
+
+  ys, xs = numpy.nonzero(starts)
+  xe = numpy.nonzero(ends)[1]
+  return zip(xs.tolist(), (ys + y_offset).tolist(), (xe - xs + 1).tolist(),
+             grid1[ys, xs].tolist(), grid2[ys, xs].tolist())
+
+
+def CompareVectorized(rows1, rows2, index, dynamic1, dynamic2, y_offset):
+  """Compares two parts of a layout table with vectorized NumPy masks.
+
+  Produces exactly the same output as CompareRuns.
+
+  Args:
+    rows1: A list of run-length encoded rows from the test page.
+    rows2: A list of run-length encoded rows from the reference page.
+    index: A node_index.NodeIndex object for the test and reference page.
+    dynamic1: A set of dynamic content node ids of the test page, or None.
+    dynamic2: A set of dynamic content node ids of the reference page, or None.
+    y_offset: The y coordinate of the first row of the part.
+
+  Returns:
+    A (diff_list, ignored_list) tuple of (x, y, length, nid1, nid2) lists.
+  """
+  num_rows = min(len(rows1), len(rows2))
+  width = 0
+  for i in range(num_rows):
+    width = max(width, layout_rle.GetRowLength(rows1[i]),
+                layout_rle.GetRowLength(rows2[i]))
+  if not num_rows or not width:
+    return [], []
+
+  grid1 = _DecodeRows(rows1, num_rows, width)
+  grid2 = _DecodeRows(rows2, num_rows, width)
+
+  valid = (grid1 >= 0) & (grid2 >= 0)
+  safe1 = numpy.where(valid, grid1, 0)
+  safe2 = numpy.where(valid, grid2, 0)
+
+  dynamic = numpy.zeros(valid.shape, dtype=bool)
+  lookup = _BuildMembershipLookup(safe1, dynamic1)
+  if lookup is not None:
+    dynamic |= lookup[safe1]
+  lookup = _BuildMembershipLookup(safe2, dynamic2)
+  if lookup is not None:
+    dynamic |= lookup[safe2]
+  dynamic &= valid
+
+  selectors1 = _ToCodeArray(index.test_selectors)
+  geometries1 = _ToCodeArray(index.test_geometries)
+  selectors2 = _ToCodeArray(index.ref_selectors)
+  geometries2 = _ToCodeArray(index.ref_geometries)
+  num_nodes1 = index.GetTestNodeCount()
+  num_nodes2 = index.GetRefNodeCount()
+
+  # Node ids outside of the nodes tables are skipped, as in the pure Python
+  # engine. They index the sentinel entry instead.
+  compared = valid & ~dynamic & (grid1 < num_nodes1) & (grid2 < num_nodes2)
+  index1 = numpy.where(compared, safe1, num_nodes1)
+  index2 = numpy.where(compared, safe2, num_nodes2)
+  same = ((selectors1[index1] == selectors2[index2]) |
+          (geometries1[index1] == geometries2[index2]))
+  different = compared & ~same
+
+  return (_ToSpans(different, grid1, grid2, y_offset),
+          _ToSpans(dynamic, grid1, grid2, y_offset))
@@ -0,0 +1,122 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Tests for layout_compare."""
+
+
+
+import unittest
+
+from common import layout_compare
+from common import layout_rle
+from common import node_index
+
+
+def _Node(selector, w=10, h=10, x=0, y=0):
+  return {'p': selector, 'w': w, 'h': h, 'x': x, 'y': y}
+
+
+def _ToPixels(spans):
+  pixels = []
+  for x, y, length, nid1, nid2 in spans:
+    pixels.extend([(x + k, y, nid1, nid2) for k in range(length)])
+  return pixels
+
+
+class LayoutCompareTest(unittest.TestCase):
+
+  def setUp(self):
+    self.nt1 = [_Node('BODY'), _Node('BODY>DIV:~(1)'),
+                _Node('BODY>P:~(2)', x=5), _Node('BODY>SPAN:~(3)')]
+    self.nt2 = [_Node('body'), _Node('BODY>DIV:~(2)'),
+                _Node('BODY>ARTICLE:~(2)', x=5), _Node('BODY>IMG:~(3)', w=3)]
+    dense1 = [['0', '0', '1', '1', '2', '3 foo', '-1'],
+              ['0', '3', '3', '3', '7', '1'],
+              ['2', '2', '1']]
+    dense2 = [['0', '0', '1', '3', '2', '3', '3'],
+              ['0', '3', '3', '0', '1', '1', '1'],
+              ['2', '-2', '3']]
+    self.index = node_index.Build(self.nt1, self.nt2)
+    self.rows1 = layout_rle.ToRuns(dense1, layout_rle.LAYOUT_FORMAT_DENSE)
+    self.rows2 = layout_rle.ToRuns(dense2, layout_rle.LAYOUT_FORMAT_DENSE)
+
+    # The expected output of the original per-pixel comparison.
+    self.expected_diff = []
+    self.expected_ignored = []
+    dynamic1 = set([3])
+    for i in range(len(dense1)):
+      for j in range(min(len(dense1[i]), len(dense2[i]))):
+        nid1 = layout_rle.ParseNodeId(dense1[i][j])
+        nid2 = layout_rle.ParseNodeId(dense2[i][j])
+        if nid1 < 0 or nid2 < 0:
+          continue
+        if nid1 in dynamic1:
+          self.expected_ignored.append((j, i + 8, nid1, nid2))
+          continue
+        if nid1 >= len(self.nt1) or nid2 >= len(self.nt2):
+          continue
+        if not layout_compare.AreNodesSame(self.nt1[nid1], self.nt2[nid2]):
+          self.expected_diff.append((j, i + 8, nid1, nid2))
+
+  def testAreNodesSame(self):
+    self.assertTrue(layout_compare.AreNodesSame(_Node('A'), _Node('a', w=1)))
+    self.assertTrue(layout_compare.AreNodesSame(_Node('A'), _Node('B')))
+    self.assertFalse(layout_compare.AreNodesSame(_Node('A'), _Node('B', y=1)))
+
+  def testCompareRuns(self):
+    diff, ignored = layout_compare.CompareRuns(
+        self.rows1, self.rows2, self.index, set([3]), None, 8)
+    self.assertEqual(self.expected_diff, _ToPixels(diff))
+    self.assertEqual(self.expected_ignored, _ToPixels(ignored))
+
+  def testCompareRuns_MergesAdjacentSpans(self):
+    # The two runs of node 1 are split in the reference row, but both pixels
+    # pair with node 3 so they form a single span.
+    diff, _ = layout_compare.CompareRuns(
+        [[1, 1, 1, 1]], [[3, 2]], self.index, None, None, 0)
+    self.assertEqual([(0, 0, 2, 1, 3)], diff)
+
+  def testCompareVectorized(self):
+    if layout_compare.numpy is None:
+      return
+    diff, ignored = layout_compare.CompareVectorized(
+        self.rows1, self.rows2, self.index, set([3]), None, 8)
+    self.assertEqual(self.expected_diff, _ToPixels(diff))
+    self.assertEqual(self.expected_ignored, _ToPixels(ignored))
+    self.assertEqual(layout_compare.CompareRuns(
+        self.rows1, self.rows2, self.index, set([3]), None, 8),
+                     (diff, ignored))
+
+  def testCompareVectorized_Empty(self):
+    if layout_compare.numpy is None:
+      return
+    self.assertEqual(([], []), layout_compare.CompareVectorized(
+        [], [], self.index, None, None, 0))
+
+  def testGetEngine(self):
+    self.assertEqual(layout_compare.CompareRuns,
+                     layout_compare.GetEngine(layout_compare.ENGINE_RUNS))
+    self.assertEqual(layout_compare.CompareRuns,
+                     layout_compare.GetEngine('unknown'))
+
+
+def main():
+  unittest.main()
+
+
+if __name__ == '__main__':
+  main()
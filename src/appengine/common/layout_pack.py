@@ -0,0 +1,172 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Binary packed format for pieces of run-length encoded layout tables.
+
+A packed piece is a fixed little-endian header followed by the (optionally
+zlib compressed) payload:
+    magic 'LPCK', version, value type code, compression, padding, row count
+    row lengths (uint32, one per row)
+    row values (int16 or int32, all rows concatenated)
+
+Row values are the flat run-length encoded rows (see layout_rle). They are
+stored signed because the client uses negative node ids for pixels without
+an element. The client packs the pieces and the server stores them as they
+were received; decoding only inflates the payload and loads it into arrays.
+"""
+
+
+
+import array
+import struct
+import sys
+import zlib
+
+
+LAYOUT_FORMAT_PACKED = 'packed'
+CONTENT_TYPE = 'application/octet-stream'
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+
+_MAGIC = 'LPCK'
+_VERSION = 1
+_HEADER_FORMAT = '<4sBcBxI'
+_HEADER_SIZE = struct.calcsize(_HEADER_FORMAT)
+
+# Array type codes of the row values, from the smallest.
+_VALUE_TYPES = ['h', 'i']
+_LENGTH_TYPE = 'I'
+
+
+class LayoutPackError(Exception):
+  pass
+
+
+def _ToLittleEndian(values):
+  """Converts an array between native and little-endian byte order in place."""
+  if sys.byteorder == 'big':
+    values.byteswap()
+  return values
+
+
+def Encode(rows, compression=COMPRESSION_ZLIB):
+  """Packs run-length encoded layout table rows.
+
+  Args:
+    rows: A list of flat run-length encoded rows of integers.
+    compression: An optional compression, COMPRESSION_ZLIB or
+      COMPRESSION_NONE.
+
+  Returns:
+    The packed piece as a binary string.
+  """
+  lengths = array.array(_LENGTH_TYPE, [len(row) for row in rows])
+  flat = []
+  for row in rows:
+    flat.extend(row)
+
+  value_type = _VALUE_TYPES[-1]
+  if flat:
+    low = min(flat)
+    high = max(flat)
+  else:
+    low = high = 0
+  for type_code in _VALUE_TYPES:
+    bits = array.array(type_code).itemsize * 8
+    if -(1 << (bits - 1)) <= low and high < (1 << (bits - 1)):
+      value_type = type_code
+      break
+  values = array.array(value_type, flat)
+
+  payload = (_ToLittleEndian(lengths).tostring() +
+             _ToLittleEndian(values).tostring())
+  if compression == COMPRESSION_ZLIB:
+    payload = zlib.compress(payload)
+  header = struct.pack(_HEADER_FORMAT, _MAGIC, _VERSION, value_type,
+                       compression, len(rows))
+  return header + payload
+
+
+def ReadHeader(data):
+  """Reads the header of a packed piece.
+
+  Args:
+    data: A packed piece as a binary string.
+
+  Returns:
+    A (value_type, compression, num_rows) tuple.
+
+  Raises:
+    LayoutPackError: The data is not a packed piece.
+  """
+  try:
+    magic, version, value_type, compression, num_rows = struct.unpack(
+        _HEADER_FORMAT, data[:_HEADER_SIZE])
+  except struct.error:
+    raise LayoutPackError('Packed piece is too short.')
+  if magic != _MAGIC:
+    raise LayoutPackError('Not a packed layout piece.')
+  if version != _VERSION:
+    raise LayoutPackError('Unsupported packed piece version: %d' % version)
+  if value_type not in _VALUE_TYPES:
+    raise LayoutPackError('Unsupported value type: %s' % value_type)
+  if compression not in (COMPRESSION_NONE, COMPRESSION_ZLIB):
+    raise LayoutPackError('Unsupported compression: %d' % compression)
+  return value_type, compression, num_rows
+
+
+def Decode(data):
+  """Unpacks a packed piece into run-length encoded rows.
+
+  Args:
+    data: A packed piece as a binary string.
+
+  Returns:
+    A list of run-length encoded rows, each an array of integers.
+
+  Raises:
+    LayoutPackError: The data is not a valid packed piece.
+  """
+  value_type, compression, num_rows = ReadHeader(data)
+  payload = data[_HEADER_SIZE:]
+  if compression == COMPRESSION_ZLIB:
+    try:
+      payload = zlib.decompress(payload)
+    except zlib.error:
+      raise LayoutPackError('Invalid compressed payload.')
+
+  lengths = array.array(_LENGTH_TYPE)
+  lengths_size = num_rows * lengths.itemsize
+  if len(payload) < lengths_size:
+    raise LayoutPackError('Truncated packed piece.')
+  lengths.fromstring(payload[:lengths_size])
+  _ToLittleEndian(lengths)
+  values = array.array(value_type)
+  values_data = payload[lengths_size:]
+  if (len(values_data) % values.itemsize or
+      len(values_data) / values.itemsize != sum(lengths)):
+    raise LayoutPackError('Truncated packed piece.')
+  values.fromstring(values_data)
+  _ToLittleEndian(values)
+
+  rows = []
+  start = 0
+  for length in lengths:
+    rows.append(values[start:start + length])
+    start += length
+  return rows
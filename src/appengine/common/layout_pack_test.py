@@ -0,0 +1,62 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Tests for layout_pack."""
+
+
+
+import unittest
+
+from common import layout_pack
+
+
+class LayoutPackTest(unittest.TestCase):
+
+  def testEncodeDecode(self):
+    rows = [[5, 3, -1, 2], [], [7, 1]]
+    data = layout_pack.Encode(rows)
+    self.assertEqual(('h', layout_pack.COMPRESSION_ZLIB, 3),
+                     layout_pack.ReadHeader(data))
+    self.assertEqual(rows, [list(row) for row in layout_pack.Decode(data)])
+
+  def testEncodeDecode_LargeValues(self):
+    rows = [[70000, 2, -3, 40000]]
+    data = layout_pack.Encode(rows, layout_pack.COMPRESSION_NONE)
+    self.assertEqual(('i', layout_pack.COMPRESSION_NONE, 1),
+                     layout_pack.ReadHeader(data))
+    self.assertEqual(rows, [list(row) for row in layout_pack.Decode(data)])
+
+  def testEncodeDecode_Empty(self):
+    self.assertEqual([], layout_pack.Decode(layout_pack.Encode([])))
+
+  def testDecode_Invalid(self):
+    data = layout_pack.Encode([[1, 2, 3, 4]], layout_pack.COMPRESSION_NONE)
+    self.assertRaises(layout_pack.LayoutPackError, layout_pack.Decode, 'LP')
+    self.assertRaises(layout_pack.LayoutPackError, layout_pack.Decode,
+                      'XXXX' + data[4:])
+    self.assertRaises(layout_pack.LayoutPackError, layout_pack.Decode,
+                      data[:-1])
+    self.assertRaises(layout_pack.LayoutPackError, layout_pack.Decode,
+                      data[:-2])
+
+
+def main():
+  unittest.main()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,178 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Run-length encoding utilities for layout table rows.
+
+The layout table stores the id of the DOM element found at every pixel of the
+page. Rows are mostly long stretches of the same id, so the client may send
+each row run-length encoded as a flat list of alternating node ids and run
+lengths:
+    [nid_a, length_a, nid_b, length_b, ...]
+
+Rows in the legacy dense format are lists with one node id per pixel. The ids
+may be strings that carry trailing class names (e.g. '12 foo').
+
+Block-structured tables (see layout_blocks) are expanded into run-length
+encoded rows as well.
+"""
+
+
+
+from common import layout_blocks
+
+
+LAYOUT_FORMAT_DENSE = 'dense'
+LAYOUT_FORMAT_RLE = 'rle'
+
+LAYOUT_FORMATS = [LAYOUT_FORMAT_DENSE, LAYOUT_FORMAT_RLE,
+                  layout_blocks.LAYOUT_FORMAT_BLOCKS]
+
+
+class LayoutFormatError(Exception):
+  pass
+
+
+def ParseNodeId(value):
+  """Parses a node id from a layout table cell.
+
+  Args:
+    value: An int or a string holding the node id, possibly followed by
+      whitespace separated class names.
+
+  Returns:
+    The node id as an integer.
+  """
+  try:
+    return int(value)
+  except ValueError:
+    return int(value.split()[0])
+
+
+def EncodeRow(row):
+  """Run-length encodes a dense layout table row.
+
+  Args:
+    row: A list with one node id per pixel.
+
+  Returns:
+    A flat list of alternating node ids and run lengths.
+  """
+  runs = []
+  current = None
+  length = 0
+  for value in row:
+    nid = ParseNodeId(value)
+    if nid == current:
+      length += 1
+    else:
+      if length:
+        runs.append(current)
+        runs.append(length)
+      current = nid
+      length = 1
+  if length:
+    runs.append(current)
+    runs.append(length)
+  return runs
+
+
+def DecodeRow(runs):
+  """Expands a run-length encoded row into a dense row of integer ids.
+
+  Args:
+    runs: A flat list of alternating node ids and run lengths.
+
+  Returns:
+    A list with one integer node id per pixel.
+  """
+  row = []
+  for i in range(0, len(runs), 2):
+    row.extend([int(runs[i])] * int(runs[i + 1]))
+  return row
+
+
+def GetRowLength(runs):
+  """Returns the number of pixels covered by a run-length encoded row."""
+  total = 0
+  for i in range(1, len(runs), 2):
+    total += int(runs[i])
+  return total
+
+
+def ToRuns(rows, layout_format):
+  """Converts layout table rows in the given format to run-length rows.
+
+  Args:
+    rows: A list of layout table rows, or of blocks for the block format.
+    layout_format: The format of the rows, one of LAYOUT_FORMATS. None is
+      treated as the legacy dense format.
+
+  Returns:
+    A list of run-length encoded rows.
+
+  Raises:
+    LayoutFormatError: The layout format is not supported.
+  """
+  if layout_format == LAYOUT_FORMAT_RLE:
+    return rows
+  elif layout_format is None or layout_format == LAYOUT_FORMAT_DENSE:
+    return [EncodeRow(row) for row in rows]
+  elif layout_format == layout_blocks.LAYOUT_FORMAT_BLOCKS:
+    return layout_blocks.ToRuns(rows)
+  else:
+    raise LayoutFormatError('Unknown layout format: %s' % layout_format)
+
+
+def MergeRuns(runs1, runs2):
+  """Walks two run-length encoded rows in lockstep.
+
+  The rows are split into segments over which neither row changes its node id.
+  Walking stops at the end of the shorter row, matching the pixel-by-pixel
+  comparison of dense rows.
+
+  Args:
+    runs1: A flat list of alternating node ids and run lengths.
+    runs2: A flat list of alternating node ids and run lengths.
+
+  Yields:
+    (x, length, nid1, nid2) tuples, where x is the first pixel of the segment.
+  """
+  i = 0
+  j = 0
+  left1 = 0
+  left2 = 0
+  nid1 = None
+  nid2 = None
+  x = 0
+  len1 = len(runs1)
+  len2 = len(runs2)
+  while True:
+    while not left1 and i < len1:
+      nid1 = int(runs1[i])
+      left1 = int(runs1[i + 1])
+      i += 2
+    while not left2 and j < len2:
+      nid2 = int(runs2[j])
+      left2 = int(runs2[j + 1])
+      j += 2
+    if not left1 or not left2:
+      return
+    length = min(left1, left2)
+    yield (x, length, nid1, nid2)
+    x += length
+    left1 -= length
+    left2 -= length
@@ -0,0 +1,92 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Tests for layout_rle."""
+
+
+
+import unittest
+
+import layout_rle
+
+
+class LayoutRleTest(unittest.TestCase):
+
+  def testParseNodeId(self):
+    self.assertEqual(12, layout_rle.ParseNodeId('12'))
+    self.assertEqual(12, layout_rle.ParseNodeId('12 foo bar'))
+    self.assertEqual(-2, layout_rle.ParseNodeId(-2))
+
+  def testEncodeRow(self):
+    self.assertEqual([1, 3, 2, 1, 1, 2],
+                     layout_rle.EncodeRow(['1', '1', '1 a', '2', '1', 1]))
+    self.assertEqual([], layout_rle.EncodeRow([]))
+
+  def testDecodeRow(self):
+    self.assertEqual([1, 1, 1, 2, 1, 1],
+                     layout_rle.DecodeRow([1, 3, 2, 1, 1, 2]))
+
+  def testGetRowLength(self):
+    self.assertEqual(6, layout_rle.GetRowLength([1, 3, 2, 1, 1, 2]))
+
+  def testToRuns_Dense(self):
+    self.assertEqual([[5, 2], [5, 1, 6, 1]],
+                     layout_rle.ToRuns([['5', '5'], ['5', '6']],
+                                       layout_rle.LAYOUT_FORMAT_DENSE))
+    self.assertEqual([[5, 2]], layout_rle.ToRuns([['5', '5']], None))
+
+  def testToRuns_Rle(self):
+    rows = [[5, 2]]
+    self.assertEqual(rows,
+                     layout_rle.ToRuns(rows, layout_rle.LAYOUT_FORMAT_RLE))
+
+  def testToRuns_Unknown(self):
+    self.assertRaises(layout_rle.LayoutFormatError,
+                      layout_rle.ToRuns, [], 'unknown')
+
+  def testMergeRuns(self):
+    self.assertEqual(
+        [(0, 2, 1, 1), (2, 1, 1, 3), (3, 2, 2, 3)],
+        list(layout_rle.MergeRuns([1, 3, 2, 2], [1, 2, 3, 3])))
+
+  def testMergeRuns_StopsAtShorterRow(self):
+    self.assertEqual(
+        [(0, 2, 1, 4)],
+        list(layout_rle.MergeRuns([1, 5], [4, 2])))
+    self.assertEqual([], list(layout_rle.MergeRuns([], [4, 2])))
+
+  def testMergeRuns_MatchesDenseWalk(self):
+    dense1 = ['1', '1', '2', '2', '2', '3', '-1']
+    dense2 = ['1', '4', '4', '2', '2', '3']
+    expected = []
+    for x in range(min(len(dense1), len(dense2))):
+      expected.append((x, int(dense1[x]), int(dense2[x])))
+
+    actual = []
+    for x, length, nid1, nid2 in layout_rle.MergeRuns(
+        layout_rle.EncodeRow(dense1), layout_rle.EncodeRow(dense2)):
+      for k in range(length):
+        actual.append((x + k, nid1, nid2))
+    self.assertEqual(expected, actual)
+
+
+def main():
+  unittest.main()
+
+
+if __name__ == '__main__':
+  main()
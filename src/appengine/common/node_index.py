@@ -0,0 +1,180 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Node correspondence index between the nodes tables of two pages.
+
+Two nodes are considered the same if their lowercase selectors are equal or
+their (w, h, x, y) geometry is equal (see layout_compare.AreNodesSame). The
+index interns both keys into small integer codes shared by the two pages, so
+that whether a (test node, reference node) pair is the same is answered in
+O(1) by comparing two codes, without touching the nodes tables again.
+
+The index is serialized into a compact zlib-compressed binary string so it can
+be stored once per PageDelta and reused by every comparison task.
+"""
+
+
+
+import array
+import struct
+import zlib
+
+
+# Serialization header: version, test node count, reference node count.
+_HEADER_FORMAT = '<III'
+_HEADER_SIZE = struct.calcsize(_HEADER_FORMAT)
+_VERSION = 1
+
+
+class NodeIndexError(Exception):
+  pass
+
+
+class NodeIndex(object):
+  """Answers whether a test node and a reference node are the same.
+
+  Attributes:
+    test_selectors: An array of selector codes indexed by test node id.
+    test_geometries: An array of geometry codes indexed by test node id.
+    ref_selectors: An array of selector codes indexed by reference node id.
+    ref_geometries: An array of geometry codes indexed by reference node id.
+  """
+
+  def __init__(self, test_selectors, test_geometries, ref_selectors,
+               ref_geometries):
+    self.test_selectors = test_selectors
+    self.test_geometries = test_geometries
+    self.ref_selectors = ref_selectors
+    self.ref_geometries = ref_geometries
+
+  def GetTestNodeCount(self):
+    """Returns the number of nodes in the test nodes table."""
+    return len(self.test_selectors)
+
+  def GetRefNodeCount(self):
+    """Returns the number of nodes in the reference nodes table."""
+    return len(self.ref_selectors)
+
+  def Contains(self, nid1, nid2):
+    """Checks if both node ids exist in their nodes tables.
+
+    Args:
+      nid1: A non-negative test node id.
+      nid2: A non-negative reference node id.
+
+    Returns:
+      True if both nodes are indexed.
+    """
+    return nid1 < len(self.test_selectors) and nid2 < len(self.ref_selectors)
+
+  def AreSame(self, nid1, nid2):
+    """Checks if a test node and a reference node are the same.
+
+    Args:
+      nid1: A test node id that is in the index.
+      nid2: A reference node id that is in the index.
+
+    Returns:
+      True if the nodes have the same selector or the same geometry.
+    """
+    return (self.test_selectors[nid1] == self.ref_selectors[nid2] or
+            self.test_geometries[nid1] == self.ref_geometries[nid2])
+
+  def Serialize(self):
+    """Serializes the index into a compressed binary string."""
+    header = struct.pack(_HEADER_FORMAT, _VERSION, len(self.test_selectors),
+                         len(self.ref_selectors))
+    return zlib.compress(''.join([
+        header, self.test_selectors.tostring(),
+        self.test_geometries.tostring(), self.ref_selectors.tostring(),
+        self.ref_geometries.tostring()]))
+
+
+def _EncodeNodes(nodes_table, selector_codes, geometry_codes):
+  """Maps every node of a nodes table to a selector and a geometry code.
+
+  Args:
+    nodes_table: A nodes table.
+    selector_codes: A dictionary of lowercase selector to code.
+    geometry_codes: A dictionary of (w, h, x, y) tuple to code.
+
+  Returns:
+    A (selectors, geometries) tuple of integer arrays indexed by node id.
+  """
+  selectors = array.array('i')
+  geometries = array.array('i')
+  for nid in range(len(nodes_table)):
+    node = nodes_table[nid]
+    selectors.append(selector_codes.setdefault(node['p'].lower(),
+                                               len(selector_codes)))
+    geometries.append(geometry_codes.setdefault(
+        (node['w'], node['h'], node['x'], node['y']), len(geometry_codes)))
+  return selectors, geometries
+
+
+def Build(test_nodes_table, ref_nodes_table):
+  """Builds the node index for a pair of nodes tables.
+
+  Args:
+    test_nodes_table: The nodes table of the test page.
+    ref_nodes_table: The nodes table of the reference page.
+
+  Returns:
+    A NodeIndex object.
+  """
+  selector_codes = {}
+  geometry_codes = {}
+  test_selectors, test_geometries = _EncodeNodes(
+      test_nodes_table, selector_codes, geometry_codes)
+  ref_selectors, ref_geometries = _EncodeNodes(
+      ref_nodes_table, selector_codes, geometry_codes)
+  return NodeIndex(test_selectors, test_geometries, ref_selectors,
+                   ref_geometries)
+
+
+def Deserialize(data):
+  """Loads a node index from the string produced by NodeIndex.Serialize.
+
+  Args:
+    data: A compressed binary string.
+
+  Returns:
+    A NodeIndex object.
+
+  Raises:
+    NodeIndexError: The data is not a valid serialized node index.
+  """
+  try:
+    data = zlib.decompress(data)
+    version, num_test, num_ref = struct.unpack(_HEADER_FORMAT,
+                                               data[:_HEADER_SIZE])
+  except (zlib.error, struct.error):
+    raise NodeIndexError('Invalid node index data.')
+  if version != _VERSION:
+    raise NodeIndexError('Unsupported node index version: %d' % version)
+
+  arrays = []
+  offset = _HEADER_SIZE
+  for count in (num_test, num_test, num_ref, num_ref):
+    codes = array.array('i')
+    size = count * codes.itemsize
+    codes.fromstring(data[offset:offset + size])
+    if len(codes) != count:
+      raise NodeIndexError('Truncated node index data.')
+    arrays.append(codes)
+    offset += size
+  return NodeIndex(*arrays)
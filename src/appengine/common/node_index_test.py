@@ -0,0 +1,82 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Tests for node_index."""
+
+
+
+import unittest
+
+from common import layout_compare
+from common import node_index
+
+
+def _Node(selector, w=10, h=10, x=0, y=0):
+  return {'p': selector, 'w': w, 'h': h, 'x': x, 'y': y}
+
+
+class NodeIndexTest(unittest.TestCase):
+
+  def setUp(self):
+    self.nt1 = [_Node('BODY'), _Node('BODY>DIV:~(1)'),
+                _Node('BODY>P:~(2)', x=5)]
+    self.nt2 = [_Node('body', w=3), _Node('BODY>DIV:~(2)'),
+                _Node('BODY>ARTICLE:~(2)', x=5), _Node('BODY>IMG', y=7)]
+
+  def testAreSame_MatchesAreNodesSame(self):
+    index = node_index.Build(self.nt1, self.nt2)
+    for nid1 in range(len(self.nt1)):
+      for nid2 in range(len(self.nt2)):
+        self.assertEqual(
+            layout_compare.AreNodesSame(self.nt1[nid1], self.nt2[nid2]),
+            index.AreSame(nid1, nid2))
+
+  def testContains(self):
+    index = node_index.Build(self.nt1, self.nt2)
+    self.assertEqual(3, index.GetTestNodeCount())
+    self.assertEqual(4, index.GetRefNodeCount())
+    self.assertTrue(index.Contains(2, 3))
+    self.assertFalse(index.Contains(3, 0))
+    self.assertFalse(index.Contains(0, 4))
+
+  def testSerialize(self):
+    index = node_index.Build(self.nt1, self.nt2)
+    loaded = node_index.Deserialize(index.Serialize())
+    self.assertEqual(index.test_selectors, loaded.test_selectors)
+    self.assertEqual(index.test_geometries, loaded.test_geometries)
+    self.assertEqual(index.ref_selectors, loaded.ref_selectors)
+    self.assertEqual(index.ref_geometries, loaded.ref_geometries)
+
+  def testSerialize_Empty(self):
+    loaded = node_index.Deserialize(node_index.Build([], []).Serialize())
+    self.assertEqual(0, loaded.GetTestNodeCount())
+    self.assertEqual(0, loaded.GetRefNodeCount())
+
+  def testDeserialize_Invalid(self):
+    data = node_index.Build(self.nt1, self.nt2).Serialize()
+    self.assertRaises(node_index.NodeIndexError,
+                      node_index.Deserialize, 'garbage')
+    self.assertRaises(node_index.NodeIndexError,
+                      node_index.Deserialize, data[:-4] + 'xxxx')
+
+
+def main():
+  unittest.main()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,251 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Compact columnar representation of a decoded nodes table.
+
+Older clients send the nodes table as a list with one dictionary per DOM
+element:
+    {'w': width, 'h': height, 'x': left, 'y': top, 'p': selector}
+
+Current clients send it in columns (see FromColumns), with the selector of
+each element encoded as the id of its parent element plus the last step of
+the selector.
+
+NodesTable stores the same data as integer arrays (one per field) plus an
+interned selector table, which takes a fraction of the memory of the list of
+dictionaries and can be serialized cheaply. Indexing a NodesTable still
+returns the dictionary of a node, so it can be used wherever the decoded list
+was used before.
+"""
+
+
+
+import array
+import struct
+import zlib
+
+from django.utils import simplejson
+
+
+# Serialization header: version, node count, selector table size in bytes.
+_HEADER_FORMAT = '<III'
+_HEADER_SIZE = struct.calcsize(_HEADER_FORMAT)
+_VERSION = 1
+
+# Value of the 'format' key of the columnar encoding sent by the client.
+COLUMNAR_FORMAT = 'columnar'
+
+
+class NodesTableError(Exception):
+  pass
+
+
+class NodesTable(object):
+  """Columnar nodes table.
+
+  Attributes:
+    widths: An array of node widths indexed by node id.
+    heights: An array of node heights indexed by node id.
+    xs: An array of node x offsets indexed by node id.
+    ys: An array of node y offsets indexed by node id.
+    selector_ids: An array of indices into selectors, indexed by node id.
+    selectors: A list of the distinct node selectors.
+  """
+
+  def __init__(self, widths, heights, xs, ys, selector_ids, selectors):
+    self.widths = widths
+    self.heights = heights
+    self.xs = xs
+    self.ys = ys
+    self.selector_ids = selector_ids
+    self.selectors = selectors
+
+  def __len__(self):
+    return len(self.selector_ids)
+
+  def __getitem__(self, nid):
+    """Returns the dictionary of values about the node with the given id."""
+    return {'w': self.widths[nid],
+            'h': self.heights[nid],
+            'x': self.xs[nid],
+            'y': self.ys[nid],
+            'p': self.selectors[self.selector_ids[nid]]}
+
+  def GetSize(self):
+    """Returns the approximate size of the table in memory, in bytes."""
+    size = len(self) * 5 * self.selector_ids.itemsize
+    for selector in self.selectors:
+      size += len(selector)
+    return size
+
+  def GetSelector(self, nid):
+    """Returns the selector of the node with the given id."""
+    return self.selectors[self.selector_ids[nid]]
+
+  def GetGeometry(self, nid):
+    """Returns the (w, h, x, y) tuple of the node with the given id."""
+    return (self.widths[nid], self.heights[nid], self.xs[nid], self.ys[nid])
+
+  def Serialize(self):
+    """Serializes the nodes table into a compressed binary string."""
+    selectors = simplejson.dumps(self.selectors)
+    if isinstance(selectors, unicode):
+      selectors = selectors.encode('utf-8')
+    header = struct.pack(_HEADER_FORMAT, _VERSION, len(self), len(selectors))
+    return zlib.compress(''.join([
+        header, self.widths.tostring(), self.heights.tostring(),
+        self.xs.tostring(), self.ys.tostring(), self.selector_ids.tostring(),
+        selectors]))
+
+
+def FromList(nodes):
+  """Builds a columnar nodes table from a decoded list of node dictionaries.
+
+  Args:
+    nodes: A list of dictionaries with 'w', 'h', 'x', 'y' and 'p' keys.
+
+  Returns:
+    A NodesTable object.
+  """
+  widths = array.array('i')
+  heights = array.array('i')
+  xs = array.array('i')
+  ys = array.array('i')
+  selector_ids = array.array('i')
+  selectors = []
+  selector_codes = {}
+  for node in nodes:
+    widths.append(int(node['w']))
+    heights.append(int(node['h']))
+    xs.append(int(node['x']))
+    ys.append(int(node['y']))
+    selector = node['p']
+    code = selector_codes.get(selector)
+    if code is None:
+      code = len(selectors)
+      selector_codes[selector] = code
+      selectors.append(selector)
+    selector_ids.append(code)
+  return NodesTable(widths, heights, xs, ys, selector_ids, selectors)
+
+
+def FromColumns(columns):
+  """Builds a nodes table from the columnar encoding sent by the client.
+
+  The encoding is a dictionary of lists indexed by node id:
+    'w', 'h', 'x', 'y': The node geometry.
+    'parent': The id of the parent node, or -1 for the nodes whose selector
+      does not start from another node's selector.
+    'step': The index in 'steps' of the last step of the node selector, or of
+      the whole selector if the parent is -1.
+  Parents always come before their children, so every selector is built from
+  its parent's selector in one pass, without materializing node dictionaries.
+
+  Args:
+    columns: A dictionary of the decoded columns.
+
+  Returns:
+    A NodesTable object.
+
+  Raises:
+    NodesTableError: The columns are not a valid columnar nodes table.
+  """
+  try:
+    parents = columns['parent']
+    step_ids = columns['step']
+    steps = columns['steps']
+    count = len(parents)
+    geometry = [array.array('i', columns[name]) for name in 'whxy']
+    if [len(column) for column in geometry + [step_ids]] != [count] * 5:
+      raise NodesTableError('The nodes table columns differ in length.')
+
+    selectors = []
+    for nid in range(count):
+      parent = parents[nid]
+      if parent < 0:
+        selectors.append(steps[step_ids[nid]])
+      elif parent < nid:
+        selectors.append(selectors[parent] + '>' + steps[step_ids[nid]])
+      else:
+        raise NodesTableError('Invalid parent of node %d: %d' % (nid, parent))
+  except (IndexError, KeyError, OverflowError, TypeError):
+    raise NodesTableError('Invalid columnar nodes table.')
+
+  # Selectors built from the parents are distinct, so they are not interned.
+  return NodesTable(geometry[0], geometry[1], geometry[2], geometry[3],
+                    array.array('i', range(count)), selectors)
+
+
+def FromData(data):
+  """Builds a nodes table from the decoded JSON sent by the client.
+
+  Args:
+    data: Either a list of node dictionaries or a dictionary of columns (see
+      FromList and FromColumns).
+
+  Returns:
+    A NodesTable object.
+
+  Raises:
+    NodesTableError: The data is not a valid columnar nodes table.
+  """
+  if isinstance(data, dict) and data.get('format') == COLUMNAR_FORMAT:
+    return FromColumns(data)
+  return FromList(data)
+
+
+def Deserialize(data):
+  """Loads a nodes table from the string produced by NodesTable.Serialize.
+
+  Args:
+    data: A compressed binary string.
+
+  Returns:
+    A NodesTable object.
+
+  Raises:
+    NodesTableError: The data is not a valid serialized nodes table.
+  """
+  try:
+    data = zlib.decompress(data)
+    version, count, selectors_size = struct.unpack(_HEADER_FORMAT,
+                                                   data[:_HEADER_SIZE])
+  except (zlib.error, struct.error):
+    raise NodesTableError('Invalid nodes table data.')
+  if version != _VERSION:
+    raise NodesTableError('Unsupported nodes table version: %d' % version)
+
+  columns = []
+  offset = _HEADER_SIZE
+  for _ in range(5):
+    column = array.array('i')
+    size = count * column.itemsize
+    column.fromstring(data[offset:offset + size])
+    if len(column) != count:
+      raise NodesTableError('Truncated nodes table data.')
+    columns.append(column)
+    offset += size
+
+  selectors_data = data[offset:offset + selectors_size]
+  if len(selectors_data) != selectors_size:
+    raise NodesTableError('Truncated nodes table data.')
+  try:
+    selectors = simplejson.loads(selectors_data.decode('utf-8'))
+  except ValueError:
+    raise NodesTableError('Invalid nodes table selectors.')
+  columns.append(selectors)
+  return NodesTable(*columns)
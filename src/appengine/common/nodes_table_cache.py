@@ -0,0 +1,152 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Two level cache of decoded nodes tables.
+
+Decoding a stored nodes table (base64, zlib and JSON) is expensive and the
+same table is needed by many requests while a page delta is computed and
+viewed. Decoded tables are kept as columnar NodesTable objects in a size-aware
+in-process LRU cache, backed by memcache holding their serialized form.
+"""
+
+
+
+import logging
+import threading
+
+from google.appengine.api import memcache
+
+from common import nodes_table
+
+
+MEMCACHE_KEY_PREFIX = 'nodes_table_'
+MEMCACHE_EXP_TIME_IN_SEC = 60*60
+
+# Memcache refuses values larger than this many bytes.
+MAX_MEMCACHE_VALUE_SIZE = 1000000
+
+# Budget of the in-process cache, in bytes of decoded tables.
+DEFAULT_MAX_LOCAL_SIZE = 16*1024*1024
+
+
+class LruCache(object):
+  """In-process least recently used cache, bounded by the size of its values.
+
+  Attributes:
+    max_size: The maximum total size of the cached values.
+  """
+
+  def __init__(self, max_size):
+    self.max_size = max_size
+    self._entries = {}
+    self._order = []
+    self._size = 0
+    self._lock = threading.Lock()
+
+  def GetSize(self):
+    """Returns the total size of the cached values."""
+    return self._size
+
+  def Get(self, key):
+    """Returns the cached value for the given key, or None."""
+    self._lock.acquire()
+    try:
+      entry = self._entries.get(key)
+      if entry is None:
+        return None
+      self._order.remove(key)
+      self._order.append(key)
+      return entry[0]
+    finally:
+      self._lock.release()
+
+  def Put(self, key, value, size):
+    """Adds a value to the cache, evicting least recently used values.
+
+    Values larger than the whole cache are not stored.
+
+    Args:
+      key: A string key.
+      value: The value to cache.
+      size: The size of the value.
+    """
+    self._lock.acquire()
+    try:
+      if key in self._entries:
+        self._size -= self._entries.pop(key)[1]
+        self._order.remove(key)
+      if size > self.max_size:
+        return
+      while self._order and self._size + size > self.max_size:
+        evicted = self._order.pop(0)
+        self._size -= self._entries.pop(evicted)[1]
+      self._entries[key] = (value, size)
+      self._order.append(key)
+      self._size += size
+    finally:
+      self._lock.release()
+
+  def Clear(self):
+    """Removes all values from the cache."""
+    self._lock.acquire()
+    try:
+      self._entries = {}
+      self._order = []
+      self._size = 0
+    finally:
+      self._lock.release()
+
+
+_local_cache = LruCache(DEFAULT_MAX_LOCAL_SIZE)
+
+
+def Get(key, decode_function):
+  """Returns the decoded nodes table for the given key.
+
+  Looks the table up in the in-process cache first, then in memcache, and
+  only calls decode_function if it is in neither.
+
+  Args:
+    key: A string uniquely identifying the nodes table (e.g. PageData key).
+    decode_function: A function returning the decoded JSON nodes table, in
+      any of the encodings understood by nodes_table.FromData.
+
+  Returns:
+    A nodes_table.NodesTable object.
+  """
+  table = _local_cache.Get(key)
+  if table is not None:
+    return table
+
+  memcache_key = MEMCACHE_KEY_PREFIX + key
+  data = memcache.get(memcache_key)
+  if data is not None:
+    try:
+      table = nodes_table.Deserialize(data)
+    except nodes_table.NodesTableError:
+      logging.warning('Ignoring invalid cached nodes table: %s', key)
+      table = None
+
+  if table is None:
+    table = nodes_table.FromData(decode_function())
+    data = table.Serialize()
+    if len(data) <= MAX_MEMCACHE_VALUE_SIZE:
+      memcache.set(memcache_key, data, MEMCACHE_EXP_TIME_IN_SEC)
+
+  _local_cache.Put(key, table, table.GetSize())
+  return table
+
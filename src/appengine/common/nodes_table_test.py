@@ -0,0 +1,96 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Tests for nodes_table."""
+
+
+
+import unittest
+
+from common import nodes_table
+
+
+class NodesTableTest(unittest.TestCase):
+
+  def setUp(self):
+    self.nodes = [{'w': 10, 'h': 20, 'x': 0, 'y': 0, 'p': 'BODY'},
+                  {'w': 5, 'h': 5, 'x': 1, 'y': 2, 'p': u'BODY>P:~(1)'},
+                  {'w': 5, 'h': 5, 'x': 3, 'y': 4, 'p': u'BODY>P:~(1)'}]
+
+  def testFromList(self):
+    table = nodes_table.FromList(self.nodes)
+    self.assertEqual(3, len(table))
+    self.assertEqual(2, len(table.selectors))
+    for nid in range(len(self.nodes)):
+      self.assertEqual(self.nodes[nid], table[nid])
+    self.assertEqual('BODY>P:~(1)', table.GetSelector(2))
+    self.assertEqual((5, 5, 3, 4), table.GetGeometry(2))
+    self.assertRaises(IndexError, table.__getitem__, 3)
+
+  def testFromColumns(self):
+    columns = {'format': nodes_table.COLUMNAR_FORMAT,
+               'w': [10, 5, 5, 8], 'h': [20, 5, 5, 8],
+               'x': [0, 1, 3, 0], 'y': [0, 2, 4, 0],
+               'parent': [-1, 0, 1, -1], 'step': [0, 1, 2, 3],
+               'steps': ['BODY', 'P:~(1)', 'A:~(2)', '#document>HTML:~(1)']}
+    table = nodes_table.FromData(columns)
+    self.assertEqual(4, len(table))
+    self.assertEqual(self.nodes[0], table[0])
+    self.assertEqual(self.nodes[1], table[1])
+    self.assertEqual('BODY>P:~(1)>A:~(2)', table.GetSelector(2))
+    self.assertEqual('#document>HTML:~(1)', table.GetSelector(3))
+    self.assertEqual((5, 5, 3, 4), table.GetGeometry(2))
+
+    table = nodes_table.Deserialize(table.Serialize())
+    self.assertEqual('BODY>P:~(1)>A:~(2)', table.GetSelector(2))
+
+  def testFromColumns_Invalid(self):
+    columns = {'w': [1, 1], 'h': [1, 1], 'x': [1, 1], 'y': [1, 1],
+               'parent': [-1, 0], 'step': [0, 0], 'steps': ['BODY']}
+    self.assertEqual(2, len(nodes_table.FromColumns(columns)))
+
+    for name, value in [('w', [1]), ('parent', [1, 0]), ('step', [0, 1]),
+                        ('x', [1, 'a'])]:
+      invalid = dict(columns)
+      invalid[name] = value
+      self.assertRaises(nodes_table.NodesTableError,
+                        nodes_table.FromColumns, invalid)
+
+  def testFromData_List(self):
+    table = nodes_table.FromData(self.nodes)
+    self.assertEqual(self.nodes[2], table[2])
+
+  def testSerialize(self):
+    table = nodes_table.Deserialize(
+        nodes_table.FromList(self.nodes).Serialize())
+    self.assertEqual(self.nodes, [table[nid] for nid in range(len(table))])
+
+  def testSerialize_Empty(self):
+    table = nodes_table.Deserialize(nodes_table.FromList([]).Serialize())
+    self.assertEqual(0, len(table))
+
+  def testDeserialize_Invalid(self):
+    self.assertRaises(nodes_table.NodesTableError,
+                      nodes_table.Deserialize, 'garbage')
+
+
+def main():
+  unittest.main()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,78 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Progress and completion estimates of test runs from their status counts."""
+
+
+
+import datetime
+
+from common import enum
+
+
+# The statuses of the work items that are still to be processed.
+REMAINING_STATUSES = [enum.CASE_STATUS.QUEUED, enum.CASE_STATUS.IN_PROGRESS]
+
+SECONDS_PER_HOUR = 60 * 60
+
+
+def _TotalSeconds(delta):
+  return delta.days * 24 * SECONDS_PER_HOUR + delta.seconds + (
+      delta.microseconds / 1000000.0)
+
+
+def EstimateProgress(counts, start_time, now):
+  """Return the progress of the work items of a test run.
+
+  The throughput is the number of work items processed per hour since the
+  start of the run, and the ETA assumes the remaining work items are processed
+  at the same rate.
+
+  Args:
+    counts: A list of the numbers of work items indexed by the
+      enum.CASE_STATUS values.
+    start_time: A datetime.datetime object representing the time at which the
+      work items were created.
+    now: A datetime.datetime object representing the current time.
+
+  Returns:
+    A dictionary with the total, done and remaining numbers of work items, the
+    throughput, the ETA as a string (None while nothing was processed) and the
+    number of work items in each status, by lowercase status name.
+  """
+  remaining = sum([counts[status] for status in REMAINING_STATUSES])
+  done = sum(counts) - remaining
+  elapsed = _TotalSeconds(now - start_time)
+
+  throughput = 0.0
+  if elapsed > 0:
+    throughput = done * SECONDS_PER_HOUR / elapsed
+
+  eta = None
+  if not remaining:
+    eta = now
+  elif throughput:
+    eta = now + datetime.timedelta(hours=remaining / throughput)
+
+  progress = {'total': sum(counts),
+              'done': done,
+              'remaining': remaining,
+              'throughput': round(throughput, 1),
+              'eta': eta and eta.isoformat().replace('T', ' ')}
+  for status, count in enumerate(counts):
+    progress[enum.CASE_STATUS.LookupKey(status).lower()] = count
+  return progress
@@ -0,0 +1,83 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Tests for run_estimate."""
+
+
+
+import datetime
+import unittest
+
+from common import enum
+from common import run_estimate
+
+
+class RunEstimateTest(unittest.TestCase):
+
+  def setUp(self):
+    self.start = datetime.datetime(2011, 8, 10, 12, 0, 0)
+    self.counts = [0] * len(enum.CASE_STATUS.ListEnumValues())
+
+  def testEstimateProgress(self):
+    self.counts[enum.CASE_STATUS.QUEUED] = 50
+    self.counts[enum.CASE_STATUS.IN_PROGRESS] = 10
+    self.counts[enum.CASE_STATUS.FINISHED] = 30
+    self.counts[enum.CASE_STATUS.TIMEOUT_ERROR] = 10
+    now = self.start + datetime.timedelta(hours=2)
+
+    progress = run_estimate.EstimateProgress(self.counts, self.start, now)
+    self.assertEqual(100, progress['total'])
+    self.assertEqual(40, progress['done'])
+    self.assertEqual(60, progress['remaining'])
+    self.assertEqual(20.0, progress['throughput'])
+    # 60 remaining work items at 20 per hour take 3 more hours.
+    self.assertEqual('2011-08-10 17:00:00', progress['eta'])
+    self.assertEqual(50, progress['queued'])
+    self.assertEqual(10, progress['timeout_error'])
+
+  def testEstimateProgress_NothingDone(self):
+    self.counts[enum.CASE_STATUS.QUEUED] = 10
+    now = self.start + datetime.timedelta(minutes=5)
+
+    progress = run_estimate.EstimateProgress(self.counts, self.start, now)
+    self.assertEqual(0.0, progress['throughput'])
+    self.assertEqual(None, progress['eta'])
+
+  def testEstimateProgress_Finished(self):
+    self.counts[enum.CASE_STATUS.FINISHED] = 10
+    now = self.start + datetime.timedelta(hours=1)
+
+    progress = run_estimate.EstimateProgress(self.counts, self.start, now)
+    self.assertEqual(0, progress['remaining'])
+    self.assertEqual('2011-08-10 13:00:00', progress['eta'])
+
+  def testEstimateProgress_NoElapsedTime(self):
+    self.counts[enum.CASE_STATUS.FINISHED] = 1
+    self.counts[enum.CASE_STATUS.QUEUED] = 1
+
+    progress = run_estimate.EstimateProgress(self.counts, self.start,
+                                             self.start)
+    self.assertEqual(0.0, progress['throughput'])
+    self.assertEqual(None, progress['eta'])
+
+
+def main():
+  unittest.main()
+
+
+if __name__ == '__main__':
+  main()
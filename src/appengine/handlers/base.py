@@ -24,6 +24,7 @@ validation of request parameters.
 
 
 
+import logging
 import os
 import urllib2
 
@@ -72,7 +73,7 @@ class BaseHandler(webapp.RequestHandler):
 
   If any of the validations fails, one of the exceptions defined in this module
   is raised; all of which inherits from the Error class, also defined in this
-  module.
+  module. The request is then answered with the status code of the exception.
 
   The most basic type of retrieval is to retrieve an optional str
   argument from the request. This is accomplished by calling
@@ -151,6 +152,22 @@ class BaseHandler(webapp.RequestHandler):
     except ValueError:
       raise InvalidIntValueError(parameter_name, str_value)
 
+  def handle_exception(self, exception, debug_mode):
+    """Responds with the status of the validation errors, e.g. 400.
+
+    Other exceptions are handled by webapp.RequestHandler.
+
+    Args:
+      exception: The exception raised by the handler method.
+      debug_mode: True if the web application is running in debug mode.
+    """
+    if isinstance(exception, Error):
+      logging.warning(exception.msg)
+      self.error(exception.code)
+      self.response.out.write(exception.msg)
+      return
+    webapp.RequestHandler.handle_exception(self, exception, debug_mode)
+
   def RenderTemplate(self, name, template_args):
     """Renders the specified django template.
 
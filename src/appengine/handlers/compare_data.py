@@ -31,6 +31,10 @@ from google.appengine.ext import db
 from google.appengine.ext import webapp
 from google.appengine.ext.webapp.util import run_wsgi_app
 
+from common import content_hash
+from common import delta_regions
+from common import layout_compare
+from handlers import base
 from models import data_list
 from models import page_data
 from models import page_delta
@@ -39,10 +43,36 @@ from models import screenshot
 
 COMPUTE_DELTA_URL = '/compute_delta'
 COMPUTE_DELTA_BY_PART_URL = '/compute_delta_by_part'
+COMPUTE_DELTA_STREAM_URL = '/compute_delta_stream'
 COMPUTE_SCORE_URL = '/compute_score'
 
-
-class ComputeDeltaHandler(webapp.RequestHandler):
+# Engine used to compare the layout table parts, one of layout_compare.ENGINES.
+# It can be overridden per delta with the 'engine' request parameter. NumPy is
+# not available on the App Engine runtime, so 'numpy' falls back to 'runs'.
+DEFAULT_COMPARE_ENGINE = layout_compare.ENGINE_RUNS
+
+# Compare modes. 'parts' adds one task per layout table part, 'stream' compares
+# all the parts in a single task. It can be overridden per delta with the
+# 'mode' request parameter.
+COMPARE_MODE_PARTS = 'parts'
+COMPARE_MODE_STREAM = 'stream'
+DEFAULT_COMPARE_MODE = COMPARE_MODE_PARTS
+
+# Comparators. 'pixels' compares the layout tables, 'geometry' first computes
+# an approximate score from the nodes tables and only compares the layout
+# tables if it is below the threshold. Both can be overridden per delta with
+# the 'comparator' and 'threshold' request parameters.
+COMPARATOR_PIXELS = 'pixels'
+COMPARATOR_GEOMETRY = 'geometry'
+DEFAULT_COMPARATOR = COMPARATOR_PIXELS
+DEFAULT_APPROX_SCORE_THRESHOLD = 99.0
+
+# Number of parts fetched and compared before their results are stored in
+# 'stream' mode. Every part has a delta and a dynamic content entry.
+STREAM_BATCH_NUM_PARTS = data_list.PUT_BATCH_SIZE / 2
+
+
+class ComputeDeltaHandler(base.BaseHandler):
   """Handler for computing a page delta."""
 
   # Disable 'Invalid method name' lint error.
@@ -50,13 +80,37 @@ class ComputeDeltaHandler(webapp.RequestHandler):
   def get(self):
     """Compares a page delta based on the given delta key."""
     delta_key = self.request.get('delta')
+    engine = self.request.get('engine', DEFAULT_COMPARE_ENGINE)
+    mode = self.request.get('mode', DEFAULT_COMPARE_MODE)
+    comparator = self.request.get('comparator', DEFAULT_COMPARATOR)
+    threshold = self.GetOptionalParameter('threshold',
+                                          DEFAULT_APPROX_SCORE_THRESHOLD)
+    try:
+      threshold = float(threshold)
+    except ValueError:
+      raise base.InvalidParameterValueError('threshold', threshold)
+    # Scores are percentages. NaN fails both comparisons.
+    if not 0 <= threshold <= 100:
+      raise base.InvalidParameterValueError('threshold', threshold)
     if delta_key:
       delta = db.get(db.Key(delta_key))
     else:
       delta = self.FindPairToCompare()
 
+    if delta and self.CompleteIdenticalDelta(delta):
+      self.response.out.write('Identical captures. key=%s' % str(delta.key()))
+      return
+
+    if delta and comparator == COMPARATOR_GEOMETRY:
+      if delta.ComputeApproxScore(threshold):
+        delta.test_data.DeleteLayoutTable()
+        delta.CreateIndices()
+        self.response.out.write('Approximate score %.2f. key=%s' %
+                                (delta.score, str(delta.key())))
+        return
+
     if delta:
-      self.AddCompareTasksToQueue(delta)
+      self.AddCompareTasksToQueue(delta, engine=engine, mode=mode)
     else:
       self.response.out.write('No data to compare.')
 
@@ -133,21 +187,70 @@ class ComputeDeltaHandler(webapp.RequestHandler):
 
     return None
 
-  def AddCompareTasksToQueue(self, delta):
+  def CompleteIdenticalDelta(self, delta):
+    """Completes a delta with a perfect score if both captures are identical.
+
+    The captures are identical if the fingerprints of their nodes tables and
+    of all their layout table parts match, and neither has dynamic content.
+    The fingerprints of the parts are kept with the page data, so the parts
+    are fetched at most once per page data.
+
+    Args:
+      delta: A PageDelta object.
+
+    Returns:
+      True if the delta was completed.
+    """
+    if (not _HasIdenticalNodesTables(delta) or
+        not content_hash.AllEqual(delta.test_data.GetLayoutHashes(),
+                                  delta.ref_data.GetLayoutHashes(),
+                                  data_list.NUM_ENTRIES)):
+      return False
+
+    dynamic_content_table_test, dynamic_content_table_ref = (
+        _LoadDynamicContentTables(delta))
+    if dynamic_content_table_test or dynamic_content_table_ref:
+      return False
+
+    delta.score = 100.0
+    delta.put()
+    delta.test_data.DeleteLayoutTable()
+    delta.CreateIndices()
+    delta.CalculateElemCount()
+    return True
+
+  def AddCompareTasksToQueue(self, delta, engine=DEFAULT_COMPARE_ENGINE,
+                             mode=DEFAULT_COMPARE_MODE):
     """Adds a task to the task queue to compute the given delta.
 
-    Each task computes one part of the layout.
+    In 'parts' mode each task computes one part of the layout, in 'stream'
+    mode a single task computes all of them. The node index of the delta is
+    built before the tasks are added so that all of them can share it.
 
     Args:
       delta: A PageDelta object to add to the task queue.
+      engine: An optional string naming the compare engine to use, one of
+        layout_compare.ENGINES.
+      mode: An optional string naming the compare mode, COMPARE_MODE_PARTS or
+        COMPARE_MODE_STREAM.
     """
+    delta.GetNodeIndex()
     delta_key = str(delta.key())
 
-    task_url = '/compute_delta_by_part'
+    if mode == COMPARE_MODE_STREAM:
+      task_params = {'deltaKey': delta_key,
+                     'engine': engine}
+      taskqueue.add(url=COMPUTE_DELTA_STREAM_URL, params=task_params,
+                    method='GET')
+      self.response.out.write('Task added. key=%s' % delta_key)
+      return
+
+    task_url = COMPUTE_DELTA_BY_PART_URL
 
     for i in range(data_list.NUM_ENTRIES):
       task_params = {'deltaKey': delta_key,
-                     'part': i}
+                     'part': i,
+                     'engine': engine}
       taskqueue.add(url=task_url, params=task_params, method='GET')
 
     self.response.out.write('Tasks added. key=%s' % delta_key)
@@ -177,77 +280,186 @@ class ComputeDeltaByPart(webapp.RequestHandler):
     """Compares a page delta by part based on the given delta key and part."""
     delta_key = self.request.get('deltaKey')
     part = int(self.request.get('part'))
+    engine = self.request.get('engine', DEFAULT_COMPARE_ENGINE)
     delta = db.get(db.Key(delta_key))
 
     if delta.test_data.layout_table:
-      dl = []
-      ignoredContent = []
-
-      nt1 = delta.test_data.GetNodesTable()
-      nt2 = delta.ref_data.GetNodesTable()
-
-      # Let's initialize dynamicContentTable.
-      dynamic_content_table_test = None
-      dynamic_content_table_ref = None
-
-      if delta.test_data.dynamic_content_table:
-        dynamic_content_table_test = simplejson.loads(
-            delta.test_data.dynamic_content_table)
-      if delta.ref_data.dynamic_content_table:
-        dynamic_content_table_ref = simplejson.loads(
-            delta.ref_data.dynamic_content_table)
-
-      rows1 = delta.test_data.layout_table.GetEntryData(part)
-      rows2 = delta.ref_data.layout_table.GetEntryData(part)
-
-      part_length = int(math.ceil(delta.test_data.height /
-                                  float(data_list.NUM_ENTRIES)))
-
-      for i in range(min(len(rows1), len(rows2))):
-        for j in range(min(len(rows1[i]), len(rows2[i]))):
-          try:
-            nid1 = int(rows1[i][j])
-            nid2 = int(rows2[i][j])
-          except ValueError:
-            nid1 = int(rows1[i][j].split()[0])
-            nid2 = int(rows2[i][j].split()[0])
-
-          if nid1 < 0 or nid2 < 0:
-            continue
-
-          # If element is marked as dynamic content then add it to
-          # ignoredContent and continue.
-          if ((dynamic_content_table_test and
-               (nid1 in dynamic_content_table_test)) or
-              (dynamic_content_table_ref and
-               (nid2 in dynamic_content_table_ref))):
-
-            x = j
-            y = i + part * part_length
-            ignoredContent.append((x, y, nid1, nid2))
-            continue
-
-          try:
-            node1 = nt1[nid1]
-            node2 = nt2[nid2]
-          except IndexError:
-            continue
-
-          if not AreNodesSame(node1, node2):
-            x = j
-            y = i + part * part_length
-            dl.append((x, y, nid1, nid2))
-
-      delta.delta.AddEntry(part, dl)
-      delta.dynamic_content.AddEntry(part, ignoredContent, True)
+      dynamic_content_table_test, dynamic_content_table_ref = (
+          _LoadDynamicContentTables(delta))
+
+      entry1 = delta.test_data.layout_table.GetEntry(part)
+      entry2 = delta.ref_data.layout_table.GetEntry(part)
+
+      if _IsIdenticalPart(delta, entry1, entry2, dynamic_content_table_test,
+                          dynamic_content_table_ref):
+        dl, ignoredContent = [], []
+      else:
+        rows1 = []
+        rows2 = []
+        if entry1:
+          rows1 = entry1.GetRuns()
+        if entry2:
+          rows2 = entry2.GetRuns()
+
+        part_length = int(math.ceil(delta.test_data.height /
+                                    float(data_list.NUM_ENTRIES)))
+
+        compare = layout_compare.GetEngine(engine)
+        dl, ignoredContent = compare(
+            rows1, rows2, delta.GetNodeIndex(), dynamic_content_table_test,
+            dynamic_content_table_ref, part * part_length)
+
+      db.put(_CreateDeltaEntries(delta, part, dl, ignoredContent))
 
     if delta.delta.EntriesReady():
       task_params = {'deltaKey': delta_key}
-      taskqueue.add(url='/compute_score', params=task_params, method='GET')
+      taskqueue.add(url=COMPUTE_SCORE_URL, params=task_params, method='GET')
     else:
       self.response.out.write('Tasks %d finished.' % part)
 
 
+def _LoadDynamicContentTables(delta):
+  """Loads the dynamic content tables of the test and ref data of a delta.
+
+  Args:
+    delta: A PageDelta object.
+
+  Returns:
+    A (test, ref) tuple of sets of dynamic content node ids, each None if the
+    page data has no dynamic content table.
+  """
+  dynamic_content_table_test = None
+  dynamic_content_table_ref = None
+  if delta.test_data.dynamic_content_table:
+    dynamic_content_table_test = set(simplejson.loads(
+        delta.test_data.dynamic_content_table))
+  if delta.ref_data.dynamic_content_table:
+    dynamic_content_table_ref = set(simplejson.loads(
+        delta.ref_data.dynamic_content_table))
+  return dynamic_content_table_test, dynamic_content_table_ref
+
+
+def _HasIdenticalNodesTables(delta):
+  """Checks the fingerprints of the nodes tables of a delta."""
+  test_hash = delta.test_data.nodes_table_hash
+  return bool(test_hash) and test_hash == delta.ref_data.nodes_table_hash
+
+
+def _IsIdenticalPart(delta, entry1, entry2, dynamic1, dynamic2):
+  """Checks if a layout table part can be skipped using fingerprints.
+
+  An identical part of pages with identical nodes tables has no differences.
+  Parts of pages with dynamic content are never skipped, since the dynamic
+  content they cover still has to be recorded.
+
+  Args:
+    delta: A PageDelta object.
+    entry1: The DataListEntry of the part from the test page, or None.
+    entry2: The DataListEntry of the part from the reference page, or None.
+    dynamic1: A set of dynamic content node ids of the test page, or None.
+    dynamic2: A set of dynamic content node ids of the reference page, or None.
+
+  Returns:
+    True if the part has neither differences nor dynamic content.
+  """
+  if dynamic1 or dynamic2 or not entry1 or not entry2:
+    return False
+  return (bool(entry1.content_hash) and
+          entry1.content_hash == entry2.content_hash and
+          _HasIdenticalNodesTables(delta))
+
+
+def _CreateDeltaEntries(delta, part, dl, ignoredContent):
+  """Creates the delta and dynamic content entries of one part.
+
+  The spans reported by the compare engine are stored as rectangles, with the
+  number of pixels they cover as the entry length.
+
+  Args:
+    delta: A PageDelta object.
+    part: The index of the part.
+    dl: A list of differing (x, y, length, nid1, nid2) spans.
+    ignoredContent: A list of dynamic content (x, y, length, nid1, nid2) spans.
+
+  Returns:
+    A list of the two unsaved DataListEntry entities.
+  """
+  rects = delta_regions.MergeSpans(dl)
+  ignored_rects = delta_regions.MergeSpans(ignoredContent)
+  return [
+      delta.delta.CreateEntry(
+          part, rects, content_format=delta_regions.DELTA_FORMAT_RECTS,
+          length=delta_regions.GetPixelCount(rects)),
+      delta.dynamic_content.CreateEntry(
+          part, ignored_rects, True,
+          content_format=delta_regions.DELTA_FORMAT_RECTS,
+          length=delta_regions.GetPixelCount(ignored_rects))]
+
+
+class ComputeDeltaStream(webapp.RequestHandler):
+  """Handler for computing a whole page delta in a single task.
+
+  The parts are processed in batches: the layout table parts of a batch are
+  fetched, compared one after the other and their results are stored with one
+  put before the next batch is fetched. The 'python' runtime runs a request in
+  a single thread and the compare engines are CPU-bound, so the parts are not
+  compared in parallel. The score task is added once all the parts are stored.
+  """
+
+  # Disable 'Invalid method name' lint error.
+  # pylint: disable-msg=C6409
+  def get(self):
+    """Compares all the parts of a page delta based on the given delta key."""
+    delta_key = self.request.get('deltaKey')
+    engine = self.request.get('engine', DEFAULT_COMPARE_ENGINE)
+    delta = db.get(db.Key(delta_key))
+
+    if not delta.test_data.layout_table:
+      self.response.out.write('No layout table to compare.')
+      return
+
+    index = delta.GetNodeIndex()
+
+    dynamic_content_table_test, dynamic_content_table_ref = (
+        _LoadDynamicContentTables(delta))
+
+    part_length = int(math.ceil(delta.test_data.height /
+                                float(data_list.NUM_ENTRIES)))
+    compare = layout_compare.GetEngine(engine)
+
+    def ComparePart(part, entry1, entry2):
+      if _IsIdenticalPart(delta, entry1, entry2, dynamic_content_table_test,
+                          dynamic_content_table_ref):
+        return [], []
+      rows1 = []
+      rows2 = []
+      if entry1:
+        rows1 = entry1.GetRuns()
+      if entry2:
+        rows2 = entry2.GetRuns()
+      return compare(rows1, rows2, index, dynamic_content_table_test,
+                     dynamic_content_table_ref, part * part_length)
+
+    # Parts are fetched, compared and stored in batches so that only the
+    # layout tables and the results of a few parts are held in memory at any
+    # time.
+    for start in range(0, data_list.NUM_ENTRIES, STREAM_BATCH_NUM_PARTS):
+      parts = range(start, min(start + STREAM_BATCH_NUM_PARTS,
+                               data_list.NUM_ENTRIES))
+      entries1 = delta.test_data.layout_table.GetEntries(parts)
+      entries2 = delta.ref_data.layout_table.GetEntries(parts)
+      entries = []
+      for part in parts:
+        dl, ignoredContent = ComparePart(part, entries1.get(part),
+                                         entries2.get(part))
+        entries.extend(_CreateDeltaEntries(delta, part, dl, ignoredContent))
+      data_list.PutEntries(entries)
+
+    task_params = {'deltaKey': delta_key}
+    taskqueue.add(url=COMPUTE_SCORE_URL, params=task_params, method='GET')
+    self.response.out.write('Tasks added. key=%s' % delta_key)
+
+
 class ComputeScore(webapp.RequestHandler):
   """Computes the score of a given delta after all parts are finished.
 
@@ -269,30 +481,10 @@ class ComputeScore(webapp.RequestHandler):
     self.response.out.write('Done.')
 
 
-def AreNodesSame(node_data_1, node_data_2):
-  """Compares if two nodes are the same.
-
-  Currently using a very basic algorithm: assume the nodes are the same if
-  either their XPaths are the same or their dimension/positions are the same.
-
-  Args:
-    node_data_1: A dictionary of values about a DOM node.
-    node_data_2: A dictionary of values about a DOM node.
-
-  Returns:
-    A boolean indicating whether the two nodes should be considered equivalent.
-  """
-
-  return (node_data_1['p'].lower() == node_data_2['p'].lower() or
-          (node_data_1['w'] == node_data_2['w'] and
-           node_data_1['h'] == node_data_2['h'] and
-           node_data_1['x'] == node_data_2['x'] and
-           node_data_1['y'] == node_data_2['y']))
-
-
 application = webapp.WSGIApplication(
     [(COMPUTE_DELTA_URL, ComputeDeltaHandler),
      (COMPUTE_DELTA_BY_PART_URL, ComputeDeltaByPart),
+     (COMPUTE_DELTA_STREAM_URL, ComputeDeltaStream),
      (COMPUTE_SCORE_URL, ComputeScore)],
     debug=True)
 
@@ -51,6 +51,8 @@ class GetScreenshotImage(webapp.RequestHandler):
   URL Params:
     key: A string representing the key for the Screenshot model containing the
       image to load.
+    thumbnail: An optional flag to load the thumbnail of the image instead, if
+      the screenshot has one.
 
   Returns:
     The screenshot image to display.
@@ -67,7 +69,18 @@ class GetScreenshotImage(webapp.RequestHandler):
       screenshot_image = None
 
     if screenshot_image:
-      if screenshot_image.src_data:
+      if self.request.get('thumbnail') and screenshot_image.thumbnail:
+        self.response.headers['Content-Type'] = str(
+            screenshot_image.thumbnail_mime_type)
+        self.response.headers['Cache-Control'] = 'max-age=3600, public'
+        self.response.out.write(screenshot_image.thumbnail)
+        return
+      elif screenshot_image.src_data and screenshot_image.mime_type:
+        self.response.headers['Content-Type'] = str(screenshot_image.mime_type)
+        self.response.headers['Cache-Control'] = 'max-age=3600, public'
+        self.response.out.write(screenshot_image.src_data)
+        return
+      elif screenshot_image.src_data:
         self.response.headers['Content-Type'] = 'image/jpeg'
         self.response.headers['Cache-Control'] = 'max-age=3600, public'
         self.response.headers['Content-Encoding'] = 'gzip'
@@ -159,15 +172,16 @@ class GetDeltaList(base.BaseHandler):
       i = 0
     i = int(i)
 
-    delta_list_raw = pdelta.delta.GetEntryData(i)
+    delta_list_raw = pdelta.delta.GetEntryRects(i)
 
     test_nodes_table = pdelta.test_data.GetNodesTable()
     ref_nodes_table = pdelta.ref_data.GetNodesTable()
 
+    # Each item is an (x, y, width, height, test node, ref node) rectangle.
     delta_list = []
     for d in delta_list_raw:
-      delta_list.append((d[0], d[1],
-                         test_nodes_table[d[2]], ref_nodes_table[d[3]]))
+      delta_list.append((d[0], d[1], d[2], d[3],
+                         test_nodes_table[d[4]], ref_nodes_table[d[5]]))
 
     if self.request.get('deltaonly'):
       self.response.headers['Cache-Control'] = 'max-age=3600, public'
@@ -202,14 +216,15 @@ class GetDynamicContentList(base.BaseHandler):
     i = int(i)
     dynamic_content_list = []
     if pdelta.dynamic_content:
-      dynamic_content_list_raw = pdelta.dynamic_content.GetEntryData(i)
+      dynamic_content_list_raw = pdelta.dynamic_content.GetEntryRects(i)
 
       test_nodes_table = pdelta.test_data.GetNodesTable()
       ref_nodes_table = pdelta.ref_data.GetNodesTable()
 
       for d in dynamic_content_list_raw:
-        dynamic_content_list.append((d[0], d[1], test_nodes_table[d[2]],
-                                     ref_nodes_table[d[3]]))
+        dynamic_content_list.append((d[0], d[1], d[2], d[3],
+                                     test_nodes_table[d[4]],
+                                     ref_nodes_table[d[5]]))
 
     self.response.headers['Cache-Control'] = 'max-age=3600, public'
     self.response.headers['Content-Encoding'] = 'gzip'
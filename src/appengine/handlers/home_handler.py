@@ -38,6 +38,7 @@ from handlers import base
 from models import page_data
 from models import page_delta
 from models import test_suite
+from models import url
 
 
 CLEANUP_URL = '/clean'
@@ -72,8 +73,12 @@ class Delete(base.BaseHandler):
     # Let's delete all associated/related data.
     if hasattr(data, 'DeleteData'):
       data.DeleteData()
-    # Now, let's delete the data itself.
-    db.delete(data)
+    # Now, let's delete the data itself. Deleted URLs are removed from the URL
+    # counter.
+    if isinstance(data, url.Url):
+      url.DeleteUrl(data.key())
+    else:
+      db.delete(data)
     last_url = self.request.get('lastUrl')
     if last_url:
       self.redirect(last_url)
@@ -24,31 +24,40 @@ launch new machines.
 
 
 
+import datetime
 import logging
 
 from common import ec2_manager
 from common import enum
-from common import gql_util
 
+from google.appengine.api import taskqueue
 from google.appengine.ext import db
+from google.appengine.ext import deferred
 
 from models import client_machine
 from models import run_log
-from models import url
-
-# Disable 'unused import' lint warning.
-# pylint: disable-msg=W0611
+from models import run_progress
 from models import url_config
 
 import simplejson
 
 
-# This count is used to fetch amount of url configs associated with a url.
-URL_CONFIG_FETCH_COUNT = 1000
+# The number of url configs each task creating RunLog entries handles.
+URL_CONFIG_BATCH_SIZE = 100
+# The bounds of the batch puts of RunLog entries, in entities and in estimated
+# bytes (below the 1MB limit of a datastore call).
+RUN_LOG_PUT_BATCH_SIZE = 500
+RUN_LOG_PUT_MAX_BYTES = 800 * 1024
+# The estimated size of a RunLog entity without its url and client info.
+RUN_LOG_OVERHEAD_BYTES = 512
 DEFAULT_PRIORITY = 0
 DEFAULT_RETRY_COUNT = 3
 DEFAULT_INSTANCE_SIZE = ec2_manager.HIGH_CPU_MEDIUM
 
+# The number of browser workers each instance runs concurrently. A high-CPU
+# medium instance has two cores.
+WORKERS_PER_INSTANCE = 2
+
 # Default task countdown time for deferred tasks in seconds.
 DEFAULT_COUNTDOWN = 30
 DEFAULT_QUEUE = 'ec2'
@@ -59,15 +68,54 @@ TERMINATE_INSTANCES = False
 OS_TO_USER_DATA = {enum.OS.WINDOWS: 'win', enum.OS.LINUX: 'linux',
                    enum.OS.MAC: 'mac'}
 
+# The number of expired leases processed per task.
+SWEEP_BATCH_SIZE = 100
+
+# The number of RunLogs of an expired test run processed per task.
+EXPIRE_BATCH_SIZE = 100
+
 
-def CreateRunLogEntries(offset, limit, token, client_info, creation_time,
-                        browsers, browser_versions, operating_systems, user):
+def _PutRunLogs(run_logs):
+  """Store RunLog entities with batch puts bounded in count and size.
+
+  Args:
+    run_logs: A list of RunLog entities.
+  """
+  batch = []
+  batch_bytes = 0
+  for entry in run_logs:
+    entry_bytes = (RUN_LOG_OVERHEAD_BYTES + len(entry.url) +
+                   len(entry.client_info or ''))
+    if batch and (len(batch) >= RUN_LOG_PUT_BATCH_SIZE or
+                  batch_bytes + entry_bytes > RUN_LOG_PUT_MAX_BYTES):
+      db.put(batch)
+      batch = []
+      batch_bytes = 0
+    batch.append(entry)
+    batch_bytes += entry_bytes
+  if batch:
+    db.put(batch)
+
+
+def _GetRunLogKeyName(token, config_key, os, browser, browser_version):
+  """Return the key name of the RunLog of a test run for a url config."""
+  return '%s_%s_%d_%d_%s' % (token, config_key.id_or_name(), os, browser,
+                             browser_version)
+
+
+def CreateRunLogEntries(cursor, token, client_info, creation_time, browsers,
+                        browser_versions, operating_systems, user, batch=0):
   """Create RunLog entries for the given parameters and Url selection.
 
+  Every task handles one batch of the url configs, and starts the task of the
+  next batch once its RunLogs are stored, so a run is created by a chain of
+  tasks. A retried task stores the same RunLogs again under the same key
+  names, without overwriting the ones that exist already, and the next task
+  is named after the batch number, so it is queued once.
+
   Args:
-    offset: An integer representing the offset into the Url model to start
-      fetching from.
-    limit: An integer representing the  maximum number of Url models to fetch.
+    cursor: A string representing the query cursor of the url configs to
+      start from, or None to start from the beginning.
     token: A string representing the token for this run.
     client_info: A string representing client info for this run.
     creation_time: A datetime.datetime object representing the creation time
@@ -76,40 +124,81 @@ def CreateRunLogEntries(offset, limit, token, client_info, creation_time,
     browser_versions: A list of strings representing browser versions to use.
     operating_systems: A list of integers that correspond to enum.OS values.
     user: A User object representing the user starting the test run.
+    batch: An optional integer representing the number of the batch in the
+      chain.
   """
-  logging.info('\n'.join(['offset: %d', 'limit: %d', 'token: %s',
+  logging.info('\n'.join(['cursor: %s', 'token: %s',
                           'client_info: %s', 'creation_time: %s',
                           'browsers: %s', 'browser_versions: %s',
-                          'operating_systems: %s', 'user: %s']),
-               offset, limit, token, client_info, creation_time, browsers,
-               browser_versions, operating_systems, user)
-
-  # Get the URLs to create RunLog entries.
-  query = db.Query(url.Url)
-  urls = query.fetch(limit, offset=offset)
+                          'operating_systems: %s', 'user: %s', 'batch: %d']),
+               cursor, token, client_info, creation_time, browsers,
+               browser_versions, operating_systems, user, batch)
+
+  # Get the url configs to create RunLog entries.
+  query = url_config.UrlConfig.all()
+  if cursor:
+    query.with_cursor(cursor)
+  configs = query.fetch(URL_CONFIG_BATCH_SIZE)
+
+  # Get the Urls of the batch at once, each of them once.
+  url_keys = []
+  for config in configs:
+    url_key = url_config.UrlConfig.url.get_value_for_datastore(config)
+    if url_key not in url_keys:
+      url_keys.append(url_key)
+  urls = dict(zip(url_keys, db.get(url_keys)))
 
   logging.info('Creating the RunLog models.')
-  run_logs = []
-  for test_url in urls:
-    # Let's get url_configs associated with test_url.
-    configs = gql_util.FetchEntities(test_url.urlconfigs,
-                                     URL_CONFIG_FETCH_COUNT)
-    for config in configs:
-      for system in operating_systems:
-        for browser in browsers:
-          for version in browser_versions:
-            run_logs.append(run_log.RunLog(
-                url=test_url.url, config=config.key(), token=token,
-                client_info=client_info, creation_time=creation_time,
-                status=enum.CASE_STATUS.QUEUED, user=user, browser=browser,
-                browser_version=version, os=system, priority=DEFAULT_PRIORITY,
-                retry_count=DEFAULT_RETRY_COUNT))
+  run_logs = {}
+  for config in configs:
+    test_url = urls[url_config.UrlConfig.url.get_value_for_datastore(config)]
+    if not test_url:
+      logging.warning('The url config %s has no url.', config.key())
+      continue
+    for system in operating_systems:
+      for browser in browsers:
+        for version in browser_versions:
+          key_name = _GetRunLogKeyName(token, config.key(), system, browser,
+                                       version)
+          # Spread the work items evenly over the queue shards.
+          run_logs[key_name] = run_log.RunLog(
+              key_name=key_name, url=test_url.url, config=config.key(),
+              token=token, client_info=client_info,
+              creation_time=creation_time, status=enum.CASE_STATUS.QUEUED,
+              user=user, browser=browser,
+              browser_version=version, os=system, priority=DEFAULT_PRIORITY,
+              retry_count=DEFAULT_RETRY_COUNT,
+              shard=len(run_logs) % run_log.NUM_SHARDS)
+  run_logs = run_logs.values()
 
   logging.info('Num run_logs: %d', len(run_logs))
 
-  db.put(run_logs)
+  # Only store the RunLogs that a previous attempt of the task did not store,
+  # they may have been leased already.
+  existing = db.get([log.key() for log in run_logs])
+  _PutRunLogs([log for log, stored in zip(run_logs, existing) if not stored])
+
+  # Count the work items of the batch in the progress of the run. A retried
+  # task counts the same work items under the same update id, so they are
+  # counted once.
+  num_logs = {}
+  for log in run_logs:
+    num_logs[log.browser_version] = num_logs.get(log.browser_version, 0) + 1
+  for version, count in num_logs.items():
+    run_progress.UpdateCounts(token, version, {enum.CASE_STATUS.QUEUED: count},
+                              'create_%d' % batch)
   logging.info('Finished creating the RunLog models.')
 
+  if len(configs) == URL_CONFIG_BATCH_SIZE:
+    try:
+      deferred.defer(CreateRunLogEntries, query.cursor(), token, client_info,
+                     creation_time, browsers, browser_versions,
+                     operating_systems, user, batch=batch + 1,
+                     _name='run-log-entries-%s-%d' % (token, batch + 1),
+                     _queue=DEFAULT_QUEUE)
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+      logging.info('The task of the batch %d was already queued.', batch + 1)
+
 
 def CreateMachines(num_instances, token, os, browser, browser_version,
                    download_info, retries=0):
@@ -136,7 +225,8 @@ def CreateMachines(num_instances, token, os, browser, browser_version,
   user_data = simplejson.dumps({'channel': browser_version,
                                 'os': OS_TO_USER_DATA[os],
                                 'token': token,
-                                'download_info': download_info})
+                                'download_info': download_info,
+                                'workers': WORKERS_PER_INSTANCE})
   logging.info('Spawning EC2 machines.')
   # Note: All exceptions are caught here because the EC2 API could fail after
   # successfully starting a machine. Because this task is rescheduled on
@@ -169,24 +259,43 @@ def RequeueWorkItems(instance_id):
   Args:
     instance_id: A string that uniquely identifies a machine.
   """
-  query = db.Query(run_log.RunLog)
-  query.filter('status =', enum.CASE_STATUS.IN_PROGRESS)
-  query.filter('client_id =', instance_id)
+  requeued = run_log.RequeueWorkItems(instance_id)
+  logging.info('Requeued %d work items of the machine "%s".', requeued,
+               instance_id)
 
-  logs = []
-  for log in query:
-    logs.append(log)
 
-    # Ensure that the work item can be retried.
-    if log.retry_count > 0:
-      log.retry_count -= 1
-      log.status = enum.CASE_STATUS.QUEUED
-      log.client_id = ''
-      log.priority -= 1
-    else:
-      log.status = enum.CASE_STATUS.UNKNOWN_ERROR
+def ExpireRunLogs(token, cursor=None):
+  """Expire the unfinished RunLogs of a test run, in batches.
+
+  A new task is queued for the next batch until all the RunLogs of the test
+  run were processed.
+
+  Args:
+    token: A string representing the token of the test run.
+    cursor: An optional string representing the query cursor of the RunLogs
+      to start from.
+  """
+  query = run_log.RunLog.all(keys_only=True)
+  query.filter('token =', token)
+  if cursor:
+    query.with_cursor(cursor)
+  keys = query.fetch(EXPIRE_BATCH_SIZE)
+  if len(keys) == EXPIRE_BATCH_SIZE:
+    deferred.defer(ExpireRunLogs, token, query.cursor(), _queue=DEFAULT_QUEUE)
 
-  db.put(logs)
+  run_log.ExpireWorkItems(keys)
+
+
+def SweepExpiredLeases():
+  """Requeue or fail the work items whose lease expired, in batches.
+
+  A new task is queued for the next batch until no expired lease is left.
+  """
+  swept = run_log.SweepExpiredLeases(datetime.datetime.now(),
+                                     SWEEP_BATCH_SIZE)
+  logging.info('Swept %d expired leases.', swept)
+  if swept == SWEEP_BATCH_SIZE:
+    deferred.defer(SweepExpiredLeases, _queue=DEFAULT_QUEUE)
 
 
 def TerminateMachine(instance_id, status):
@@ -232,6 +341,25 @@ def TerminateFinishedMachine(instance_id):
   TerminateMachine(instance_id, enum.MACHINE_STATUS.TERMINATED)
 
 
+def TerminateSurplusMachine(instance_id):
+  """Terminate a machine that the fleet of its channel no longer needs.
+
+  The status of the machine is set TERMINATED, and the work items it leased
+  are given back to the queue without counting as a retry.
+
+  Args:
+    instance_id: A string that uniquely identifies a machine.
+  """
+  TerminateMachine(instance_id, enum.MACHINE_STATUS.TERMINATED)
+
+  query = run_log.RunLog.all(keys_only=True)
+  query.filter('status =', enum.CASE_STATUS.IN_PROGRESS)
+  query.filter('client_id =', instance_id)
+  released = run_log.ReleaseWorkItems([key for key in query], instance_id)
+  logging.info('Released %d work items of the machine "%s".', released,
+               instance_id)
+
+
 def TerminateExpiredMachine(instance_id):
   """Terminate the machine associated with the given instance id.
 
@@ -32,9 +32,14 @@ from google.appengine.ext import webapp
 from google.appengine.ext.webapp import blobstore_handlers
 from google.appengine.ext.webapp.util import run_wsgi_app
 
+from common import content_hash
 from common import enum
+from common import layout_blocks
+from common import layout_pack
+from common import layout_rle
 from common import useragent_parser
 from handlers import base
+from handlers import test_distributor
 from models import browser
 from models import client_machine
 from models import data_list
@@ -50,6 +55,13 @@ PUT_DATA_URL = '/putdata'
 UPLOAD_SCREENSHOT_IMAGE_URL = '/uploadscreenshot'
 GET_SCREENSHOT_UPLOAD_URL_URL = '/getuploadurl'
 GET_SCREENSHOT_STATUS_URL = '/screenshotstatus'
+GET_PIECE_STATUS_URL = '/piecestatus'
+PUT_BUNDLE_URL = '/putbundle'
+
+# Names of the bundle form fields holding the screenshot and layout pieces.
+BUNDLE_SCREENSHOT_FIELD = 'screenshot'
+BUNDLE_THUMBNAIL_FIELD = 'thumbnail'
+BUNDLE_PIECE_FIELD = 'piece%d'
 
 
 class PutDataError(Exception):
@@ -62,7 +74,17 @@ class PutData(webapp.RequestHandler):
   # Disable 'Invalid method name' lint error.
   # pylint: disable-msg=C6409
   def post(self):
-    """Put the given result data into the database."""
+    """Put the given result data into the database.
+
+    Layout table pieces are either form-encoded JSON ('layoutTable' argument)
+    or packed binary pieces (see layout_pack) sent as the request body with
+    the key and index in the query string.
+    """
+    if self.request.headers.get('Content-Type', '').startswith(
+        layout_pack.CONTENT_TYPE):
+      self._PutPackedPiece()
+      return
+
     data = self._GetRequestData()
 
     # Touch the machine instance if the instance id is provided.
@@ -71,76 +93,7 @@ class PutData(webapp.RequestHandler):
                                       enum.MACHINE_STATUS.RUNNING)
 
     if 'key' not in data:
-      update_suite_info = False
-      suite_data = simplejson.loads(data['suiteInfo'])
-      suite = test_suite.GetOrInsertSuite(
-          suite_data['date'], suite_data['refBrowser'],
-          suite_data['refBrowserChannel'])
-
-      channel = None
-      if 'channel' in data:
-        channel = data['channel']
-
-      # Following code is to take care of the scenario where test browser comes
-      # up first with the data. Hence, at that time we don't have sufficient
-      # data to put in ref browser.
-      # If reference browser information is incomplete then let's mark
-      # it for update.
-      if suite.ref_browser.os is None:
-        parser = useragent_parser.UAParser(data['userAgent'])
-        if (parser.GetBrowserVersion() == suite.ref_browser.version and
-            channel==suite_data['refBrowserChannel']):
-          # If flag is present anywhere then it has to match.
-          if 'flag' in data or suite.ref_browser.flag:
-            if suite.ref_browser.flag == data['flag']:
-              update_suite_info = True
-          else:
-            update_suite_info = True
-
-      test_data = page_data.PageData()
-      if 'screenshot' in data:
-        test_data.screenshot = screenshot.AddScreenshot(data['screenshot'])
-
-      test_data.test_suite = suite
-
-      flag = None
-      if 'flag' in data:
-        flag = data['flag']
-      test_data.browser = browser.GetOrInsertBrowser(
-          data['userAgent'], channel=channel, flag=flag)
-
-      if update_suite_info:
-        logging.info('Updating Reference Browser in Test Suite. old_ref: %s,'
-                     ' new_ref: %s', suite.ref_browser.key(),
-                     test_data.browser.key())
-        test_suite.UpdateRefBrowser(suite, test_data.browser,
-                                    delete_old_ref=True)
-      # Let's get run log key from suite_data.
-      if 'key' not in suite_data:
-        raise PutDataError('The run log "key" is a required parameter.')
-      my_run_log = db.get(db.Key(suite_data['key']))
-      url_config_key = my_run_log.config.key()
-      test_data.site = site.GetOrInsertSiteFromUrl(data['url'], url_config_key)
-
-      test_data.nodes_table = data['nodesTable']
-      test_data.dynamic_content_table = data['dynamicContentTable']
-      test_data.layout_table = data_list.CreateEmptyDataList()
-
-      test_data.width = int(data['width'])
-      test_data.height = int(data['height'])
-      if 'metaData' in data:
-        test_data.metadata = data['metaData']
-      # If browser key matches with test_suite's ref browser then
-      # let's mark the page_data as reference.
-      if str(test_data.browser.key()) == str(suite.ref_browser.key()):
-        test_data.is_reference = True
-      else:
-        test_data.is_reference = False
-
-      test_data.put()
-
-      if not test_data.is_reference:
-        suite.AddTestBrowser(test_data.browser)
+      test_data = _CreatePageData(data)
 
       response = {
           'key': str(test_data.key()),
@@ -149,10 +102,25 @@ class PutData(webapp.RequestHandler):
 
     else:
       test_data = db.get(db.Key(data['key']))
-      layout_table = simplejson.loads(data['layoutTable'])
-      test_data.layout_table.AddEntry(int(data['i']), layout_table)
+      _CreateLayoutEntry(test_data, int(data['i']), data['layoutTable']).put()
       self.response.out.write('received')
 
+  def _PutPackedPiece(self):
+    """Stores a packed layout table piece sent as the request body.
+
+    Raises:
+      PutDataError: The piece is not a valid packed layout piece.
+    """
+    instance_id = self.request.get('instance_id')
+    if instance_id:
+      client_machine.SetMachineStatus(instance_id,
+                                      enum.MACHINE_STATUS.RUNNING)
+
+    test_data = db.get(db.Key(self.request.get('key')))
+    _CreateLayoutEntry(test_data, int(self.request.get('i')),
+                       self.request.body, packed=True).put()
+    self.response.out.write('received')
+
   def _GetRequestData(self):
     data = {}
     args = self.request.arguments()
@@ -161,6 +129,247 @@ class PutData(webapp.RequestHandler):
     return data
 
 
+def _CreatePageData(data, screenshot_image=None):
+  """Creates the PageData of a result from its initial upload arguments.
+
+  Args:
+    data: A dictionary of the initial upload arguments.
+    screenshot_image: An optional unsaved Screenshot of the result.
+
+  Returns:
+    The stored PageData, with an empty layout table.
+
+  Raises:
+    PutDataError: The arguments are not valid.
+  """
+  update_suite_info = False
+  suite_data = simplejson.loads(data['suiteInfo'])
+  suite = test_suite.GetOrInsertSuite(
+      suite_data['date'], suite_data['refBrowser'],
+      suite_data['refBrowserChannel'])
+
+  channel = None
+  if 'channel' in data:
+    channel = data['channel']
+
+  # Following code is to take care of the scenario where test browser comes
+  # up first with the data. Hence, at that time we don't have sufficient
+  # data to put in ref browser.
+  # If reference browser information is incomplete then let's mark
+  # it for update.
+  if suite.ref_browser.os is None:
+    parser = useragent_parser.UAParser(data['userAgent'])
+    if (parser.GetBrowserVersion() == suite.ref_browser.version and
+        channel==suite_data['refBrowserChannel']):
+      # If flag is present anywhere then it has to match.
+      if 'flag' in data or suite.ref_browser.flag:
+        if suite.ref_browser.flag == data['flag']:
+          update_suite_info = True
+      else:
+        update_suite_info = True
+
+  test_data = page_data.PageData()
+  if 'screenshot' in data:
+    test_data.screenshot = screenshot.AddScreenshot(data['screenshot'])
+
+  test_data.test_suite = suite
+
+  flag = None
+  if 'flag' in data:
+    flag = data['flag']
+  test_data.browser = browser.GetOrInsertBrowser(
+      data['userAgent'], channel=channel, flag=flag)
+
+  if update_suite_info:
+    logging.info('Updating Reference Browser in Test Suite. old_ref: %s,'
+                 ' new_ref: %s', suite.ref_browser.key(),
+                 test_data.browser.key())
+    test_suite.UpdateRefBrowser(suite, test_data.browser,
+                                delete_old_ref=True)
+  # Let's get run log key from suite_data.
+  if 'key' not in suite_data:
+    raise PutDataError('The run log "key" is a required parameter.')
+  my_run_log = db.get(db.Key(suite_data['key']))
+  url_config_key = my_run_log.config.key()
+  test_data.site = site.GetOrInsertSiteFromUrl(data['url'], url_config_key)
+
+  test_data.nodes_table = data['nodesTable']
+  test_data.nodes_table_hash = content_hash.HashContent(data['nodesTable'])
+  test_data.dynamic_content_table = data['dynamicContentTable']
+  test_data.width = int(data['width'])
+  test_data.height = int(data['height'])
+  if 'layoutFormat' in data and data['layoutFormat']:
+    if data['layoutFormat'] not in layout_rle.LAYOUT_FORMATS:
+      raise PutDataError(
+          'Unknown layout format "%s".' % data['layoutFormat'])
+    test_data.layout_format = data['layoutFormat']
+  if 'loadTime' in data and data['loadTime']:
+    try:
+      test_data.load_time = float(data['loadTime'])
+    except ValueError:
+      raise PutDataError('Invalid load time "%s".' % data['loadTime'])
+  if 'metaData' in data:
+    test_data.metadata = data['metaData']
+  # If browser key matches with test_suite's ref browser then
+  # let's mark the page_data as reference.
+  if str(test_data.browser.key()) == str(suite.ref_browser.key()):
+    test_data.is_reference = True
+  else:
+    test_data.is_reference = False
+
+  # The layout table list and the screenshot are stored with a single put.
+  entities = [data_list.DataList()]
+  if screenshot_image:
+    entities.append(screenshot_image)
+    test_data.screenshot = screenshot_image
+  db.put(entities)
+  test_data.layout_table = entities[0]
+  test_data.put()
+
+  if not test_data.is_reference:
+    suite.AddTestBrowser(test_data.browser)
+  return test_data
+
+
+def _CreateLayoutEntry(test_data, index, piece, packed=False):
+  """Creates the DataListEntry of a layout table piece without storing it.
+
+  Args:
+    test_data: The PageData the piece belongs to.
+    index: The index of the piece.
+    piece: The piece as sent by the client, either JSON layout table rows in
+      the layout format of the PageData or a packed piece (see layout_pack).
+    packed: Whether the piece is a packed piece.
+
+  Returns:
+    Unsaved DataListEntry entity.
+
+  Raises:
+    PutDataError: The piece is not a valid packed layout piece.
+  """
+  if packed:
+    try:
+      return test_data.layout_table.CreatePackedEntry(
+          index, piece, content_hash=content_hash.HashContent(
+              piece, layout_pack.LAYOUT_FORMAT_PACKED))
+    except layout_pack.LayoutPackError, e:
+      raise PutDataError('Invalid packed layout piece: %s' % e)
+
+  layout_table = simplejson.loads(piece)
+  # Pieces of blocks hold one item per block, the length is the number of rows
+  # like for the other formats.
+  length = None
+  if test_data.layout_format == layout_blocks.LAYOUT_FORMAT_BLOCKS:
+    length = layout_blocks.GetRowCount(layout_table)
+  return test_data.layout_table.CreateEntry(
+      index, layout_table, content_format=test_data.layout_format,
+      length=length, content_hash=content_hash.HashContent(
+          piece, test_data.layout_format))
+
+
+class PutBundle(webapp.RequestHandler):
+  """Handler for putting all the result data of a page with one request.
+
+  The bundle replaces the initial /putdata request, the layout table piece
+  requests, the blobstore screenshot upload and, optionally, the request that
+  finishes the work item.
+  """
+
+  # Disable 'Invalid method name' lint error.
+  # pylint: disable-msg=C6409
+  def post(self):
+    """Put the result data of a page from a multipart/form-data body.
+
+    URL Params:
+      The arguments of the initial /putdata request (userAgent, url,
+        nodesTable, suiteInfo, ...).
+      piece<i>: The layout table piece of index i, for every piece. Packed
+        pieces are sent as files of type layout_pack.CONTENT_TYPE, other pieces
+        as JSON layout table rows.
+      screenshot: An optional image file of the page screenshot.
+      result: An optional work item result. If given, the work item of the run
+        log is finished with this result once the data is stored.
+
+    Returns:
+      A JSON dictionary with the key of the stored PageData ('key').
+    """
+    data = self._GetRequestData()
+
+    if 'result' in data and (data['result'] not in
+                             test_distributor.WORK_ITEM_RESULTS):
+      logging.error('Unknown work item result "%s".', data['result'])
+      self.error(400)
+      self.response.out.write('Unknown result "%s".' % data['result'])
+      return
+
+    if 'instance_id' in data:
+      client_machine.SetMachineStatus(data['instance_id'],
+                                      enum.MACHINE_STATUS.RUNNING)
+
+    if 'result' in data and 'instance_id' in data:
+      # Drop the results of a work item leased to another client meanwhile,
+      # that client stores its own results.
+      suite_data = simplejson.loads(data['suiteInfo'])
+      if not run_log.IsLeasedTo(suite_data['key'], data['instance_id']):
+        logging.warning('The work item "%s" is not leased to "%s" anymore, '
+                        'dropping its results.', suite_data['key'],
+                        data['instance_id'])
+        self.response.out.write(simplejson.dumps({'key': None}))
+        return
+
+    screenshot_image = None
+    screenshot_file = self.request.POST.get(BUNDLE_SCREENSHOT_FIELD)
+    if hasattr(screenshot_file, 'file'):
+      thumbnail = None
+      thumbnail_mime_type = None
+      thumbnail_file = self.request.POST.get(BUNDLE_THUMBNAIL_FIELD)
+      if hasattr(thumbnail_file, 'file'):
+        thumbnail = thumbnail_file.value
+        thumbnail_mime_type = thumbnail_file.type
+      screenshot_image = screenshot.CreateScreenshot(
+          screenshot_file.value, screenshot_file.type, thumbnail=thumbnail,
+          thumbnail_mime_type=thumbnail_mime_type)
+
+    test_data = _CreatePageData(data, screenshot_image=screenshot_image)
+
+    entries = []
+    for index in range(data_list.NUM_ENTRIES):
+      piece = self.request.POST.get(BUNDLE_PIECE_FIELD % index)
+      if piece is None:
+        raise PutDataError('The layout table piece %d is missing.' % index)
+      if hasattr(piece, 'file'):
+        entries.append(_CreateLayoutEntry(
+            test_data, index, piece.value,
+            packed=piece.type == layout_pack.CONTENT_TYPE))
+      else:
+        entries.append(_CreateLayoutEntry(test_data, index, piece))
+    data_list.PutEntries(entries)
+    test_data.layout_hashes = [entry.content_hash for entry in entries]
+    test_data.put()
+
+    if 'result' in data:
+      suite_data = simplejson.loads(data['suiteInfo'])
+      duration = None
+      if data.get('duration'):
+        try:
+          duration = int(data['duration'])
+        except ValueError:
+          raise PutDataError('Invalid duration "%s".' % data['duration'])
+      test_distributor.CompleteWorkItem(suite_data['key'],
+                                        data.get('instance_id'),
+                                        data['result'], duration=duration)
+
+    self.response.out.write(simplejson.dumps({'key': str(test_data.key())}))
+
+  def _GetRequestData(self):
+    """Gets the form fields of the request, leaving out the files."""
+    data = {}
+    for arg, value in self.request.POST.items():
+      if not hasattr(value, 'file'):
+        data[arg] = value
+    return data
+
+
 class UploadScreenshotImage(blobstore_handlers.BlobstoreUploadHandler):
   """Handler for uploading the screenshot image."""
 
@@ -246,11 +455,55 @@ class GetScreenshotStatus(base.BaseHandler):
       self.error(500)
 
 
+class GetPieceStatus(base.BaseHandler):
+  """Handler for getting which layout table pieces have been stored.
+
+  Storing a piece again replaces it, so clients upload pieces concurrently and
+  use this acknowledgement to upload again only the pieces that are missing.
+  """
+
+  # Disable 'Invalid method name' lint error.
+  # pylint: disable-msg=C6409
+  def get(self):
+    """Provide the indices of the stored layout table pieces.
+
+    URL Params:
+    key: A string key indicating the PageData object that the pieces belong
+      to.
+
+    Returns:
+      A JSON dictionary with the number of pieces expected ('nPieces') and the
+      sorted list of the indices of the stored pieces ('received'). If the key
+      is not valid, a 500 error is returned.
+    """
+    key = self.request.get('key')
+    if not key:
+      self.error(500)
+      return
+
+    try:
+      test_data = db.get(db.Key(key))
+    except db.BadKeyError:
+      self.error(500)
+      return
+
+    if not test_data or not test_data.layout_table:
+      self.error(500)
+      return
+
+    response = {
+        'nPieces': data_list.NUM_ENTRIES,
+        'received': test_data.layout_table.GetReceivedEntries()}
+    self.response.out.write(simplejson.dumps(response))
+
+
 application = webapp.WSGIApplication(
     [(PUT_DATA_URL, PutData),
+     (PUT_BUNDLE_URL, PutBundle),
      (UPLOAD_SCREENSHOT_IMAGE_URL, UploadScreenshotImage),
      (GET_SCREENSHOT_UPLOAD_URL_URL, GetScreenshotUploadUrl),
-     (GET_SCREENSHOT_STATUS_URL, GetScreenshotStatus)],
+     (GET_SCREENSHOT_STATUS_URL, GetScreenshotStatus),
+     (GET_PIECE_STATUS_URL, GetPieceStatus)],
     debug=True)
 
 
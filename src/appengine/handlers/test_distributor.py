@@ -39,30 +39,64 @@ from google.appengine.ext.webapp.util import run_wsgi_app
 from common import chrome_channel_util
 from common import ec2_manager
 from common import enum
+from common import run_estimate
 from handlers import base
 from handlers import launch_tasks
+from models import channel_fleet
 from models import client_machine
 from models import run_log
+from models import run_progress
 from models import url
 
 
 START_RUN_URL = '/distributor/start_run'
 ACCEPT_WORK_ITEM_URL = '/distributor/accept_work_item'
 FINISH_WORK_ITEM_URL = '/distributor/finish_work_item'
+LEASE_WORK_ITEMS_URL = '/distributor/lease_work_items'
+RELEASE_WORK_ITEMS_URL = '/distributor/release_work_items'
+FINISH_CLIENT_URL = '/distributor/finish_client'
+EXTEND_LEASE_URL = '/distributor/extend_lease'
 CHECK_MACHINES_URL = '/distributor/check_machines'
+SWEEP_LEASES_URL = '/distributor/sweep_leases'
+SCALE_FLEETS_URL = '/distributor/scale_fleets'
+RUN_PROGRESS_URL = '/distributor/run_progress'
 UPLOAD_CLIENT_LOG_URL = '/distributor/upload_client_log'
 EXPIRE_TEST_RUN_URL = '/distributor/expire_test_run'
 
 DEFAULT_MIN_MACHINE_COUNT = 2
 WORK_ITEM_SUCCESS = 'success'
 WORK_ITEM_FAILURE = 'failed'
+# The failure result sent by older bots, and in the results they spooled.
+WORK_ITEM_LEGACY_FAILURE = 'failure'
 WORK_ITEM_UPLOAD_ERROR = 'upload_error'
 WORK_ITEM_TIMEOUT_ERROR = 'timeout_error'
+WORK_ITEM_RESULTS = [WORK_ITEM_SUCCESS, WORK_ITEM_FAILURE,
+                     WORK_ITEM_LEGACY_FAILURE, WORK_ITEM_UPLOAD_ERROR,
+                     WORK_ITEM_TIMEOUT_ERROR]
 
 MAX_HOURS = 5 * 24
 MINUTES_PER_URL = 3.0
 MAX_UNRESPONSIVE_MINUTES = 20
 
+# The maximum number of work items leased to a client at once.
+MAX_LEASE_SIZE = 20
+
+# The maximum number of machines of a test run for a browser channel.
+MAX_MACHINE_COUNT = 50
+# Fleets are resized for the remaining work items to be processed by their
+# deadline, or within MIN_SCALING_HOURS once the deadline is close or past.
+MIN_SCALING_HOURS = 1
+# Machines are stopped only when the fleet exceeds the needed machines by more
+# than SCALE_DOWN_MARGIN, so small changes of the durations do not make the
+# fleet flap.
+SCALE_DOWN_MARGIN = 0.25
+# The minimum time between two resizings of a fleet, so started machines are
+# running before the fleet is looked at again.
+SCALING_COOLDOWN = datetime.timedelta(minutes=15)
+# A fleet whose run has not counted any work item yet is kept active for this
+# long, while the tasks creating the RunLog entries are pending.
+FLEET_START_GRACE = datetime.timedelta(hours=1)
+
 MILLISECONDS_PER_SECOND = 1000
 MICROSECONDS_PER_MILLISECOND = 1000
 MILLISECONDS_PER_DAY = 24 * 60 * 60 * MILLISECONDS_PER_SECOND
@@ -85,7 +119,10 @@ class StartTestRun(base.BaseHandler):
   """Handler for starting a test run."""
 
   @staticmethod
-  def CalculateNeededMachines(num_urls, max_hours=MAX_HOURS):
+  def CalculateNeededMachines(
+      num_urls, max_hours=MAX_HOURS,
+      workers_per_machine=launch_tasks.WORKERS_PER_INSTANCE,
+      minutes_per_url=MINUTES_PER_URL):
     """Calculate the number of machines that will be needed to process the Urls.
 
     This function takes into account the number of urls that need to be
@@ -96,6 +133,10 @@ class StartTestRun(base.BaseHandler):
       num_urls: An integer representing the number of urls to be processed.
       max_hours: An optional parameter specifying the maximum number of hours
         the urls should be processed in.
+      workers_per_machine: An optional parameter specifying the number of urls
+        each machine processes concurrently.
+      minutes_per_url: An optional parameter specifying the number of minutes
+        a worker takes to process a url.
 
     Returns:
       An integer representing the total number of machines needed for each
@@ -103,8 +144,8 @@ class StartTestRun(base.BaseHandler):
       of each configuration was needed.
     """
     # Calculate the total machine-minutes that are needed for the urls.
-    # machine*minutes = urls * ((minutes/url)/machine)
-    machine_minutes = num_urls * MINUTES_PER_URL
+    # machine*minutes = urls * ((minutes/url)/machine) / (workers/machine)
+    machine_minutes = num_urls * minutes_per_url / max(workers_per_machine, 1)
 
     # Calculate the total number of minutes that we have for the run.
     # minutes = hours * (minutes/hour)
@@ -150,9 +191,7 @@ class StartTestRun(base.BaseHandler):
 
     # Figure out the total number of URLs for this run.
     logging.info('Getting the total URL count.')
-    query = url.Url.all()
-    # TODO(user): Add a global counter for the Url model to avoid count().
-    num_urls = query.count()
+    num_urls = url.GetUrlCount()
     logging.info('This run will have %d urls.', num_urls)
 
     # Create a unique token per test run based on a random uuid.
@@ -183,25 +222,34 @@ class StartTestRun(base.BaseHandler):
     # Get the download info string.
     download_info = chrome_channel_util.GetDownloadInfo()
 
-    # Push tasks onto the queue to create the RunLog entries.
-    limit = 200
-    offset = 0
-    while offset < num_urls:
-      deferred.defer(launch_tasks.CreateRunLogEntries, offset, limit,
-                     token, client_info, creation_time, browsers,
-                     browser_versions, operating_systems, user,
-                     _countdown=launch_tasks.DEFAULT_COUNTDOWN,
-                     _queue=launch_tasks.DEFAULT_QUEUE)
-      offset += limit
-
-    # Push tasks onto the queue to create the necessary machines.
-    for os in operating_systems:
+    # Start the chain of tasks creating the RunLog entries.
+    deferred.defer(launch_tasks.CreateRunLogEntries, None, token,
+                   client_info, creation_time, browsers, browser_versions,
+                   operating_systems, user,
+                   _countdown=launch_tasks.DEFAULT_COUNTDOWN,
+                   _queue=launch_tasks.DEFAULT_QUEUE)
+
+    # Push tasks onto the queue to create the necessary machines. The fleets
+    # are resized by ScaleFleets as the durations of the urls become known.
+    num_instances = min(num_instances, MAX_MACHINE_COUNT)
+    deadline = creation_time + datetime.timedelta(hours=MAX_HOURS)
+    fleets = []
+    for os_index, os in enumerate(operating_systems):
       for browser in browsers:
-        for channel in browser_channels:
+        for channel_index, channel in enumerate(browser_channels):
+          version = browser_versions[
+              os_index * len(browser_channels) + channel_index]
+          fleets.append(channel_fleet.ChannelFleet(
+              key_name=channel_fleet.GetKeyName(token, os, browser, channel),
+              token=token, os=os, browser=browser, channel=channel,
+              browser_version=version, download_info=download_info,
+              deadline=deadline, min_machines=DEFAULT_MIN_MACHINE_COUNT,
+              max_machines=MAX_MACHINE_COUNT, last_scaled_time=creation_time))
           deferred.defer(launch_tasks.CreateMachines, num_instances,
                          token, os, browser, channel, download_info,
                          _countdown=launch_tasks.DEFAULT_COUNTDOWN,
                          _queue=launch_tasks.DEFAULT_QUEUE)
+    db.put(fleets)
 
     self.response.out.write('Test run started.')
 
@@ -229,23 +277,35 @@ class AcceptNextWorkItem(base.BaseHandler):
       return None
 
   @staticmethod
-  def _GetTestDataJson(log):
-    """Return the JSON representation of a run log to be used by the extension.
+  def _GetTestData(log):
+    """Return the dictionary describing a run log to be used by the extension.
 
     Args:
-      log: A run_log.RunLog object to represent as JSON.
+      log: A run_log.RunLog object to describe.
 
     Returns:
-      A JSON string representing the given RunLog.
+      A dictionary describing the given RunLog.
     """
-    return simplejson.dumps({
+    return {
         'data_str': 'ContentMap["URL"]="%s"' % log.url,
         'start_time': log.creation_time.isoformat().replace('T', ' '),
         'config': (log.client_info[:1] +
                    ('"Tokens": "%s", ' % log.token) +
                    log.client_info[1:]),
         'id': 0,
-        'key': str(log.key())})
+        'key': str(log.key())}
+
+  @staticmethod
+  def _GetTestDataJson(log):
+    """Return the JSON representation of a run log to be used by the extension.
+
+    Args:
+      log: A run_log.RunLog object to represent as JSON.
+
+    Returns:
+      A JSON string representing the given RunLog.
+    """
+    return simplejson.dumps(AcceptNextWorkItem._GetTestData(log))
 
   # Disable 'Invalid method name' lint error.
   # pylint: disable-msg=C6409
@@ -275,31 +335,182 @@ class AcceptNextWorkItem(base.BaseHandler):
       self.response.out.write('null')
       return
 
-    log = db.GqlQuery(
-        'SELECT * FROM RunLog WHERE token = :1 AND browser_version = :2 AND '
-        'status = :3 ORDER BY creation_time ASC, priority DESC LIMIT 1',
-        token, browser_version, enum.CASE_STATUS.QUEUED).get()
+    logs = LeaseQueuedWorkItems(token, browser_version, instance_id, 1)
 
-    # Write out a null response if no log exists for the given criteria
-    if not log:
+    # Write out a null response if no log exists for the given criteria. The
+    # machine is not stopped here: it may still be processing or uploading
+    # other work items, and stops itself through FinishClient.
+    if not logs:
       self.response.out.write('null')
-      logging.info('No more test cases remain, shutting down the machine "%s".',
-                   instance_id)
-      deferred.defer(launch_tasks.TerminateFinishedMachine, instance_id,
-                     _countdown=launch_tasks.DEFAULT_COUNTDOWN,
-                     _queue=launch_tasks.DEFAULT_QUEUE)
       return
 
-    self.response.out.write(AcceptNextWorkItem._GetTestDataJson(log))
+    self.response.out.write(AcceptNextWorkItem._GetTestDataJson(logs[0]))
 
-    # Update the work item status
-    log.status = enum.CASE_STATUS.IN_PROGRESS
-    log.client_id = instance_id
-    log.start_time = datetime.datetime.now()
-    log.put()
 
-    # Update the machine status
-    client_machine.SetMachineStatus(instance_id, enum.MACHINE_STATUS.RUNNING)
+class LeaseWorkItems(AcceptNextWorkItem):
+  """Handler for leasing a batch of work items from the run log queue."""
+
+  # Disable 'Invalid method name' lint error.
+  # pylint: disable-msg=C6409
+  def post(self):
+    """Lease the next queued work items from the run log queue.
+
+    The work items are determined based on the browser version and token. The
+    response is a JSON list of the work items, which is empty if no work item
+    is left.
+
+    URL Params:
+      tokens: A string that uniquely identifies an instance of a test run.
+      instance_id: A string that uniquely identifies the machine making the
+        request.
+      useragent: A string representing the browser useragent string.
+      count: An optional int representing the maximum number of work items to
+        lease, up to MAX_LEASE_SIZE.
+    """
+    # Get the parameters from the request
+    token = self.GetRequiredParameter('tokens')
+    instance_id = self.GetRequiredParameter('instance_id')
+    useragent = urllib.unquote(self.GetRequiredParameter('useragent'))
+    count = min(max(self.GetOptionalIntParameter('count', 1), 1),
+                MAX_LEASE_SIZE)
+
+    # Log the parameters
+    logging.info('\n'.join(['token: %s', 'instance_id: %s', 'useragent: %s',
+                            'count: %d']),
+                 token, instance_id, useragent, count)
+
+    browser_version = AcceptNextWorkItem._ParseBrowserVersion(useragent)
+    if not browser_version:
+      logging.error('Could not parse the given useragent.')
+      self.response.out.write('[]')
+      return
+
+    logs = LeaseQueuedWorkItems(token, browser_version, instance_id, count)
+    self.response.out.write(simplejson.dumps(
+        [AcceptNextWorkItem._GetTestData(log) for log in logs]))
+
+
+class ReleaseWorkItems(base.BaseHandler):
+  """Handler for giving leased work items back to the run log queue."""
+
+  # Disable 'Invalid method name' lint error.
+  # pylint: disable-msg=C6409
+  def post(self):
+    """Requeue work items that a client leased but did not process.
+
+    Releasing a work item does not count as a retry.
+
+    URL Params:
+      key: A string that represents a run log entry key in the datastore. The
+        parameter is repeated for every work item to release.
+      instance_id: A string that uniquely identifies the machine making the
+        request.
+    """
+    keys = self.request.get_all('key')
+    instance_id = self.GetRequiredParameter('instance_id')
+
+    logging.info('Releasing %d work items leased by "%s".', len(keys),
+                 instance_id)
+
+    try:
+      keys = [db.Key(key) for key in keys]
+    except db.BadKeyError:
+      raise base.InvalidParameterValueError('key', keys)
+
+    # Only the work items the client still holds are requeued.
+    released = run_log.ReleaseWorkItems(keys, instance_id)
+    logging.info('Released %d work items.', released)
+
+
+class ExtendLease(base.BaseHandler):
+  """Handler for keeping a work item leased while its results are pending."""
+
+  # Disable 'Invalid method name' lint error.
+  # pylint: disable-msg=C6409
+  def post(self):
+    """Extend the lease of a work item whose results are not uploaded yet.
+
+    URL Params:
+      key: A string that represents the run log entry key in the datastore.
+      instance_id: A string that uniquely identifies the machine making the
+        request.
+      seconds: An int representing the number of seconds from now that the
+        work item should stay leased for.
+    """
+    key = self.GetRequiredParameter('key')
+    instance_id = self.GetRequiredParameter('instance_id')
+    seconds = self.GetOptionalIntParameter('seconds', 0)
+    if seconds <= 0:
+      raise base.InvalidParameterValueError('seconds', seconds)
+
+    try:
+      key = db.Key(key)
+    except db.BadKeyError:
+      raise base.InvalidParameterValueError('key', key)
+
+    if not run_log.ExtendLease(key, instance_id,
+                               datetime.timedelta(seconds=seconds)):
+      logging.warning('The work item "%s" is not leased to "%s".', key,
+                      instance_id)
+
+
+class FinishClient(base.BaseHandler):
+  """Handler for stopping the machine of a client that has finished."""
+
+  # Disable 'Invalid method name' lint error.
+  # pylint: disable-msg=C6409
+  def post(self):
+    """Stop the machine of a client that found no more queued work items.
+
+    The client calls this once all its results are uploaded.
+
+    URL Params:
+      instance_id: A string that uniquely identifies the machine making the
+        request.
+    """
+    instance_id = self.GetRequiredParameter('instance_id')
+
+    machine = client_machine.GetClientMachineFromInstanceId(instance_id)
+    if not machine:
+      raise base.InvalidParameterValueError('instance_id', instance_id)
+    if machine.status > enum.MACHINE_STATUS.RUNNING:
+      logging.info('The machine "%s" is already stopped.', instance_id)
+      return
+
+    logging.info('No more test cases remain, shutting down the machine "%s".',
+                 instance_id)
+    deferred.defer(launch_tasks.TerminateFinishedMachine, instance_id,
+                   _countdown=launch_tasks.DEFAULT_COUNTDOWN,
+                   _queue=launch_tasks.DEFAULT_QUEUE)
+
+
+def LeaseQueuedWorkItems(token, browser_version, instance_id, count):
+  """Lease the next queued work items of a test run to a machine.
+
+  Every work item is claimed in a transaction from the sharded run log queue
+  (see run_log.LeaseWorkItems). The time given to process a work item is
+  derived from the durations of the finished work items of the test run, or
+  MINUTES_PER_URL before any has finished.
+
+  Args:
+    token: A string that uniquely identifies an instance of a test run.
+    browser_version: A string representing the browser version of the machine.
+    instance_id: A string that uniquely identifies the machine.
+    count: An int representing the maximum number of work items to lease.
+
+  Returns:
+    A list of the leased run_log.RunLog objects, in the order to process them.
+  """
+  lease_time = run_log.GetLeaseTime(
+      token, browser_version, datetime.timedelta(minutes=MINUTES_PER_URL))
+  logs = run_log.LeaseWorkItems(token, browser_version, instance_id, count,
+                                lease_time)
+  if not logs:
+    return logs
+
+  # Update the machine status
+  client_machine.SetMachineStatus(instance_id, enum.MACHINE_STATUS.RUNNING)
+  return logs
 
 
 class FinishWorkItem(base.BaseHandler):
@@ -348,55 +559,114 @@ class FinishWorkItem(base.BaseHandler):
       instance_id: A string that uniquely identifies the machine making the
         request.
       result: A string result for the finished work item.
+      duration: An optional int count of milliseconds the machine spent
+        processing the work item.
 
     Raises:
       base.InvalidParameterValueError: The given key does not correspond with
-        an existing run log in the datastore.
+        an existing run log in the datastore, or the result is unknown.
     """
     # Get the parameters from the request
     key = self.GetRequiredParameter('key')
     instance_id = self.GetRequiredParameter('instance_id')
     result = self.GetOptionalParameter('result',
                                        default_value=WORK_ITEM_SUCCESS)
+    duration = self.GetOptionalIntParameter('duration', -1)
+    if result not in WORK_ITEM_RESULTS:
+      raise base.InvalidParameterValueError('result', result)
 
     # Log the parameters
-    logging.info('\n'.join(['key: %s', 'instance_id: %s', 'result: %s']),
-                 key, instance_id, result)
+    logging.info('\n'.join(['key: %s', 'instance_id: %s', 'result: %s',
+                            'duration: %d']),
+                 key, instance_id, result, duration)
 
-    log = db.get(key)
-    if not log:
+    if duration < 0:
+      duration = None
+    if not CompleteWorkItem(key, instance_id, result, duration=duration):
       raise base.InvalidParameterValueError('key', key)
 
-    logging.info('Current log status: "%d".', log.status)
 
-    if log.status != enum.CASE_STATUS.IN_PROGRESS:
-      # The run log has an invalid run status for finishing, just return
-      logging.error('The test case "%s" has an invalid status for finishing.',
-                    key)
-      return
+def _CompleteWorkItem(key, instance_id, result, duration):
+  """Finish a work item, to run in a transaction.
+
+  See CompleteWorkItem for the arguments.
+
+  Returns:
+    False if the key does not correspond with an existing run log in the
+    datastore, True otherwise.
+  """
+  log = db.get(key)
+  if not log:
+    return False
+
+  logging.info('Current log status: "%d".', log.status)
+
+  if log.status != enum.CASE_STATUS.IN_PROGRESS:
+    # The run log has an invalid run status for finishing, just return
+    logging.error('The test case "%s" has an invalid status for finishing.',
+                  key)
+    return True
+
+  if instance_id and log.client_id and log.client_id != instance_id:
+    # The lease of the machine expired and the work item was leased again.
+    logging.error('The test case "%s" is leased to "%s", not to "%s".',
+                  key, log.client_id, instance_id)
+    return True
+
+  if result == WORK_ITEM_SUCCESS:
+    # Update the work item status
+    log.status = enum.CASE_STATUS.FINISHED
+    log.end_time = datetime.datetime.now()
+    if duration is not None:
+      log.duration = duration
+    elif log.start_time:
+      duration = log.end_time - log.start_time
+      log.duration = FinishWorkItem._TimedeltaToMilliseconds(duration)
+    logging.info('Work item finished successfully.')
+  elif result in (WORK_ITEM_FAILURE, WORK_ITEM_LEGACY_FAILURE):
+    FinishWorkItem._HandleFailureCase(log, enum.CASE_STATUS.UNKNOWN_ERROR,
+                                      'failure')
+  elif result == WORK_ITEM_UPLOAD_ERROR:
+    FinishWorkItem._HandleFailureCase(log, enum.CASE_STATUS.UPLOAD_ERROR,
+                                      'upload error')
+  elif result == WORK_ITEM_TIMEOUT_ERROR:
+    FinishWorkItem._HandleFailureCase(log, enum.CASE_STATUS.TIMEOUT_ERROR,
+                                      'timeout error')
+  else:
+    # Keep the lease, so the work item is recovered when it expires.
+    logging.error('Unknown result "%s" for the test case "%s".', result, key)
+    return True
+
+  log.lease_expiry = None
+  run_progress.RecordTransition(log, enum.CASE_STATUS.IN_PROGRESS)
+  log.put()
+  return True
+
+
+def CompleteWorkItem(key, instance_id, result, duration=None):
+  """Change the state of a run log entry from IN_PROGRESS to FINISHED.
+
+  Args:
+    key: A string that represents the run log entry key in the datastore.
+    instance_id: A string that uniquely identifies the machine that processed
+      the work item, or None.
+    result: A string result for the finished work item, one of
+      WORK_ITEM_RESULTS. The work item is left unchanged for other results.
+    duration: An optional int count of milliseconds the machine spent
+      processing the work item. It is measured from the lease time otherwise.
+
+  Returns:
+    False if the key does not correspond with an existing run log in the
+    datastore, True otherwise.
+  """
+  if not db.run_in_transaction(_CompleteWorkItem, key, instance_id, result,
+                               duration):
+    return False
 
-    if result == WORK_ITEM_SUCCESS:
-      # Update the work item status
-      log.status = enum.CASE_STATUS.FINISHED
-      log.end_time = datetime.datetime.now()
-      if log.start_time:
-        duration = log.end_time - log.start_time
-        log.duration = FinishWorkItem._TimedeltaToMilliseconds(duration)
-      logging.info('Work item finished successfully.')
-    elif result == WORK_ITEM_FAILURE:
-      FinishWorkItem._HandleFailureCase(log, enum.CASE_STATUS.UNKNOWN_ERROR,
-                                        'failure')
-    elif result == WORK_ITEM_UPLOAD_ERROR:
-      FinishWorkItem._HandleFailureCase(log, enum.CASE_STATUS.UPLOAD_ERROR,
-                                        'upload error')
-    elif result == WORK_ITEM_TIMEOUT_ERROR:
-      FinishWorkItem._HandleFailureCase(log, enum.CASE_STATUS.TIMEOUT_ERROR,
-                                        'timeout error')
-
-    log.put()
-
-    # Update the machine status
+  # Update the machine status
+  if instance_id:
     client_machine.SetMachineStatus(instance_id, enum.MACHINE_STATUS.RUNNING)
+  return True
 
 
 class CheckMachines(base.BaseHandler):
@@ -434,6 +704,100 @@ class CheckMachines(base.BaseHandler):
                          _queue=launch_tasks.DEFAULT_QUEUE)
 
 
+class SweepLeases(base.BaseHandler):
+  """Handler for recovering the work items whose lease expired."""
+
+  # Disable 'Invalid method name' lint error.
+  # pylint: disable-msg=C6409
+  def get(self):
+    """Requeue or fail the work items whose lease expired."""
+    deferred.defer(launch_tasks.SweepExpiredLeases,
+                   _queue=launch_tasks.DEFAULT_QUEUE)
+
+
+class ScaleFleets(base.BaseHandler):
+  """Handler for resizing the fleets of the running test runs."""
+
+  # Disable 'Invalid method name' lint error.
+  # pylint: disable-msg=C6409
+  def get(self):
+    """Start or stop machines to process the queued work items in time."""
+    now = datetime.datetime.now()
+    for fleet in channel_fleet.GetActiveFleets():
+      ScaleFleet(fleet, now)
+
+
+def ScaleFleet(fleet, now):
+  """Start or stop machines of a fleet to meet its deadline.
+
+  The number of machines needed is calculated from the remaining work items
+  and the mean duration of the recently finished ones. Machines are started
+  when the fleet is too small, and stopped (newest first) when it exceeds the
+  needed machines by more than SCALE_DOWN_MARGIN. A fleet is resized at most
+  once per SCALING_COOLDOWN, and stays within its machine limits.
+
+  Args:
+    fleet: A channel_fleet.ChannelFleet object.
+    now: A datetime.datetime object representing the current time.
+  """
+  counts = run_progress.GetCounts(fleet.token, fleet.browser_version)
+  queued = counts[enum.CASE_STATUS.QUEUED]
+  if not queued:
+    # The machines shut down once no work item is left. Before the first work
+    # items are counted, the run has not started yet rather than finished.
+    started = sum(counts) > 0 or (
+        fleet.last_scaled_time and
+        now - fleet.last_scaled_time > FLEET_START_GRACE)
+    if started and not counts[enum.CASE_STATUS.IN_PROGRESS]:
+      logging.info('The fleet "%s" has finished.', fleet.key().name())
+      fleet.active = False
+      fleet.put()
+    return
+
+  if fleet.last_scaled_time and now - fleet.last_scaled_time < SCALING_COOLDOWN:
+    return
+
+  remaining = queued + counts[enum.CASE_STATUS.IN_PROGRESS]
+  minutes_per_url = MINUTES_PER_URL
+  stats = run_log.GetDurationStats(fleet.token, fleet.browser_version)
+  if stats:
+    minutes_per_url = stats[0] / (60.0 * MILLISECONDS_PER_SECOND)
+  time_left = fleet.deadline - now
+  hours_left = max(time_left.days * 24 + time_left.seconds / 3600.0,
+                   MIN_SCALING_HOURS)
+
+  needed = StartTestRun.CalculateNeededMachines(
+      remaining, max_hours=hours_left, minutes_per_url=minutes_per_url)
+  needed = min(max(needed, fleet.min_machines), fleet.max_machines)
+
+  query = db.Query(client_machine.ClientMachine)
+  query.filter('token =', fleet.token)
+  query.filter('os =', fleet.os)
+  query.filter('browser =', fleet.browser)
+  query.filter('browser_version =', fleet.channel)
+  machines = [machine for machine in query
+              if machine.status <= enum.MACHINE_STATUS.RUNNING]
+
+  logging.info('The fleet "%s" has %d machines and needs %d for %d work '
+               'items of %.1f minutes.', fleet.key().name(), len(machines),
+               needed, remaining, minutes_per_url)
+
+  if needed > len(machines):
+    deferred.defer(launch_tasks.CreateMachines, needed - len(machines),
+                   fleet.token, fleet.os, fleet.browser, fleet.channel,
+                   fleet.download_info, _queue=launch_tasks.DEFAULT_QUEUE)
+  elif len(machines) > math.ceil(needed * (1 + SCALE_DOWN_MARGIN)):
+    machines.sort(key=lambda machine: machine.creation_time, reverse=True)
+    for machine in machines[:len(machines) - needed]:
+      deferred.defer(launch_tasks.TerminateSurplusMachine, machine.client_id,
+                     _queue=launch_tasks.DEFAULT_QUEUE)
+  else:
+    return
+
+  fleet.last_scaled_time = now
+  fleet.put()
+
+
 class UploadClientLog(base.BaseHandler):
   """Handler to store the uploaded client log.
 
@@ -478,6 +842,9 @@ class ExpireTestRun(base.BaseHandler):
     # Get the parameters from the request
     token = self.GetRequiredParameter('token')
 
+    # Stop resizing the fleets of the test run.
+    channel_fleet.DeactivateFleets(token)
+
     # Get the list of ClientMachines (filtered by the token).
     query = db.Query(client_machine.ClientMachine)
     query.filter('token =', token)
@@ -490,30 +857,62 @@ class ExpireTestRun(base.BaseHandler):
                        _countdown=launch_tasks.DEFAULT_COUNTDOWN,
                        _queue=launch_tasks.DEFAULT_QUEUE)
 
-    # TODO(user): Process the RunLogs in a task queue to avoid timeouts.
-    # Get the list of RunLogs (filtered by the token).
-    query = db.Query(run_log.RunLog)
-    query.filter('token =', token)
+    # Mark the RunLogs that haven't finished processing as expired.
+    deferred.defer(launch_tasks.ExpireRunLogs, token,
+                   _queue=launch_tasks.DEFAULT_QUEUE)
 
-    logs = []
-    for log in query:
-      # Update the log status if it hasn't finished processing.
-      if (log.status == enum.CASE_STATUS.QUEUED or
-          log.status == enum.CASE_STATUS.IN_PROGRESS):
-        # Mark the RunLog as expired.
-        log.status = enum.CASE_STATUS.EXPIRED
-        logs.append(log)
+    self.response.out.write('Test run "%s" expired.' % token)
 
-    db.put(logs)
 
-    self.response.out.write('Test run "%s" expired.' % token)
+class RunProgress(base.BaseHandler):
+  """Handler for reporting the progress of a test run."""
+
+  # Disable 'Invalid method name' lint error.
+  # pylint: disable-msg=C6409
+  def get(self):
+    """Write the progress of a test run per browser version as JSON.
+
+    The progress is read from the run progress counters. For every browser
+    version it has the number of work items in each status, the number of
+    work items processed per hour and the estimated time of completion.
+
+    URL Params:
+      token: A string that uniquely identifies an instance of a test run.
+    """
+    token = self.GetRequiredParameter('token')
+
+    now = datetime.datetime.now()
+    run_counts = run_progress.GetRunCounts(token)
+
+    progress = {}
+    total_counts = [0] * len(enum.CASE_STATUS.ListEnumValues())
+    start_time = now
+    for browser_version, (counts, version_start) in run_counts.items():
+      progress[browser_version] = run_estimate.EstimateProgress(
+          counts, version_start, now)
+      total_counts = [a + b for a, b in zip(total_counts, counts)]
+      start_time = min(start_time, version_start)
+
+    self.response.headers['Content-Type'] = 'application/json'
+    self.response.out.write(simplejson.dumps({
+        'token': token,
+        'browser_versions': progress,
+        'total': run_estimate.EstimateProgress(total_counts, start_time,
+                                               now)}))
 
 
 application = webapp.WSGIApplication(
     [(START_RUN_URL, StartTestRun),
      (ACCEPT_WORK_ITEM_URL, AcceptNextWorkItem),
      (FINISH_WORK_ITEM_URL, FinishWorkItem),
+     (LEASE_WORK_ITEMS_URL, LeaseWorkItems),
+     (RELEASE_WORK_ITEMS_URL, ReleaseWorkItems),
+     (FINISH_CLIENT_URL, FinishClient),
+     (EXTEND_LEASE_URL, ExtendLease),
      (CHECK_MACHINES_URL, CheckMachines),
+     (SWEEP_LEASES_URL, SweepLeases),
+     (SCALE_FLEETS_URL, ScaleFleets),
+     (RUN_PROGRESS_URL, RunProgress),
      (UPLOAD_CLIENT_LOG_URL, UploadClientLog),
      (EXPIRE_TEST_RUN_URL, ExpireTestRun)],
     debug=True)
@@ -105,12 +105,12 @@ appcompat.webdiff.DeltaOverlay = function(fillColor, index, layoutUrl) {
   this.deltaIndex_ = index;
 
   /**
-   * Table containing node information of the DOM element at each pixel from the
-   * data received from two browsers.
-   * @type {Array.<Array.<Object>>}
+   * List of the delta rectangles with node information of the DOM elements
+   * they cover from the data received from two browsers.
+   * @type {Array.<Object>}
    * @private
    */
-  this.deltaTable_ = [];
+  this.deltaRects_ = [];
 
   /**
    * The URL to use to query for delta information.
@@ -268,7 +268,8 @@ appcompat.webdiff.DeltaOverlay.prototype.renderDeltaOverlay =
 
 
 /**
- * Draws all the overlay points contained in the response JSON string.
+ * Draws all the overlay rectangles contained in the response JSON string.
+ * Each item of the response is an [x, y, width, height, node1, node2] list.
  * @private
  */
 appcompat.webdiff.DeltaOverlay.prototype.drawDeltaPoints_ = function() {
@@ -277,19 +278,17 @@ appcompat.webdiff.DeltaOverlay.prototype.drawDeltaPoints_ = function() {
     var dataList = goog.json.parse(dataString);
 
     for (var i = 0; i < dataList.length; i++) {
-      var x = parseInt(dataList[i][0], 10);
-      var y = parseInt(dataList[i][1], 10);
-
-      this.drawPoint_(x, y);
-
-      if (!this.deltaTable_[y]) {
-        this.deltaTable_[y] = [];
-      }
-
-      this.deltaTable_[y][x] = {
-        'xPath1': dataList[i][2],
-        'xPath2': dataList[i][3]
+      var rect = {
+        'x': parseInt(dataList[i][0], 10),
+        'y': parseInt(dataList[i][1], 10),
+        'w': parseInt(dataList[i][2], 10),
+        'h': parseInt(dataList[i][3], 10),
+        'xPath1': dataList[i][4],
+        'xPath2': dataList[i][5]
       };
+
+      this.drawRect_(rect.x, rect.y, rect.w, rect.h);
+      this.deltaRects_.push(rect);
     }
 
     dataString = this.responseList_.pop();
@@ -298,14 +297,36 @@ appcompat.webdiff.DeltaOverlay.prototype.drawDeltaPoints_ = function() {
 
 
 /**
- * Draws a point at the given (x, y) coordinate on the canvas.
- * @param {number} x The x-coordinate to draw the point.
- * @param {number} y The y-coordinate to draw the point.
+ * Draws a rectangle at the given (x, y) coordinate on the canvas.
+ * @param {number} x The x-coordinate to draw the rectangle.
+ * @param {number} y The y-coordinate to draw the rectangle.
+ * @param {number} width The width of the rectangle.
+ * @param {number} height The height of the rectangle.
  * @private
  */
-appcompat.webdiff.DeltaOverlay.prototype.drawPoint_ =
-    function(x, y) {
-  this.graphicsContext_.drawRect(x, y, 1, 1, null, this.fillColor_);
+appcompat.webdiff.DeltaOverlay.prototype.drawRect_ =
+    function(x, y, width, height) {
+  this.graphicsContext_.drawRect(x, y, width, height, null, this.fillColor_);
+};
+
+
+/**
+ * Finds the delta rectangle covering the given pixel.
+ * @param {number} x The x coordinate of the pixel.
+ * @param {number} y The y coordinate of the pixel.
+ * @return {Object} The delta rectangle, or null if the pixel is not a delta
+ *     pixel.
+ * @private
+ */
+appcompat.webdiff.DeltaOverlay.prototype.findDeltaRect_ = function(x, y) {
+  for (var i = 0; i < this.deltaRects_.length; i++) {
+    var rect = this.deltaRects_[i];
+    if (x >= rect.x && x < rect.x + rect.w &&
+        y >= rect.y && y < rect.y + rect.h) {
+      return rect;
+    }
+  }
+  return null;
 };
 
 
@@ -376,10 +397,9 @@ appcompat.webdiff.DeltaOverlay.prototype.setupCanvasEvents_ =
  * @private
  */
 appcompat.webdiff.DeltaOverlay.prototype.getTestElementInfo_ = function(x, y) {
-  if (this.deltaTable_[y] && this.deltaTable_[y][x]) {
-    return (this.deltaTable_[y][x].xPath1.p + ' ' +
-            this.deltaTable_[y][x].xPath1.w + 'x' +
-            this.deltaTable_[y][x].xPath1.h);
+  var rect = this.findDeltaRect_(x, y);
+  if (rect) {
+    return rect.xPath1.p + ' ' + rect.xPath1.w + 'x' + rect.xPath1.h;
   } else {
     return '';
   }
@@ -399,10 +419,9 @@ appcompat.webdiff.DeltaOverlay.prototype.getTestElementInfo_ = function(x, y) {
  */
 appcompat.webdiff.DeltaOverlay.prototype.getReferenceElementInfo_ =
     function(x, y) {
-  if (this.deltaTable_[y] && this.deltaTable_[y][x]) {
-    return (this.deltaTable_[y][x].xPath2.p + ' ' +
-            this.deltaTable_[y][x].xPath2.w + 'x' +
-            this.deltaTable_[y][x].xPath2.h);
+  var rect = this.findDeltaRect_(x, y);
+  if (rect) {
+    return rect.xPath2.p + ' ' + rect.xPath2.w + 'x' + rect.xPath2.h;
   } else {
     return '';
   }
@@ -59,11 +59,11 @@ bots.dashboard.DetailPage = function() {
   this.response = null;
 
   /**
-   * List of element delta's used in overlay.
+   * List of element delta rectangles used in overlay.
    * @type {Array}
    * @private
    */
-  this.deltaTable_ = [];
+  this.deltaRects_ = [];
 
   /**
    * List of server responses for differences of elements on the page.
@@ -689,20 +689,40 @@ bots.dashboard.DetailPage.prototype.renderResults_ = function(
   for (var i = 0; i < diffs.length; i++) {
     var diff = diffs[i];
     for (var j = 0; j < diff.length; j++) {
-      var x = diff[j][0];
-      var y = diff[j][1];
-
-      graphicsContext.drawRect(x, y, 1, 1, null, fillColor);
-
-     if (!this.deltaTable_[y]) {
-          this.deltaTable_[y] = [];
-     }
-     this.deltaTable_[y][x] = {
-       'xPath1': diff[i][2],
-       'xPath2': diff[i][3]
-     };
-   }
+      // Each diff is an [x, y, width, height, node1, node2] rectangle.
+      var rect = {
+        'x': diff[j][0],
+        'y': diff[j][1],
+        'w': diff[j][2],
+        'h': diff[j][3],
+        'xPath1': diff[j][4],
+        'xPath2': diff[j][5]
+      };
+
+      graphicsContext.drawRect(rect.x, rect.y, rect.w, rect.h, null,
+                               fillColor);
+      this.deltaRects_.push(rect);
+    }
+  }
+};
+
+
+/**
+ * Finds the delta rectangle covering the given pixel.
+ * @param {number} x The x coordinate of the pixel.
+ * @param {number} y The y coordinate of the pixel.
+ * @return {Object} The delta rectangle, or null if there is none.
+ * @private
+ */
+bots.dashboard.DetailPage.prototype.findDeltaRect_ = function(x, y) {
+  for (var i = 0; i < this.deltaRects_.length; i++) {
+    var rect = this.deltaRects_[i];
+    if (x >= rect.x && x < rect.x + rect.w &&
+        y >= rect.y && y < rect.y + rect.h) {
+      return rect;
+    }
   }
+  return null;
 };
 
 
@@ -788,13 +808,14 @@ bots.dashboard.DetailPage.prototype.showElementInfo_ = function(e) {
     var y = e.offsetY;
   }
 
-  if (this.deltaTable_[y] && this.deltaTable_[y][x]) {
+  var rect = this.findDeltaRect_(x, y);
+  if (rect) {
     this.addElementLabel_(this.TEST_BROWSER_LABEL_CONTAINER_ID,
         this.TEST_ELEMENT_DATA_ID,
-        this.parseXPath(this.deltaTable_[y][x]['xPath1']));
+        this.parseXPath(rect['xPath1']));
     this.addElementLabel_(this.REF_BROWSER_LABEL_CONTAINER_ID,
         this.REF_ELEMENT_DATA_ID,
-        this.parseXPath(this.deltaTable_[y][x]['xPath2']));
+        this.parseXPath(rect['xPath2']));
   }
 };
 
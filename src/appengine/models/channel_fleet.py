@@ -0,0 +1,98 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Channel fleet model.
+
+This model describes the machines of a test run that process the work items
+of one browser channel, so the fleet can be resized while the run progresses.
+"""
+
+
+
+
+from google.appengine.ext import db
+
+from common import enum
+
+
+class ChannelFleet(db.Model):
+  """Describes the fleet of machines of a test run for a browser channel.
+
+  Attributes:
+    token: A string representing the token of the test run.
+    os: An integer indicating the operating system of the machines. The
+      integer is from the enum.OS enum.
+    browser: An integer indicating the browser of the machines. The integer is
+      from the enum.BROWSER enum.
+    channel: A string representing the browser channel of the machines.
+    browser_version: A string representing the browser version of the work
+      items of the channel.
+    download_info: A string representing the information necessary for
+      calculating the version and browser download url for the machines.
+    deadline: The date and time by which the work items should be processed.
+    min_machines: An integer representing the minimum number of machines of
+      the fleet while work items are queued.
+    max_machines: An integer representing the maximum number of machines of
+      the fleet.
+    last_scaled_time: The last date and time that machines were started or
+      stopped for the fleet.
+    active: A boolean indicating whether the fleet is still resized.
+  """
+  token = db.StringProperty()
+  os = db.IntegerProperty(choices=enum.OS.ListEnumValues())
+  browser = db.IntegerProperty(choices=enum.BROWSER.ListEnumValues())
+  channel = db.StringProperty()
+  browser_version = db.StringProperty()
+  download_info = db.TextProperty()
+  deadline = db.DateTimeProperty()
+  min_machines = db.IntegerProperty(default=0)
+  max_machines = db.IntegerProperty(default=0)
+  last_scaled_time = db.DateTimeProperty()
+  active = db.BooleanProperty(default=True)
+
+
+def GetKeyName(token, os, browser, channel):
+  """Return the key name of the fleet of a test run for a browser channel."""
+  return '%s_%d_%d_%s' % (token, os, browser, channel)
+
+
+def GetActiveFleets():
+  """Return the fleets that are still resized.
+
+  Returns:
+    A list of ChannelFleet objects.
+  """
+  query = db.Query(ChannelFleet)
+  query.filter('active =', True)
+  return [fleet for fleet in query]
+
+
+def DeactivateFleets(token):
+  """Stop resizing the fleets of a test run.
+
+  Args:
+    token: A string representing the token of the test run.
+  """
+  query = db.Query(ChannelFleet)
+  query.filter('token =', token)
+  query.filter('active =', True)
+
+  fleets = []
+  for fleet in query:
+    fleet.active = False
+    fleets.append(fleet)
+  db.put(fleets)
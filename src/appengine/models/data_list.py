@@ -30,9 +30,16 @@ from django.utils import simplejson
 
 from google.appengine.ext import db
 
+from common import delta_regions
+from common import layout_pack
+from common import layout_rle
+
 
 NUM_ENTRIES = 64
 
+# Maximum number of entries written by a single datastore put.
+PUT_BATCH_SIZE = 16
+
 
 #TODO(user): Simplify Models by getting rid of DataList all together.
 class DataList(db.Model):
@@ -54,7 +61,8 @@ class DataList(db.Model):
     else:
       return '%s_entry_%d' % (self.key().id_or_name(), index)
 
-  def AddEntry(self, index, data, dynamic_content_flag=False):
+  def AddEntry(self, index, data, dynamic_content_flag=False,
+               content_format=None, length=None, content_hash=None):
     """Create a new DataListEntry.
 
     Args:
@@ -62,6 +70,11 @@ class DataList(db.Model):
       data: Data to store.
       dynamic_content_flag: Flag to represent dynamic content related
           DataListEntry.
+      content_format: Optional string describing the format of the data (e.g.
+          layout_rle.LAYOUT_FORMAT_RLE). None indicates the legacy format.
+      length: Optional length of the entry (e.g. the number of pixels covered
+          by the data). Defaults to the number of items in the data.
+      content_hash: Optional fingerprint of the data (see content_hash).
 
     Returns:
       Created DataListEntry entity.
@@ -70,10 +83,63 @@ class DataList(db.Model):
     entry = DataListEntry.get_or_insert(key_name=entry_key_name,
                                         list=self, order=index)
     entry.content = simplejson.dumps(data)
-    entry.length = len(data)
+    if length is None:
+      length = len(data)
+    entry.length = length
+    entry.content_format = content_format
+    entry.content_hash = content_hash
     entry.put()
     return entry
 
+  def CreatePackedEntry(self, index, data, content_hash=None):
+    """Creates a DataListEntry holding a packed layout piece without storing it.
+
+    Args:
+      index: Index of DataListEntry.
+      data: A packed layout piece (see layout_pack).
+      content_hash: Optional fingerprint of the data (see content_hash).
+
+    Returns:
+      Unsaved DataListEntry entity.
+
+    Raises:
+      layout_pack.LayoutPackError: The data is not a packed layout piece.
+    """
+    num_rows = layout_pack.ReadHeader(data)[2]
+    return DataListEntry(
+        key_name=self._GetEntryKeyName(index), list=self, order=index,
+        content='', content_blob=db.Blob(data), length=num_rows,
+        content_format=layout_pack.LAYOUT_FORMAT_PACKED,
+        content_hash=content_hash)
+
+  def CreateEntry(self, index, data, dynamic_content_flag=False,
+                  content_format=None, length=None, content_hash=None):
+    """Creates a DataListEntry without storing it.
+
+    The entry has the same key as the one created by AddEntry, so storing it
+    (e.g. with PutEntries) replaces any existing entry at the given index.
+
+    Args:
+      index: Index of DataListEntry.
+      data: Data to store.
+      dynamic_content_flag: Flag to represent dynamic content related
+          DataListEntry.
+      content_format: Optional string describing the format of the data.
+      length: Optional length of the entry. Defaults to the number of items in
+          the data.
+      content_hash: Optional fingerprint of the data (see content_hash).
+
+    Returns:
+      Unsaved DataListEntry entity.
+    """
+    if length is None:
+      length = len(data)
+    return DataListEntry(
+        key_name=self._GetEntryKeyName(index, dynamic_content_flag),
+        list=self, order=index, content=simplejson.dumps(data),
+        length=length, content_format=content_format,
+        content_hash=content_hash)
+
   def GetEntryData(self, index):
     """Retrieves DataListEntry stored at the given index.
 
@@ -89,12 +155,84 @@ class DataList(db.Model):
     else:
       return []
 
+  def GetEntryRects(self, index):
+    """Retrieves the delta stored at the given index as rectangles.
+
+    Entries in the legacy per-pixel delta format are converted on the fly.
+
+    Args:
+      index: Index of DataListEntry.
+
+    Returns:
+      A list of [x, y, width, height, nid1, nid2] rectangles (see
+      delta_regions).
+    """
+    entry = self.data_entries.filter('order =', index).get()
+    if entry and entry.content:
+      return delta_regions.ToRects(simplejson.loads(entry.content),
+                                   entry.content_format)
+    else:
+      return []
+
+  def GetEntry(self, index):
+    """Retrieves the DataListEntry stored at the given index, or None."""
+    return self.data_entries.filter('order =', index).get()
+
+  def GetEntryRuns(self, index):
+    """Retrieves the layout rows stored at the given index as run lengths.
+
+    Entries in the legacy dense layout format are run-length encoded on the
+    fly, so callers can always walk the rows run against run.
+
+    Args:
+      index: Index of DataListEntry.
+
+    Returns:
+      A list of run-length encoded layout rows (see layout_rle).
+    """
+    entry = self.GetEntry(index)
+    if entry:
+      return entry.GetRuns()
+    else:
+      return []
+
+  def GetEntries(self, indices):
+    """Retrieves the DataListEntries at the given indices by key.
+
+    Args:
+      indices: A list of entry indices.
+
+    Returns:
+      A dictionary of entry index to DataListEntry, without the indices that
+      have no entry.
+    """
+    key_names = [self._GetEntryKeyName(index) for index in indices]
+    entries = {}
+    for index, entry in zip(indices,
+                            DataListEntry.get_by_key_name(key_names)):
+      if entry:
+        entries[index] = entry
+    return entries
+
   def ClearEntries(self):
     """Deletes all DataListEntries."""
     entries = self.data_entries.fetch(100)
     if entries:
       db.delete(entries)
 
+  def GetReceivedEntries(self):
+    """Lists the indices of the DataListEntries that are stored.
+
+    The entries are fetched by key rather than queried, so an entry is listed
+    as soon as its put has completed.
+
+    Returns:
+      A sorted list of entry indices.
+    """
+    key_names = [self._GetEntryKeyName(index) for index in range(NUM_ENTRIES)]
+    entries = DataListEntry.get_by_key_name(key_names)
+    return [index for index in range(NUM_ENTRIES) if entries[index]]
+
   def EntriesReady(self):
     """Checks if all the DataListEntries are received or not."""
     return self.data_entries.count() == NUM_ENTRIES
@@ -105,7 +243,24 @@ class DataListEntry(db.Model):
   list = db.ReferenceProperty(DataList, collection_name='data_entries')
   order = db.IntegerProperty()
   content = db.TextProperty(default='')
+  # Number of items in the content, or number of pixels for region deltas.
   length = db.IntegerProperty(default=0)
+  # Format of the content. None indicates the legacy (dense) format.
+  content_format = db.StringProperty(default=None)
+  # Fingerprint of the content as it was received (see content_hash).
+  content_hash = db.StringProperty(default=None)
+  # Binary content, used instead of content by packed layout pieces.
+  content_blob = db.BlobProperty(default=None)
+
+  def GetRuns(self):
+    """Returns the layout rows of the entry as run lengths (see layout_rle)."""
+    if self.content_format == layout_pack.LAYOUT_FORMAT_PACKED:
+      return layout_pack.Decode(self.content_blob)
+    elif self.content:
+      return layout_rle.ToRuns(simplejson.loads(self.content),
+                               self.content_format)
+    else:
+      return []
 
 
 def CreateEmptyDataList():
@@ -119,6 +274,17 @@ def CreateEmptyDataList():
   return data_list
 
 
+def PutEntries(entries, batch_size=PUT_BATCH_SIZE):
+  """Stores DataListEntry entities with batched datastore puts.
+
+  Args:
+    entries: A list of DataListEntry entities (see DataList.CreateEntry).
+    batch_size: The maximum number of entities per put.
+  """
+  for i in range(0, len(entries), batch_size):
+    db.put(entries[i:i + batch_size])
+
+
 def CreateDataListIndex(data_list):
   """Create a list to show which data list indices have data list entries.
 
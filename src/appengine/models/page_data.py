@@ -30,6 +30,9 @@ from django.utils import simplejson
 
 from google.appengine.ext import db
 
+from common import nodes_table
+from common import nodes_table_cache
+
 #Unused import warning.
 #pylint: disable-msg=W0611
 from models import browser
@@ -51,8 +54,9 @@ class PageData(db.Model):
 
   # Nodes table stores information about each element in an array. Array index
   # is uniqueID of an element. width, height, x, y, xpath/selector
-  # information is stored in dictionary object. The nodes_table may be stored
-  # as a base64-encoded, gzipped string.
+  # information is stored in dictionary object, or in columns by newer clients
+  # (see nodes_table.FromColumns). The nodes_table may be stored as a
+  # base64-encoded, gzipped string.
   # nodes_table[uniqueIDOfElement] = {
   #                                  'w': node.offsetWidth,
   #                                  'h': node.offsetHeight,
@@ -62,6 +66,9 @@ class PageData(db.Model):
   #                                  }
   nodes_table = db.TextProperty()
 
+  # Fingerprint of the nodes table as it was received (see content_hash).
+  nodes_table_hash = db.StringProperty(default=None)
+
   # Dynamic Content table stores information about various dynamic content
   # (like ads) on the page. Currently it stores this info in array of element
   # ids (aka uniqueIDOfElement).
@@ -72,12 +79,25 @@ class PageData(db.Model):
   # of this collection is stored as DataList.
   layout_table = db.ReferenceProperty(data_list.DataList)
 
+  # Fingerprints of the layout table pieces as they were received, indexed by
+  # piece (see content_hash). Identical captures are found without fetching
+  # the pieces. Bundles set them when they are stored, page data uploaded
+  # piece by piece once they are first needed (see GetLayoutHashes).
+  layout_hashes = db.StringListProperty()
+
+  # Format of the layout table rows sent by the client (see layout_rle). None
+  # indicates the legacy dense format with one node id per pixel.
+  layout_format = db.StringProperty(default=None)
+
   # Page width.
   width = db.IntegerProperty()
 
   # Page Height.
   height = db.IntegerProperty()
 
+  # Seconds the client waited for the page to be ready before capturing it.
+  load_time = db.FloatProperty(default=None)
+
   # Reference to page screenshot.
   screenshot = db.ReferenceProperty(screenshot.Screenshot)
 
@@ -102,6 +122,28 @@ class PageData(db.Model):
     """
     return self.layout_table and self.layout_table.EntriesReady()
 
+  def GetLayoutHashes(self):
+    """Returns the fingerprints of the layout table pieces.
+
+    The pieces of page data uploaded piece by piece are stored concurrently,
+    so their fingerprints are read from the pieces once all of them are
+    stored, and kept with the page data.
+
+    Returns:
+      A list of the fingerprints indexed by piece, empty if the layout table is
+      not complete.
+    """
+    if self.layout_hashes or not self.layout_table:
+      return self.layout_hashes
+
+    entries = self.layout_table.GetEntries(range(data_list.NUM_ENTRIES))
+    if len(entries) < data_list.NUM_ENTRIES:
+      return []
+    self.layout_hashes = [entries[index].content_hash or ''
+                          for index in range(data_list.NUM_ENTRIES)]
+    db.run_in_transaction(_SetLayoutHashes, self.key(), self.layout_hashes)
+    return self.layout_hashes
+
   def DeleteLayoutTable(self):
     """Deletes layout-table info by deleting datalist and datalist entries."""
     if self.layout_table:
@@ -122,13 +164,28 @@ class PageData(db.Model):
     db.delete(results)
 
   def GetNodesTable(self):
-    """Return the nodes table and convert it from encoded format if necessary.
+    """Return the decoded nodes table.
+
+    Decoded nodes tables are cached (see nodes_table_cache), so the stored data
+    is only decoded once per page data.
+
+    Returns:
+      A nodes_table.NodesTable object, which can be indexed by node id like the
+      decoded list of node dictionaries.
+    """
+    if not self.is_saved():
+      return nodes_table.FromData(self._DecodeNodesTable())
+    return nodes_table_cache.Get(str(self.key()), self._DecodeNodesTable)
+
+  def _DecodeNodesTable(self):
+    """Decodes the nodes table from its stored format.
 
     The nodes_table data may be stored in base64-encoded, gzipped format. This
     function checks if the data is encoded and decodes it if necessary.
 
     Returns:
-      A dictionary representing the nodes table data.
+      The decoded JSON nodes table: a list of node dictionaries, or a
+      dictionary of columns (see nodes_table.FromColumns).
     """
     # Check if nodes table is compressed
     if '{' in self.nodes_table:
@@ -136,3 +193,10 @@ class PageData(db.Model):
     else:
       return simplejson.loads(
           zlib.decompress(base64.b64decode(self.nodes_table)))
+
+
+def _SetLayoutHashes(key, layout_hashes):
+  """Stores the fingerprints of the layout table pieces, in a transaction."""
+  test_data = db.get(key)
+  test_data.layout_hashes = layout_hashes
+  test_data.put()
@@ -25,6 +25,8 @@ entity, which is used for comparison view between page data.
 
 
 from common import enum
+from common import geometry_compare
+from common import node_index
 from django.utils import simplejson
 from google.appengine.ext import db
 
@@ -101,8 +103,12 @@ class PageDelta(db.Model):
         (e.g. Ads) (Reference Property).
     dynamic_content_index: A JSON string indicating which dynamic content data
         list indices have information.
+    node_index_data: Serialized node_index.NodeIndex for the test and ref
+        nodes tables, built once and shared by every comparison task.
     score: Computed layout score. Score indicates layout similarity at DOM pixel
         level. Negative score indicates comparison is not done yet.
+    approx_score: Approximate layout score computed from the nodes tables only
+        (see geometry_compare). Negative score indicates it was not computed.
     date: DateTime when comparison was done.
     compare_key: Unique reference key, solely created for faster lookup of
         compared results across runs.
@@ -136,7 +142,9 @@ class PageDelta(db.Model):
   dynamic_content = db.ReferenceProperty(data_list.DataList,
                                          collection_name='dynamic_content')
   dynamic_content_index = db.StringProperty()
+  node_index_data = db.BlobProperty(default=None)
   score = db.FloatProperty(default=-1.0)
+  approx_score = db.FloatProperty(default=-1.0)
   date = db.DateTimeProperty(auto_now_add=True)
   compare_key = db.ReferenceProperty(UniqueKey,
                                      collection_name='unique_compare_keys')
@@ -178,6 +186,26 @@ class PageDelta(db.Model):
       self.put()
     return self.site.url
 
+  def GetNodeIndex(self):
+    """Retrieves the node index associated with page-delta.
+
+    If the node index is not available for page-delta (or can't be read), then
+    it builds it first from the test and ref nodes tables and stores it back.
+
+    Returns:
+      A node_index.NodeIndex object.
+    """
+    if self.node_index_data:
+      try:
+        return node_index.Deserialize(self.node_index_data)
+      except node_index.NodeIndexError:
+        pass
+    index = node_index.Build(self.test_data.GetNodesTable(),
+                             self.ref_data.GetNodesTable())
+    self.node_index_data = db.Blob(index.Serialize())
+    self.put()
+    return index
+
   def CalculateElemCount(self):
     """Calculates and updates various element count for test and ref data.
 
@@ -185,21 +213,18 @@ class PageDelta(db.Model):
     calculate it for test and ref data and update the entity.
     """
     if not self.ref_data_total_elem_count:
-      ref_nodes_table = self.ref_data.GetNodesTable()
-      self.ref_data_total_elem_count = len(ref_nodes_table)
-      test_nodes_table = self.test_data.GetNodesTable()
-      self.test_data_total_elem_count = len(test_nodes_table)
+      index = self.GetNodeIndex()
+      self.ref_data_total_elem_count = index.GetRefNodeCount()
+      self.test_data_total_elem_count = index.GetTestNodeCount()
       if not self.delta_index:
         self.CreateIndices()
-      unmatched_layout_table_part = []
-      delta_index = simplejson.loads(self.delta_index)
-      for i in delta_index:
-        unmatched_layout_table_part.extend(self.delta.GetEntryData(i))
       test_unmatched_elem_set = set()
       ref_unmatched_elem_set = set()
-      for pix in unmatched_layout_table_part:
-        test_unmatched_elem_set.add(pix[2])
-        ref_unmatched_elem_set.add(pix[3])
+      delta_index = simplejson.loads(self.delta_index)
+      for i in delta_index:
+        for rect in self.delta.GetEntryRects(i):
+          test_unmatched_elem_set.add(rect[4])
+          ref_unmatched_elem_set.add(rect[5])
       self.test_data_unmatched_elem_count = len(test_unmatched_elem_set)
       self.ref_data_unmatched_elem_count = len(ref_unmatched_elem_set)
       self.put()
@@ -304,7 +329,8 @@ class PageDelta(db.Model):
     """Computes and stores layout score."""
     if self.delta.EntriesReady():
       count = 0
-      # Let's count the length of differences (pixel difference).
+      # Let's count the length of differences (pixel difference). The length
+      # of an entry is the number of pixels it covers in every delta format.
       for entry in self.delta.data_entries:
         count += entry.length
 
@@ -313,6 +339,36 @@ class PageDelta(db.Model):
       self.score = 100.0 - self._ComputePercentDifferent(count)
       self.put()
 
+  def ComputeApproxScore(self, threshold):
+    """Computes and stores the approximate layout score.
+
+    If the approximate score is at least the given threshold it is also used as
+    the layout score, and the element counts are taken from the node matching,
+    so that no pixel comparison is needed.
+
+    Args:
+      threshold: The minimum approximate score that completes the comparison.
+
+    Returns:
+      True if the comparison was completed with the approximate score.
+    """
+    test_nodes_table = self.test_data.GetNodesTable()
+    ref_nodes_table = self.ref_data.GetNodesTable()
+    area, test_mismatched, ref_mismatched = geometry_compare.Compare(
+        test_nodes_table, ref_nodes_table, self.ref_data.width,
+        self.ref_data.height)
+    self.approx_score = max(0.0, 100.0 - self._ComputePercentDifferent(area))
+
+    completed = self.approx_score >= threshold
+    if completed:
+      self.score = self.approx_score
+      self.test_data_total_elem_count = len(test_nodes_table)
+      self.ref_data_total_elem_count = len(ref_nodes_table)
+      self.test_data_unmatched_elem_count = len(test_mismatched)
+      self.ref_data_unmatched_elem_count = len(ref_mismatched)
+    self.put()
+    return completed
+
   def UpdateComments(self, comments):
     """Updates comments property of page-delta.
 
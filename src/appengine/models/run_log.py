@@ -19,16 +19,58 @@
 
 RunLog model that describes a the result log of a test run. The RunLog entry
 specifies the result for a specific test case instance of a test run.
+
+The queued RunLogs of a test run form a work queue, split in NUM_SHARDS shards
+per browser version. Clients lease work items from the shard picked by their
+instance id first, so concurrent clients query different index ranges, and
+every work item is claimed in a transaction, so it is leased to one client
+only. Leases last a few times the observed duration of the work items of the
+test run (see GetLeaseTime), and the work items whose lease expired are
+requeued or failed by SweepExpiredLeases.
+
+Every status transition of a RunLog is done in a transaction that also counts
+it in the progress counters of the test run (see run_progress).
 """
 
 
 
 
+import datetime
+import zlib
+
 from common import enum
+from common import run_estimate
+from google.appengine.api import memcache
 from google.appengine.ext import db
+from models import run_progress
 from models import url_config
 
 
+# The number of shards of the queue of each test run and browser version.
+NUM_SHARDS = 8
+
+# The number of queued work items fetched per work item to lease, so a lease
+# still succeeds when other clients claim some of the fetched items first.
+CANDIDATES_PER_LEASE = 2
+
+# Leases last LEASE_DURATION_FACTOR times the LEASE_DURATION_PERCENTILE of the
+# durations of the last LEASE_SAMPLE_SIZE finished work items of the test run
+# and browser version, within MIN_LEASE_TIME and MAX_LEASE_TIME. The durations
+# run from the fetch of a work item by the client to its finish, uploads
+# included.
+LEASE_SAMPLE_SIZE = 50
+LEASE_DURATION_PERCENTILE = 0.9
+LEASE_DURATION_FACTOR = 2.0
+MIN_LEASE_TIME = datetime.timedelta(minutes=5)
+MAX_LEASE_TIME = datetime.timedelta(minutes=20)
+# The longest a client can extend a lease for, e.g. while its results are
+# spooled.
+MAX_LEASE_EXTENSION = datetime.timedelta(days=1)
+
+DURATION_STATS_MEMCACHE_KEY_PREFIX = 'duration_stats_'
+DURATION_STATS_MEMCACHE_EXP_TIME_IN_SEC = 5*60
+
+
 class RunLog(db.Model):
   """RunLog model which acts as a queue for test cases.
 
@@ -58,6 +100,12 @@ class RunLog(db.Model):
     end_time: The time when this URL finished being processed.
     duration: An integer count of milliseconds representing the processing
       duration for this URL.
+    lease_expiry: The time by which the client processing this URL is expected
+      to have finished it.
+    shard: An integer representing the queue shard of this log entry, from 0 to
+      NUM_SHARDS - 1.
+    transitions: An integer count of the status transitions of this log entry,
+      which identifies each transition in the progress counters.
   """
   url = db.StringProperty()
   config = db.ReferenceProperty(url_config.UrlConfig,
@@ -77,3 +125,388 @@ class RunLog(db.Model):
   start_time = db.DateTimeProperty()
   end_time = db.DateTimeProperty()
   duration = db.IntegerProperty()
+  lease_expiry = db.DateTimeProperty()
+  shard = db.IntegerProperty()
+  transitions = db.IntegerProperty(default=0)
+
+
+def GetShard(instance_id):
+  """Return the queue shard a client leases its work items from first.
+
+  Args:
+    instance_id: A string that uniquely identifies the client machine.
+
+  Returns:
+    An integer from 0 to NUM_SHARDS - 1.
+  """
+  return (zlib.crc32(instance_id) & 0xffffffff) % NUM_SHARDS
+
+
+def _GetQueuedKeys(token, browser_version, shard, limit):
+  """Return the keys of the next queued work items of a queue shard.
+
+  Args:
+    token: A string that uniquely identifies an instance of a test run.
+    browser_version: A string representing the browser version.
+    shard: An integer representing the shard, or None to query the whole
+      queue, including the work items created before the queue was sharded.
+    limit: The maximum number of keys to return.
+
+  Returns:
+    A list of RunLog keys, in the order to process the work items.
+  """
+  if shard is None:
+    return db.GqlQuery(
+        'SELECT __key__ FROM RunLog WHERE token = :1 AND '
+        'browser_version = :2 AND status = :3 '
+        'ORDER BY creation_time ASC, priority DESC',
+        token, browser_version, enum.CASE_STATUS.QUEUED).fetch(limit)
+  return db.GqlQuery(
+      'SELECT __key__ FROM RunLog WHERE token = :1 AND browser_version = :2 '
+      'AND shard = :3 AND status = :4 '
+      'ORDER BY creation_time ASC, priority DESC',
+      token, browser_version, shard, enum.CASE_STATUS.QUEUED).fetch(limit)
+
+
+def _ClaimWorkItem(key, instance_id, start_time, lease_expiry):
+  """Move a queued work item to IN_PROGRESS, to run in a transaction.
+
+  Args:
+    key: The db.Key of the RunLog to claim.
+    instance_id: A string that uniquely identifies the client machine.
+    start_time: A datetime.datetime object representing the lease time.
+    lease_expiry: A datetime.datetime object representing the lease expiry.
+
+  Returns:
+    The claimed RunLog, or None if it is not queued anymore.
+  """
+  log = db.get(key)
+  if not log or log.status != enum.CASE_STATUS.QUEUED:
+    return None
+
+  log.status = enum.CASE_STATUS.IN_PROGRESS
+  log.client_id = instance_id
+  log.start_time = start_time
+  log.lease_expiry = lease_expiry
+  run_progress.RecordTransition(log, enum.CASE_STATUS.QUEUED)
+  log.put()
+  return log
+
+
+def GetDurationStats(token, browser_version):
+  """Return statistics of the durations of the recently finished work items.
+
+  The statistics are computed from the last LEASE_SAMPLE_SIZE finished work
+  items of the test run and browser version, and cached in memcache.
+
+  Args:
+    token: A string that uniquely identifies an instance of a test run.
+    browser_version: A string representing the browser version.
+
+  Returns:
+    A tuple of the mean and the LEASE_DURATION_PERCENTILE percentile of the
+    durations in milliseconds, or None if no work item has finished yet.
+  """
+  memcache_key = '%s%s_%s' % (DURATION_STATS_MEMCACHE_KEY_PREFIX, token,
+                              browser_version)
+  stats = memcache.get(memcache_key)
+  if stats is None:
+    logs = db.GqlQuery(
+        'SELECT * FROM RunLog WHERE token = :1 AND browser_version = :2 AND '
+        'status = :3 ORDER BY end_time DESC',
+        token, browser_version, enum.CASE_STATUS.FINISHED).fetch(
+            LEASE_SAMPLE_SIZE)
+    durations = sorted([log.duration for log in logs if log.duration])
+
+    # Cache the absence of durations as an empty tuple.
+    stats = ()
+    if durations:
+      index = min(int(len(durations) * LEASE_DURATION_PERCENTILE),
+                  len(durations) - 1)
+      stats = (float(sum(durations)) / len(durations), durations[index])
+    memcache.set(memcache_key, stats, DURATION_STATS_MEMCACHE_EXP_TIME_IN_SEC)
+
+  return stats or None
+
+
+def GetLeaseTime(token, browser_version, default_lease_time):
+  """Return the time allowed to process one work item of a test run.
+
+  The lease time is derived from the durations of the recently finished work
+  items (see GetDurationStats).
+
+  Args:
+    token: A string that uniquely identifies an instance of a test run.
+    browser_version: A string representing the browser version.
+    default_lease_time: A datetime.timedelta object representing the lease
+      time to use until work items of the test run have finished.
+
+  Returns:
+    A datetime.timedelta object.
+  """
+  stats = GetDurationStats(token, browser_version)
+  if not stats:
+    return default_lease_time
+  lease_time = datetime.timedelta(
+      seconds=stats[1] * LEASE_DURATION_FACTOR / 1000.0)
+  return max(MIN_LEASE_TIME, min(lease_time, MAX_LEASE_TIME))
+
+
+def LeaseWorkItems(token, browser_version, instance_id, count, lease_time):
+  """Lease the next queued work items of a test run to a client.
+
+  The shard of the client is queried first, then the other shards in turn,
+  and finally the whole queue for work items without a shard. The client
+  processes its work items one after the other, so each lease expires
+  lease_time after the expected end of the previous one.
+
+  Args:
+    token: A string that uniquely identifies an instance of a test run.
+    browser_version: A string representing the browser version of the client.
+    instance_id: A string that uniquely identifies the client machine.
+    count: An integer representing the maximum number of work items to lease.
+    lease_time: A datetime.timedelta object representing the time allowed to
+      process one work item.
+
+  Returns:
+    A list of the leased RunLog objects, in the order to process them.
+  """
+  first_shard = GetShard(instance_id)
+  shards = [(first_shard + i) % NUM_SHARDS for i in range(NUM_SHARDS)]
+  shards.append(None)
+
+  now = datetime.datetime.now()
+  logs = []
+  for shard in shards:
+    keys = _GetQueuedKeys(token, browser_version, shard,
+                          (count - len(logs)) * CANDIDATES_PER_LEASE)
+    for key in keys:
+      log = db.run_in_transaction(_ClaimWorkItem, key, instance_id, now,
+                                  now + lease_time * (len(logs) + 1))
+      if log:
+        logs.append(log)
+        if len(logs) == count:
+          return logs
+  return logs
+
+
+def IsLeasedTo(key, instance_id):
+  """Return whether a work item is still being processed by a client.
+
+  Args:
+    key: The db.Key, or its string, of the RunLog.
+    instance_id: A string that uniquely identifies the client machine.
+
+  Returns:
+    False if the work item is not IN_PROGRESS for the client anymore, e.g.
+    because its lease expired and it was leased again.
+  """
+  log = db.get(key)
+  return bool(log and log.status == enum.CASE_STATUS.IN_PROGRESS and
+              log.client_id == instance_id)
+
+
+def _ExtendLease(key, instance_id, lease_expiry):
+  """Move the lease expiry of a work item, to run in a transaction.
+
+  Args:
+    key: The db.Key of the RunLog.
+    instance_id: A string that uniquely identifies the client machine holding
+      the work item.
+    lease_expiry: A datetime.datetime object representing the new expiry. The
+      lease is never shortened.
+
+  Returns:
+    True if the lease was extended, False if the client does not hold it.
+  """
+  log = db.get(key)
+  if (not log or log.status != enum.CASE_STATUS.IN_PROGRESS or
+      log.client_id != instance_id):
+    return False
+
+  if not log.lease_expiry or log.lease_expiry < lease_expiry:
+    log.lease_expiry = lease_expiry
+    log.put()
+  return True
+
+
+def ExtendLease(key, instance_id, extension):
+  """Keep a work item leased to a client for longer.
+
+  Args:
+    key: The db.Key of the RunLog.
+    instance_id: A string that uniquely identifies the client machine.
+    extension: A datetime.timedelta object representing the time from now the
+      work item should stay leased for, up to MAX_LEASE_EXTENSION.
+
+  Returns:
+    True if the lease was extended, False if the client does not hold it.
+  """
+  lease_expiry = datetime.datetime.now() + min(extension, MAX_LEASE_EXTENSION)
+  return db.run_in_transaction(_ExtendLease, key, instance_id, lease_expiry)
+
+
+def _ReleaseWorkItem(key, instance_id):
+  """Move a leased work item back to QUEUED, to run in a transaction.
+
+  Args:
+    key: The db.Key of the RunLog to release.
+    instance_id: A string that uniquely identifies the client machine holding
+      the work item.
+
+  Returns:
+    True if the work item was released, False if the client does not hold it.
+  """
+  log = db.get(key)
+  if (not log or log.status != enum.CASE_STATUS.IN_PROGRESS or
+      log.client_id != instance_id):
+    return False
+
+  log.status = enum.CASE_STATUS.QUEUED
+  log.client_id = ''
+  log.start_time = None
+  log.lease_expiry = None
+  run_progress.RecordTransition(log, enum.CASE_STATUS.IN_PROGRESS)
+  log.put()
+  return True
+
+
+def ReleaseWorkItems(keys, instance_id):
+  """Give work items that a client leased but did not process back to the queue.
+
+  Args:
+    keys: A list of the db.Key objects of the RunLogs to release.
+    instance_id: A string that uniquely identifies the client machine.
+
+  Returns:
+    The number of work items released.
+  """
+  released = 0
+  for key in keys:
+    if db.run_in_transaction(_ReleaseWorkItem, key, instance_id):
+      released += 1
+  return released
+
+
+def _ExpireLease(key, now):
+  """Requeue or fail a work item whose lease expired, to run in a transaction.
+
+  Args:
+    key: The db.Key of the RunLog.
+    now: A datetime.datetime object representing the current time.
+
+  Returns:
+    True if the lease was expired, False if the work item was finished or its
+    lease renewed in the meantime.
+  """
+  log = db.get(key)
+  if (not log or log.status != enum.CASE_STATUS.IN_PROGRESS or
+      not log.lease_expiry or log.lease_expiry > now):
+    return False
+
+  # Ensure that the work item can be retried.
+  if log.retry_count > 0:
+    log.retry_count -= 1
+    log.status = enum.CASE_STATUS.QUEUED
+    log.client_id = ''
+    log.start_time = None
+    log.priority -= 1
+  else:
+    log.status = enum.CASE_STATUS.TIMEOUT_ERROR
+  log.lease_expiry = None
+  run_progress.RecordTransition(log, enum.CASE_STATUS.IN_PROGRESS)
+  log.put()
+  return True
+
+
+def SweepExpiredLeases(now, limit):
+  """Requeue or fail a batch of the work items whose lease expired.
+
+  Args:
+    now: A datetime.datetime object representing the current time.
+    limit: The maximum number of work items to process.
+
+  Returns:
+    The number of expired leases found, at most limit.
+  """
+  keys = db.GqlQuery(
+      'SELECT __key__ FROM RunLog WHERE status = :1 AND lease_expiry < :2 '
+      'ORDER BY lease_expiry ASC',
+      enum.CASE_STATUS.IN_PROGRESS, now).fetch(limit)
+  for key in keys:
+    db.run_in_transaction(_ExpireLease, key, now)
+  return len(keys)
+
+
+def _RequeueWorkItem(key, instance_id):
+  """Requeue or fail a work item of an unresponsive client, in a transaction.
+
+  Args:
+    key: The db.Key of the RunLog.
+    instance_id: A string that uniquely identifies the client machine.
+
+  Returns:
+    True if the work item was requeued or failed, False if the client does
+    not hold it anymore.
+  """
+  log = db.get(key)
+  if (not log or log.status != enum.CASE_STATUS.IN_PROGRESS or
+      log.client_id != instance_id):
+    return False
+
+  # Ensure that the work item can be retried.
+  if log.retry_count > 0:
+    log.retry_count -= 1
+    log.status = enum.CASE_STATUS.QUEUED
+    log.client_id = ''
+    log.lease_expiry = None
+    log.priority -= 1
+  else:
+    log.status = enum.CASE_STATUS.UNKNOWN_ERROR
+  run_progress.RecordTransition(log, enum.CASE_STATUS.IN_PROGRESS)
+  log.put()
+  return True
+
+
+def RequeueWorkItems(instance_id):
+  """Requeue or fail the work items being processed by a client.
+
+  Unlike ReleaseWorkItems, requeueing a work item counts as a retry.
+
+  Args:
+    instance_id: A string that uniquely identifies the client machine.
+
+  Returns:
+    The number of work items requeued or failed.
+  """
+  query = RunLog.all(keys_only=True)
+  query.filter('status =', enum.CASE_STATUS.IN_PROGRESS)
+  query.filter('client_id =', instance_id)
+
+  requeued = 0
+  for key in query:
+    if db.run_in_transaction(_RequeueWorkItem, key, instance_id):
+      requeued += 1
+  return requeued
+
+
+def _ExpireWorkItem(key):
+  """Move an unfinished work item to EXPIRED, to run in a transaction."""
+  log = db.get(key)
+  if not log or log.status not in run_estimate.REMAINING_STATUSES:
+    return
+  old_status = log.status
+  log.status = enum.CASE_STATUS.EXPIRED
+  log.lease_expiry = None
+  run_progress.RecordTransition(log, old_status)
+  log.put()
+
+
+def ExpireWorkItems(keys):
+  """Expire the work items that are not finished yet.
+
+  Args:
+    keys: A list of the db.Key objects of the RunLogs to expire.
+  """
+  for key in keys:
+    db.run_in_transaction(_ExpireWorkItem, key)
@@ -0,0 +1,184 @@
+#!/usr/bin/python2.4
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Run progress model.
+
+The number of RunLogs of a test run in each status is kept per browser version
+in sharded counters, so the progress of a run is read without scanning its
+RunLogs. The RunLog entries are not in the entity group of the counters, so
+every status transition queues a transactional task that updates the counters
+(see RecordTransition): the counters change if and only if the transition is
+committed.
+
+Tasks may run more than once, so every update has an id, and is applied once:
+the shard of an update is picked from its id, and the id is stored in the
+entity group of the shard with the update (see UpdateCounts).
+"""
+
+
+
+
+import zlib
+
+from google.appengine.ext import db
+from google.appengine.ext import deferred
+
+from common import enum
+
+
+# The number of counter shards per test run and browser version. Updates are
+# spread over the shards by their id, so concurrent updates rarely contend.
+NUM_SHARDS = 20
+PROGRESS_QUEUE = 'progress'
+
+
+class RunProgressShard(db.Model):
+  """One shard of the status counters of a test run and browser version.
+
+  Attributes:
+    token: A string representing the token of the test run.
+    browser_version: A string representing the browser version.
+    counts: A list of integers, the number of RunLogs counted by this shard in
+      each status, indexed by the enum.CASE_STATUS value.
+    creation_time: The date and time at which this shard was created.
+  """
+  token = db.StringProperty()
+  browser_version = db.StringProperty()
+  counts = db.ListProperty(int)
+  creation_time = db.DateTimeProperty(auto_now_add=True)
+
+
+class RunProgressUpdate(db.Model):
+  """Records that an update was applied, in the entity group of its shard.
+
+  The key name of the entity is the id of the update.
+
+  Attributes:
+    creation_time: The date and time at which the update was applied.
+  """
+  creation_time = db.DateTimeProperty(auto_now_add=True)
+
+
+def _GetShardKeyName(token, browser_version, shard):
+  return '%s_%s_%d' % (token, browser_version, shard)
+
+
+def _UpdateCounts(token, browser_version, deltas, update_id):
+  """Apply an update to its shard once, to run in a transaction."""
+  key_name = _GetShardKeyName(token, browser_version,
+                              (zlib.crc32(update_id) & 0xffffffff) % NUM_SHARDS)
+  shard_key = db.Key.from_path(RunProgressShard.kind(), key_name)
+  if RunProgressUpdate.get_by_key_name(update_id, parent=shard_key):
+    return
+
+  shard = RunProgressShard.get(shard_key)
+  if not shard:
+    shard = RunProgressShard(key_name=key_name, token=token,
+                             browser_version=browser_version)
+
+  counts = shard.counts + [0] * (len(enum.CASE_STATUS.ListEnumValues()) -
+                                 len(shard.counts))
+  for status, delta in deltas.items():
+    counts[status] += delta
+  shard.counts = counts
+  db.put([shard, RunProgressUpdate(key_name=update_id, parent=shard_key)])
+
+
+def UpdateCounts(token, browser_version, deltas, update_id):
+  """Add to the status counters of a test run and browser version, once.
+
+  Args:
+    token: A string representing the token of the test run.
+    browser_version: A string representing the browser version.
+    deltas: A dictionary from enum.CASE_STATUS values to the integer to add to
+      the count of the status.
+    update_id: A string that uniquely identifies the update within the test
+      run and browser version. An update with the id of an update that was
+      applied already is ignored.
+  """
+  db.run_in_transaction(_UpdateCounts, token, browser_version, deltas,
+                        update_id)
+
+
+def RecordTransition(log, old_status):
+  """Count the status transition of a RunLog.
+
+  This must be called in the transaction that puts the RunLog, before the
+  put: the transition is numbered in the RunLog to identify the update.
+
+  Args:
+    log: The run_log.RunLog object, with its new status.
+    old_status: An integer representing the enum.CASE_STATUS value of the
+      RunLog before the transition.
+  """
+  if log.status == old_status:
+    return
+  log.transitions = (log.transitions or 0) + 1
+  deferred.defer(UpdateCounts, log.token, log.browser_version,
+                 {old_status: -1, log.status: 1},
+                 '%s_%d' % (log.key(), log.transitions),
+                 _queue=PROGRESS_QUEUE, _transactional=True)
+
+
+def _SumShards(shards):
+  """Return the total counts of a list of RunProgressShard objects."""
+  counts = [0] * len(enum.CASE_STATUS.ListEnumValues())
+  for shard in shards:
+    for status, count in enumerate(shard.counts):
+      counts[status] += count
+  return counts
+
+
+def GetCounts(token, browser_version):
+  """Return the number of RunLogs of a test run in each status.
+
+  Args:
+    token: A string representing the token of the test run.
+    browser_version: A string representing the browser version.
+
+  Returns:
+    A list of integers indexed by the enum.CASE_STATUS values.
+  """
+  key_names = [_GetShardKeyName(token, browser_version, i)
+               for i in range(NUM_SHARDS)]
+  shards = RunProgressShard.get_by_key_name(key_names)
+  return _SumShards([shard for shard in shards if shard])
+
+
+def GetRunCounts(token):
+  """Return the status counters of all the browser versions of a test run.
+
+  Args:
+    token: A string representing the token of the test run.
+
+  Returns:
+    A dictionary from the browser versions to tuples of the list of the counts
+    indexed by the enum.CASE_STATUS values and the datetime.datetime at which
+    the first RunLogs were counted.
+  """
+  query = db.Query(RunProgressShard)
+  query.filter('token =', token)
+
+  shards = {}
+  for shard in query:
+    shards.setdefault(shard.browser_version, []).append(shard)
+
+  run_counts = {}
+  for browser_version, version_shards in shards.items():
+    start_time = min([shard.creation_time for shard in version_shards])
+    run_counts[browser_version] = (_SumShards(version_shards), start_time)
+  return run_counts
@@ -27,10 +27,18 @@ content of the JPG image.
 
 import base64
 
+from google.appengine.api import files
 from google.appengine.ext import blobstore
 from google.appengine.ext import db
 
 
+# Images larger than this are written to blobstore instead of the entity, which
+# is limited to 1MB.
+MAX_INLINE_IMAGE_SIZE = 900000
+# Thumbnails are always kept in the entity; larger ones are dropped.
+MAX_THUMBNAIL_SIZE = 100000
+
+
 class Screenshot(db.Model):
   """Stores the data URL of the screenshot image."""
   # TODO(user): Remove the deprecated src_data field and use the blob data.
@@ -38,6 +46,11 @@ class Screenshot(db.Model):
   image_data = blobstore.BlobReferenceProperty()
   # Data duplication as a work around for screenshot blobstore missing issue.
   pagedata_ref = db.StringProperty(default=None)
+  # MIME type of src_data. None indicates the legacy JPG data.
+  mime_type = db.StringProperty(default=None)
+  # Small version of the image sent by the client, if any.
+  thumbnail = db.BlobProperty(default=None)
+  thumbnail_mime_type = db.StringProperty(default=None)
 
 
 def GetDecodedContent(src):
@@ -70,6 +83,43 @@ def AddScreenshot(src):
     return screenshot_image
 
 
+def CreateScreenshot(image, mime_type, thumbnail=None,
+                     thumbnail_mime_type=None):
+  """Creates a screenshot from binary image data without storing it.
+
+  Small images are kept in the entity, larger ones are written to blobstore.
+
+  Args:
+    image: A string representing the binary image data.
+    mime_type: A string representing the MIME type of the image.
+    thumbnail: An optional string representing the binary thumbnail data.
+    thumbnail_mime_type: An optional string representing the MIME type of the
+      thumbnail.
+
+  Returns:
+    Unsaved screenshot object.
+  """
+  if thumbnail and len(thumbnail) > MAX_THUMBNAIL_SIZE:
+    thumbnail = None
+    thumbnail_mime_type = None
+
+  if len(image) + len(thumbnail or '') <= MAX_INLINE_IMAGE_SIZE:
+    return Screenshot(src_data=image, mime_type=mime_type,
+                      thumbnail=thumbnail,
+                      thumbnail_mime_type=thumbnail_mime_type)
+
+  file_name = files.blobstore.create(mime_type=mime_type)
+  image_file = files.open(file_name, 'a')
+  try:
+    image_file.write(image)
+  finally:
+    image_file.close()
+  files.finalize(file_name)
+  return Screenshot(image_data=files.blobstore.get_blob_key(file_name),
+                    thumbnail=thumbnail,
+                    thumbnail_mime_type=thumbnail_mime_type)
+
+
 def AddBlobstoreScreenshot(blob_info, pagedata):
   """Stores screenshot data into screenshot model.
 
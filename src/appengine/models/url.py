@@ -18,7 +18,12 @@
 """URL model to store the URL submitted by Users.
 
 URL model stores URL itself and important pieces parsed out of the url to
-make it easy for searching later on.
+make it easy for searching later on. The number of URLs is kept in a sharded
+counter, so it can be read without counting the URL entities. The counter
+shards are not in the entity group of the URLs, so the transaction that
+inserts or deletes a URL queues a transactional task that updates the counter.
+Tasks may run more than once, so every update is recorded with its shard and
+applied once.
 """
 
 
@@ -26,9 +31,11 @@ make it easy for searching later on.
 
 import logging
 import urlparse
+import zlib
 
 from google.appengine.api import taskqueue
 from google.appengine.ext import db
+from google.appengine.ext import deferred
 
 from models import bots_user
 
@@ -37,6 +44,13 @@ ADD_DEFAULT_URL_CONFIG_URL = '/signup/add_default_url_config'
 ADD_SUBMITTED_URL = '/signup/add_submitted_url'
 ADD_INTERESTED_URL = '/signup/add_interested_url'
 
+# The number of shards of the URL counter. Updates are spread over the shards
+# by their id, so concurrent insertions rarely contend.
+NUM_COUNTER_SHARDS = 20
+COUNTER_SHARD_KEY_NAME = 'url_count_%d'
+# Holds the number of URLs inserted before the counter existed.
+COUNTER_BASE_KEY_NAME = 'url_count_base'
+
 
 class UrlNotFoundError(Exception):
   pass
@@ -62,6 +76,80 @@ class Url(db.Model):
   interested_users = db.ListProperty(db.Key)
 
 
+class UrlCounterShard(db.Model):
+  """One shard of the counter of the URL entities.
+
+  Attributes:
+    count: The number of URLs counted by this shard.
+  """
+  count = db.IntegerProperty(default=0)
+
+
+class UrlCountUpdate(db.Model):
+  """Records that an update of the URL counter was applied, in its shard group.
+
+  The key name of the entity is the id of the update.
+
+  Attributes:
+    creation_time: The date and time at which the update was applied.
+  """
+  creation_time = db.DateTimeProperty(auto_now_add=True)
+
+
+def _UpdateUrlCount(delta, update_id):
+  """Apply an update to its shard of the URL counter once, in a transaction."""
+  key_name = COUNTER_SHARD_KEY_NAME % (
+      (zlib.crc32(update_id) & 0xffffffff) % NUM_COUNTER_SHARDS)
+  shard_key = db.Key.from_path(UrlCounterShard.kind(), key_name)
+  if UrlCountUpdate.get_by_key_name(update_id, parent=shard_key):
+    return
+
+  shard = UrlCounterShard.get(shard_key)
+  if not shard:
+    shard = UrlCounterShard(key_name=key_name)
+  shard.count += delta
+  db.put([shard, UrlCountUpdate(key_name=update_id, parent=shard_key)])
+
+
+def UpdateUrlCount(delta, update_id):
+  """Add to the URL counter, once.
+
+  Args:
+    delta: The integer to add to the number of URLs.
+    update_id: A string that uniquely identifies the update. An update with
+      the id of an update that was applied already is ignored.
+  """
+  db.run_in_transaction(_UpdateUrlCount, delta, update_id)
+
+
+def _DeferUrlCountUpdate(delta, update_id):
+  """Queue an update of the URL counter, in the transaction of the change."""
+  deferred.defer(UpdateUrlCount, delta, update_id, _queue='signup',
+                 _transactional=True)
+
+
+def GetUrlCount():
+  """Return the number of URL entities from the sharded counter.
+
+  The first call counts the URLs inserted before the counter existed, once.
+
+  Returns:
+    An integer representing the number of URLs.
+  """
+  key_names = [COUNTER_SHARD_KEY_NAME % i for i in range(NUM_COUNTER_SHARDS)]
+  shards = UrlCounterShard.get_by_key_name(key_names + [COUNTER_BASE_KEY_NAME])
+  base = shards.pop()
+  total = sum([shard.count for shard in shards if shard])
+
+  if not base:
+    logging.info('Counting the URLs inserted before the URL counter existed.')
+    num_urls = Url.all(keys_only=True).count(limit=None)
+    base = UrlCounterShard(key_name=COUNTER_BASE_KEY_NAME,
+                           count=num_urls - total)
+    base.put()
+  return total + base.count
+
+
 def SearchUrl(url, fetch_limit=20):
   """Search possible matching URL entity using input Url and domain.
 
@@ -136,10 +224,25 @@ def InsertUrl(url, bots_user_key):
     add_submitted_url_task = taskqueue.Task(url=ADD_SUBMITTED_URL,
                                             params=task_params, method='POST')
     add_submitted_url_task.add(queue_name='signup', transactional=True)
+    _DeferUrlCountUpdate(1, 'insert_%s' % url_key)
     return url_entity
   return db.run_in_transaction(_Txn)
 
 
+def DeleteUrl(url_key):
+  """Delete a URL entity and remove it from the URL counter.
+
+  Args:
+    url_key: The key of the Url entity (db.Key).
+  """
+  def _Txn():
+    if not db.get(url_key):
+      return
+    db.delete(url_key)
+    _DeferUrlCountUpdate(-1, 'delete_%s' % url_key)
+  db.run_in_transaction(_Txn)
+
+
 def _IsDuplicateInterestedUser(url_entity, bots_user_key):
   """Checks if bots_user_key exist in interested_users.
 
@@ -69,6 +69,18 @@ appcompat.webdiff.Content.Actions = {
 };
 
 
+/**
+ * Enum for the formats the layout table rows can be produced in. Must match
+ * the formats understood by the server (common/layout_rle.py).
+ * @enum {string}
+ */
+appcompat.webdiff.Content.LayoutFormat = {
+  DENSE: 'dense',
+  RLE: 'rle',
+  BLOCKS: 'blocks'
+};
+
+
 /**
  * String prefix to be used to append the assigned ID into the node's className
  * attribute.
@@ -79,6 +91,25 @@ appcompat.webdiff.Content.Actions = {
 appcompat.webdiff.Content.ID_PREFIX_ = 'appcompat-id-';
 
 
+/**
+ * Name of the nodes table encoding, as understood by the server
+ * (common/nodes_table.py).
+ * @type {string}
+ * @const
+ */
+appcompat.webdiff.Content.NODES_TABLE_FORMAT = 'columnar';
+
+
+/**
+ * Name of the property temporarily holding the assigned ID of each node while
+ * the nodes table is created.
+ * @type {string}
+ * @private
+ * @const
+ */
+appcompat.webdiff.Content.NODE_ID_PROPERTY_ = 'appcompatNodeId';
+
+
 /**
 * String prefix to be used to append the assigned ID into the node's className
 * attribute.
@@ -113,10 +144,14 @@ appcompat.webdiff.Content.prototype.prerenderWaitTimer_ = null;
 
 
 /**
- * Table containing descriptive information of all HTML nodes in the page. Each
- * node's index in this list is its assigned ID and is stored into its className
- * attribute.
- * @type {Array.<Object.<string, (number|string)>>}
+ * Table containing descriptive information of all HTML nodes in the page, in
+ * columns. Each node's index in the columns is its assigned ID and is stored
+ * into its className attribute. The 'w', 'h', 'x' and 'y' columns hold the
+ * node geometry. Selectors are stored as the ID of the parent node in the
+ * 'parent' column, or -1, plus the index in the 'steps' dictionary of the last
+ * element of the selector, or of the whole selector if the parent is -1, in
+ * the 'step' column.
+ * @type {Object.<string, (string|Array.<(number|string)>)>}
  * @private
  */
 appcompat.webdiff.Content.prototype.nodesTable_ = null;
@@ -140,15 +175,36 @@ appcompat.webdiff.Content.patterns = [
 
 
 /**
- * Table containing the page's layout information. The (i, j)th element in the
- * table corresponds to the assigned ID of the node at position (i, j) on the
- * page.
- * @type {Array.<Array.<string>>}
+ * Table containing the page's layout information. In the dense format, the
+ * (i, j)th element in the table corresponds to the assigned ID of the node at
+ * position (i, j) on the page. In the run-length encoded format, each row is a
+ * flat list of alternating node IDs and run lengths. In the blocks format, the
+ * table is a list of [id, x, y, width, height] blocks of uniform ID.
+ * @type {Array.<Array.<(string|number)>>}
  * @private
  */
 appcompat.webdiff.Content.prototype.layoutTable_ = null;
 
 
+/**
+ * The format to produce the layout table rows in. The bots client selects it
+ * with its --layout_format option (see webdriver_content.js).
+ * @type {appcompat.webdiff.Content.LayoutFormat}
+ */
+appcompat.webdiff.Content.prototype.layoutFormat =
+    appcompat.webdiff.Content.LayoutFormat.RLE;
+
+
+/**
+ * Size of the largest square block sampled by the blocks layout format. Uniform
+ * areas are captured with few hit-tests, but details smaller than a block that
+ * fall between the sampled points of the block may be missed, so the layout of
+ * every pixel is only reconstructed exactly with a size of 1.
+ * @type {number}
+ */
+appcompat.webdiff.Content.prototype.blockSize = 8;
+
+
 /**
  * The class that handles the screenshot taking from the content script side.
  * @type {appcompat.webdiff.ScreenshotContent}
@@ -270,7 +326,20 @@ appcompat.webdiff.Content.prototype.checkForDynamicContent_ = function(node) {
  * @private
  */
 appcompat.webdiff.Content.prototype.createNodesTable_ = function() {
-  this.nodesTable_ = [];
+  var table = {
+    'format': appcompat.webdiff.Content.NODES_TABLE_FORMAT,
+    'w': [],
+    'h': [],
+    'x': [],
+    'y': [],
+    'parent': [],
+    'step': [],
+    'steps': []
+  };
+  // Maps the selector steps (prefixed, so they cannot clash with the
+  // properties of Object) to their index in the steps dictionary.
+  var stepIds = {};
+  var idProperty = appcompat.webdiff.Content.NODE_ID_PROPERTY_;
 
   var allnodes = document.getElementsByTagName('*');
   for (var i = 0, node; node = allnodes[i]; i++) {
@@ -279,19 +348,41 @@ appcompat.webdiff.Content.prototype.createNodesTable_ = function() {
     } else {
       this.saveIdIntoClassName_(node, i);
     }
+    node[idProperty] = i;
+
+    // Nodes come in document order, so the parent of a node is already in the
+    // table unless it is the document.
+    var parent = node.parentNode;
+    var parentId = -1;
+    var step;
+    if (parent && idProperty in parent &&
+        node.nodeName.toLowerCase() != 'body') {
+      parentId = parent[idProperty];
+      step = common.dom.querySelector.getSelectorStep(node);
+    } else {
+      step = common.dom.querySelector.getSelector(node);
+    }
 
-    var selector = common.dom.querySelector.getSelector(node);
-    var nodeData = {
-      'w': node.offsetWidth,
-      'h': node.offsetHeight,
-      'x': node.offsetLeft,
-      'y': node.offsetTop,
-      'p': selector
-    };
+    var stepId = stepIds[':' + step];
+    if (stepId === undefined) {
+      stepId = table['steps'].length;
+      stepIds[':' + step] = stepId;
+      table['steps'].push(step);
+    }
 
-    this.nodesTable_[i] = nodeData;
+    table['w'].push(node.offsetWidth || 0);
+    table['h'].push(node.offsetHeight || 0);
+    table['x'].push(node.offsetLeft || 0);
+    table['y'].push(node.offsetTop || 0);
+    table['parent'].push(parentId);
+    table['step'].push(stepId);
   }
 
+  for (var i = 0, node; node = allnodes[i]; i++) {
+    delete node[idProperty];
+  }
+  this.nodesTable_ = table;
+
   this.dynamicContentTable_ = [];
   var node;
   for (var i = 0; node = allnodes[i]; i++) {
@@ -302,23 +393,118 @@ appcompat.webdiff.Content.prototype.createNodesTable_ = function() {
 
 /**
  * Samples each pixel and stores the ID of the element at that pixel into the
- * layoutTable.
+ * layoutTable. Depending on the layout format, each row either holds one ID per
+ * pixel or the runs of identical IDs.
  * @private
  */
 appcompat.webdiff.Content.prototype.createLayoutTable_ = function() {
+  if (this.layoutFormat == appcompat.webdiff.Content.LayoutFormat.BLOCKS) {
+    this.createBlockLayoutTable_();
+    return;
+  }
+
   this.layoutTable_ = [];
+  var rle = this.layoutFormat == appcompat.webdiff.Content.LayoutFormat.RLE;
 
   for (var y = 0; y < this.window.innerHeight; y++) {
-    this.layoutTable_[y] = [];
+    var row = [];
+    var runId = null;
+    var runLength = 0;
 
     for (var x = 0; x < this.window.innerWidth; x++) {
       var element = document.elementFromPoint(x, y);
-      if (element) {
-        this.layoutTable_[y][x] = this.extractIdFromClassName_(element);
+      var id = element ? this.extractIdFromClassName_(element) : '-2';
+
+      if (!rle) {
+        row[x] = id;
+        continue;
+      }
+
+      id = parseInt(id, 10);
+      if (id === runId) {
+        runLength++;
       } else {
-        this.layoutTable_[y][x] = '-2';
+        if (runLength) {
+          row.push(runId, runLength);
+        }
+        runId = id;
+        runLength = 1;
       }
     }
+
+    if (runLength) {
+      row.push(runId, runLength);
+    }
+    this.layoutTable_[y] = row;
+  }
+};
+
+
+/**
+ * Captures the layout table in the blocks format. The page is divided into
+ * squares of blockSize pixels. The corners and the center of a block are
+ * hit-tested and the block is split into quadrants until the samples agree or
+ * the block is a single pixel, so uniform areas take a few hit-tests per block
+ * instead of one per pixel.
+ * @private
+ */
+appcompat.webdiff.Content.prototype.createBlockLayoutTable_ = function() {
+  this.layoutTable_ = [];
+  var width = this.window.innerWidth;
+  var height = this.window.innerHeight;
+  // Neighbouring blocks share corners, so hit-tests are cached by pixel.
+  var cache = {};
+  var getId = goog.bind(function(x, y) {
+    var key = y * width + x;
+    if (!(key in cache)) {
+      var element = document.elementFromPoint(x, y);
+      cache[key] = parseInt(
+          element ? this.extractIdFromClassName_(element) : '-2', 10);
+    }
+    return cache[key];
+  }, this);
+
+  for (var y = 0; y < height; y += this.blockSize) {
+    for (var x = 0; x < width; x += this.blockSize) {
+      this.addLayoutBlocks_(getId, x, y, Math.min(this.blockSize, width - x),
+                            Math.min(this.blockSize, height - y));
+    }
+  }
+};
+
+
+/**
+ * Adds the uniform blocks covering the given area to the layout table.
+ * @param {function(number, number): number} getId Function returning the ID
+ *     of the node at a given position.
+ * @param {number} x The left of the area.
+ * @param {number} y The top of the area.
+ * @param {number} w The width of the area.
+ * @param {number} h The height of the area.
+ * @private
+ */
+appcompat.webdiff.Content.prototype.addLayoutBlocks_ = function(
+    getId, x, y, w, h) {
+  var id = getId(x, y);
+  if ((w == 1 && h == 1) ||
+      (id === getId(x + w - 1, y) && id === getId(x, y + h - 1) &&
+       id === getId(x + w - 1, y + h - 1) &&
+       id === getId(x + (w >> 1), y + (h >> 1)))) {
+    this.layoutTable_.push([id, x, y, w, h]);
+    return;
+  }
+
+  var halfW = Math.ceil(w / 2);
+  var halfH = Math.ceil(h / 2);
+  this.addLayoutBlocks_(getId, x, y, halfW, halfH);
+  if (w > halfW) {
+    this.addLayoutBlocks_(getId, x + halfW, y, w - halfW, halfH);
+  }
+  if (h > halfH) {
+    this.addLayoutBlocks_(getId, x, y + halfH, halfW, h - halfH);
+    if (w > halfW) {
+      this.addLayoutBlocks_(getId, x + halfW, y + halfH, w - halfW, h - halfH);
+    }
   }
 };
 
@@ -336,7 +522,8 @@ appcompat.webdiff.Content.prototype.sendDataToBackground_ = function(port) {
     action: appcompat.webdiff.Content.Actions.SEND_RESULTS,
     nodesTable: this.nodesTable_,
     dynamicContentTable: this.dynamicContentTable_,
-    layoutTable: this.layoutTable_
+    layoutTable: this.layoutTable_,
+    layoutFormat: this.layoutFormat
   });
 };
 
@@ -581,6 +768,7 @@ appcompat.webdiff.Content.prototype.createNodeAndLayoutTable = function() {
   this.createNodesTable_();
   this.createLayoutTable_()
   return { layout_table: this.layoutTable_,
+        layout_format: this.layoutFormat,
         nodes_table: this.nodesTable_,
         dynamic_content_table: this.dynamicContentTable_};
 };
@@ -36,11 +36,37 @@ goog.require('goog.dom.TagName');
  * @returns {string} A string containing the selector.
  */
 common.dom.querySelector.getSelector = function(node) {
+  var parent = node.parentNode;
+
+  var selector = common.dom.querySelector.getSelectorStep(node);
+  if (!parent || common.dom.querySelector.isBody_(node)) {
+    return selector;
+  }
+
+  var parentSelector = common.dom.querySelector.getSelector(parent);
+  if (parentSelector) {
+    selector = parentSelector + '>' + selector;
+  }
+
+  return selector;
+};
+
+
+/**
+ * Finds the portion of the selector of the given DOM Node that follows the
+ * selector of its parent, i.e. the last element of the selector:
+ *     <node.nodeName>([id=node.id])?(:~([0-9]+))?
+ * The selector of the body tag does not depend on its parent and is returned
+ * whole.
+ * @param {!Node} node The DOM Node requiring identification.
+ * @returns {string} A string containing the last element of the selector.
+ */
+common.dom.querySelector.getSelectorStep = function(node) {
   var nodeName = node.nodeName;
   var id = node.id;
   var parent = node.parentNode;
 
-  if (node.nodeName.toLowerCase() == goog.dom.TagName.BODY.toLowerCase()) {
+  if (common.dom.querySelector.isBody_(node)) {
     return goog.dom.TagName.BODY;
   }
 
@@ -57,10 +83,16 @@ common.dom.querySelector.getSelector = function(node) {
     }
   }
 
-  var parentSelector = common.dom.querySelector.getSelector(parent);
-  if (parentSelector) {
-    selector = parentSelector + '>' + selector;
-  }
-
   return selector;
 };
+
+
+/**
+ * Checks whether the given DOM Node is a body tag, where selectors start.
+ * @param {!Node} node The DOM Node to check.
+ * @returns {boolean} Whether the node is a body tag.
+ * @private
+ */
+common.dom.querySelector.isBody_ = function(node) {
+  return node.nodeName.toLowerCase() == goog.dom.TagName.BODY.toLowerCase();
+};
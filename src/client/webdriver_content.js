@@ -24,6 +24,33 @@ goog.provide('appcompat.webdiff.webdriver');
 goog.require('appcompat.webdiff.Content');
 
 
+/**
+ * The capture options of the content script, set by the bots client.
+ * @type {{layoutFormat: (string|undefined), blockSize: (number|undefined)}}
+ * @private
+ */
+appcompat.webdiff.webdriver.options_ = {};
+
+
+/**
+ * Sets the capture options of the content script. The blocks format samples
+ * the corners and the center of every block, so it only reconstructs the
+ * layout of every pixel exactly with a block size of 1.
+ * @param {string} layoutFormat The format to capture the layout table in, an
+ *     appcompat.webdiff.Content.LayoutFormat value.
+ * @param {number=} opt_blockSize The size of the blocks of the blocks format,
+ *     or 0 for the default size.
+ * @export
+ */
+appcompat.webdiff.webdriver.setOptions = function(layoutFormat,
+                                                  opt_blockSize) {
+  appcompat.webdiff.webdriver.options_ = {
+    layoutFormat: layoutFormat,
+    blockSize: opt_blockSize
+  };
+};
+
+
 /**
  * Executes the content script for webdriver.
  * @return {Object.<String, Array>} A dictionary of results from executing
@@ -32,5 +59,12 @@ goog.require('appcompat.webdiff.Content');
  */
 appcompat.webdiff.webdriver.executeScript = function() {
   var worker = new appcompat.webdiff.Content();
+  var options = appcompat.webdiff.webdriver.options_;
+  if (options.layoutFormat) {
+    worker.layoutFormat = options.layoutFormat;
+  }
+  if (options.blockSize) {
+    worker.blockSize = options.blockSize;
+  }
   return worker.createNodeAndLayoutTable();
 };
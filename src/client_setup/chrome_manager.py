@@ -31,8 +31,8 @@ import subprocess
 import sys
 import time
 import urllib
-import urllib2
 import _winreg
+import http_transport
 import mylogger
 
 logger = mylogger.InitLogging('Chrome_SiteCompat', True, True)
@@ -306,9 +306,10 @@ class ChromeAutomationHelper(object):
     else:
       for retry in range(retries):
         try:
-          response = urllib2.urlopen(OMAHA_URL)
+          response = cStringIO.StringIO(
+              http_transport.Get(OMAHA_URL, follow_redirects=True).read())
           break
-        except urllib2.URLError, url_exception:
+        except http_transport.TransportError, url_exception:
           logger.info('Retry (' + str(retry) + ') Failed to retrieve chrome ' +
                       'installer information from ' + OMAHA_URL +
                       '. The given error is: ' + str(url_exception))
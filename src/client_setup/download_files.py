@@ -20,14 +20,10 @@
 
 
 import json
-import math
-import random
 import subprocess
 import sys
-import time
-import urllib
-import urllib2
 
+import http_transport
 import mylogger
 
 
@@ -37,9 +33,6 @@ SERVER = 'http://YOUR_APPENGINE_SERVER_HERE'
 CLIENT_FILE_LIST = '/client_file_list'
 COMMUNICATION_RETRIES = 3
 
-# Max wait time in seconds between retries
-_MAX_WAIT_TIME = 3
-
 
 class FileDownloadError(Exception):
   pass
@@ -49,18 +42,6 @@ class FileExecutionError(Exception):
   pass
 
 
-def _ExponentialBackoff(attempt, max_wait_time=_MAX_WAIT_TIME):
-  """Wait a time that increases exponentially with the attempt number.
-
-  Args:
-    attempt: The most recent attempt number (starting at 0).
-    max_wait_time: An optional int that specifies the max base time to wait
-      in seconds.
-  """
-  sleep_time = math.pow(2, attempt) * random.uniform(0.5, 1.0) * max_wait_time
-  time.sleep(sleep_time)
-
-
 def _GetDataFromUrl(url, params=None, retries=COMMUNICATION_RETRIES):
   """Get and return data from the given URL.
 
@@ -74,19 +55,11 @@ def _GetDataFromUrl(url, params=None, retries=COMMUNICATION_RETRIES):
   """
   response = None
 
-  if params:
-    params = urllib.urlencode(params)
-  else:
-    params = ''
-
-  for attempt in range(retries):
-    try:
-      response = urllib2.urlopen(url+'?'+params)
-      response = response.read()
-      break
-    except urllib2.URLError:
-      logger.error('Failed to connect to "%s".', url)
-      _ExponentialBackoff(attempt)
+  try:
+    response = http_transport.Get(url, params, retries=retries,
+                                  follow_redirects=True).read()
+  except http_transport.TransportError:
+    logger.error('Failed to connect to "%s".', url)
 
   return response
 
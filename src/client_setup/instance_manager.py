@@ -21,11 +21,10 @@
 import base64
 import json
 import sys
-import urllib
-import urllib2
 import zlib
 
 import chrome_manager
+import http_transport
 import mylogger
 
 logger = mylogger.InitLogging('Bots', True, True)
@@ -120,16 +119,9 @@ def _GetDataFromUrl(url, params=None):
   """
   response = None
 
-  if params:
-    params = urllib.urlencode(params)
-  else:
-    params = ''
-
   try:
-    # Let the server know that this instance is starting up.
-    response = urllib2.urlopen(url+'?'+params)
-    response = response.read()
-  except urllib2.URLError:
+    response = http_transport.Get(url, params).read()
+  except http_transport.TransportError:
     logger.error('Failed to connect to "%s".', url)
 
   return response
@@ -145,8 +137,8 @@ def _Post(url, instance_id, data):
   """
   try:
     data_to_send = {'log': data, 'instance_id': instance_id}
-    urllib2.urlopen(url, urllib.urlencode(data_to_send))
-  except urllib2.URLError:
+    http_transport.Post(url, data_to_send)
+  except http_transport.TransportError:
     logger.info('Failed to connect to server during configuration.')
     return
 
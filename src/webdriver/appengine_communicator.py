@@ -22,26 +22,44 @@
 import base64
 import json
 import math
-import random
+import Queue
+import threading
 import time
 import urllib
-import urllib2
 import zlib
 
 import blobstore_upload
 import client_logging
+import http_transport
+import layout_blocks
+import layout_pack
+import screenshot_transcode
 
 
 # Define the constants
 _BLOBSTORE_UPLOAD_RETRIES = 3
 _PIECES_UPLOAD_RETRIES = 3
-_MAX_WAIT_TIME = 3
+_PIECES_UPLOAD_THREADS = 4
+_PIECE_STATUS_RETRIES = 3
 _TEST_DISTRIBUTION_SERVER = 'http://YOUR_APPENGINE_SERVER_HERE'
 _FETCH_TEST_URL = _TEST_DISTRIBUTION_SERVER + '/distributor/accept_work_item'
 _FINISH_TEST_URL = _TEST_DISTRIBUTION_SERVER + '/distributor/finish_work_item'
+_LEASE_TESTS_URL = _TEST_DISTRIBUTION_SERVER + '/distributor/lease_work_items'
+_RELEASE_TESTS_URL = (_TEST_DISTRIBUTION_SERVER +
+                      '/distributor/release_work_items')
+_FINISH_CLIENT_URL = _TEST_DISTRIBUTION_SERVER + '/distributor/finish_client'
+_EXTEND_LEASE_URL = _TEST_DISTRIBUTION_SERVER + '/distributor/extend_lease'
 _RESULTS_SERVER = 'http://YOUR_APPENGINE_SERVER_HERE'
 _RESULTS_UPLOAD_URL = _RESULTS_SERVER + '/putdata'
 _LOG_UPLOAD_URL = _RESULTS_SERVER + '/distributor/upload_client_log'
+_PIECE_STATUS_URL = _RESULTS_SERVER + '/piecestatus'
+_BUNDLE_UPLOAD_URL = _RESULTS_SERVER + '/putbundle'
+
+# Number of layout table pieces the server stores the layout table in.
+_BUNDLE_NUM_PIECES = 64
+
+# Layout tables in this format are uploaded as packed binary pieces.
+_LAYOUT_FORMAT_RLE = 'rle'
 
 LOGGER_NAME = 'appengine_communicator'
 
@@ -78,6 +96,13 @@ class TestCase(object):
     test_key: An integer representing the key that identifies this test.
     auth_cookie: An AuthCookie object that represents data for authenticating
       for the test case.
+    finished: A boolean indicating whether the test case has been finished.
+    load_time: The number of seconds waited for the page to be ready, or None
+      if the page was not loaded yet.
+    process_time: The number of seconds spent processing the test case, or
+      None if it was not processed yet.
+    fetch_time: The time at which the test case was handed out to be
+      processed, or None if it was not fetched by this client.
   """
 
   def __init__(self, url, start_time, config, test_key, auth_domain=None,
@@ -86,11 +111,29 @@ class TestCase(object):
     self.start_time = start_time
     self.config = config
     self.test_key = test_key
+    self.finished = False
+    self.load_time = None
+    self.process_time = None
+    self.fetch_time = None
 
     self.auth_cookie = None
     if auth_domain and auth_cookies:
       self.auth_cookie = AuthCookie(auth_domain, auth_cookies)
 
+  def GetDuration(self):
+    """Return the milliseconds spent on the test case since it was fetched.
+
+    The duration covers processing, waiting for the upload and uploading, the
+    whole time the test case needs its lease.
+
+    Returns:
+      An int, or None if the test case was not fetched by this client, e.g.
+      when it was spooled by a previous client.
+    """
+    if self.fetch_time is None:
+      return None
+    return int((time.time() - self.fetch_time) * 1000)
+
 
 class AppEngineCommunicator(object):
   """Handles communication with the test distributor and results servers.
@@ -101,30 +144,39 @@ class AppEngineCommunicator(object):
     _useragent: A string representing the useragent of the browser under test.
     _instance_id: A string representing a unique identifier for the machine
       instance.
-    _current_test_case: A TestCase object representing the current test case.
+    _current_test_case: A TestCase object representing the test case fetched
+      last. It is the default test case of FinishTest and of the uploads, for
+      the clients driving a single browser.
     _log_uploaded: A boolean indicating whether the log file has been uploaded.
+    _screenshot_format: A string representing the format to upload the
+      screenshots in (see screenshot_transcode).
+    _screenshot_quality: An int representing the JPEG quality of the uploaded
+      screenshots.
+    _thumbnail_size: An int representing the maximum size of the uploaded
+      screenshot thumbnails, or 0 to upload no thumbnails.
+    _lease_size: An int representing the number of test cases to lease from
+      the distributor at once.
+    _leased_test_cases: A list of the TestCase objects leased from the
+      distributor and not fetched yet, in the order to run them.
+    _lease_lock: A threading.Lock protecting the leased test cases.
   """
 
-  def __init__(self, token, useragent, instance_id):
+  def __init__(self, token, useragent, instance_id,
+               screenshot_format=screenshot_transcode.FORMAT_PNG,
+               screenshot_quality=screenshot_transcode.DEFAULT_QUALITY,
+               thumbnail_size=0, lease_size=1):
     # Set up the attributes
     self._token = token
     self._useragent = useragent
     self._instance_id = instance_id
     self._current_test_case = None
     self._log_uploaded = False
-
-  # TODO(user): Move this function into a shared utility module.
-  @staticmethod
-  def ExponentialBackoff(attempt, max_wait_time=_MAX_WAIT_TIME):
-    """Wait a time that increases exponentially with the attempt number.
-
-    Args:
-      attempt: The most recent attempt number (starting at 0).
-      max_wait_time: An optional int that specifies the max base time to wait
-        in seconds.
-    """
-    sleep_time = math.pow(2, attempt) * random.uniform(0.5, 1.0) * max_wait_time
-    time.sleep(sleep_time)
+    self._screenshot_format = screenshot_format
+    self._screenshot_quality = screenshot_quality
+    self._thumbnail_size = thumbnail_size
+    self._lease_size = lease_size
+    self._leased_test_cases = []
+    self._lease_lock = threading.Lock()
 
   def FetchTest(self):
     """Fetch a new test from the test distributor.
@@ -133,6 +185,10 @@ class AppEngineCommunicator(object):
     current test case that hasn't been finished. The old test case will be over
     written by the new test case.
 
+    If the lease size is above one, the test cases are leased from the
+    distributor in batches and handed out from a local queue. The test cases
+    given back with ReturnTest are handed out first.
+
     Returns:
       A TestCase object describing the test case that was fetched. If there are
       no more tests to run, None is returned.
@@ -140,64 +196,229 @@ class AppEngineCommunicator(object):
     Raises:
       CommunicationError: There is an error in fetching the test.
     """
-    # Fetch the test case from the test distributor.
+    # The communicator is shared by the browser workers, so the test case is
+    # built and returned from a local variable; the current test case is only
+    # the default of the clients driving a single browser.
+    if self._lease_size > 1 or self._leased_test_cases:
+      test_case = self._FetchLeasedTest()
+    else:
+      test_case = self._AcceptTest()
+    if test_case:
+      test_case.fetch_time = time.time()
+    self._current_test_case = test_case
+    return test_case
+
+  def _AcceptTest(self):
+    """Accept the next test case from the test distributor.
+
+    Returns:
+      A TestCase object, or None if there are no more tests to run.
+
+    Raises:
+      CommunicationError: There is an error in fetching the test.
+    """
     try:
       data = urllib.urlencode({
           'tokens': self._token, 'useragent': urllib.quote(self._useragent),
           'instance_id': self._instance_id})
-      url_page = urllib2.urlopen(_FETCH_TEST_URL, data)
-    except urllib2.URLError:
+      url_page = http_transport.Post(_FETCH_TEST_URL, data)
+    except http_transport.TransportError:
       self._LogAndRaiseException('Failed to fetch a test from app engine.')
 
     # Process the data from the test distributor.
-    self._current_test_case = None
     try:
       test_dictionary = json.loads(url_page.read())
 
       # Check if there is a test available.
       if test_dictionary:
-        test_config = json.loads(test_dictionary['config'])
-        auth_domain = None
-        auth_cookies = None
+        return self._CreateTestCase(test_dictionary)
+    except ValueError:
+      logger.exception('Could not process the data from the test distributor.')
+    return None
 
-        if 'auth_domain' in test_config:
-          auth_domain = test_config['auth_domain']
+  def _CreateTestCase(self, test_dictionary):
+    """Create a test case from its description by the test distributor.
 
-        if 'auth_cookies' in test_config:
-          auth_cookies = test_config['auth_cookies']
+    Args:
+      test_dictionary: A dictionary describing the test case.
 
-        self._current_test_case = TestCase(
-            test_dictionary['data_str'][19:-1], test_dictionary['start_time'],
-            test_config, test_dictionary['key'], auth_domain=auth_domain,
-            auth_cookies=auth_cookies)
-    except ValueError:
+    Returns:
+      A TestCase object.
+
+    Raises:
+      ValueError: The test configuration is not valid JSON.
+    """
+    test_config = json.loads(test_dictionary['config'])
+    auth_domain = None
+    auth_cookies = None
+
+    if 'auth_domain' in test_config:
+      auth_domain = test_config['auth_domain']
+
+    if 'auth_cookies' in test_config:
+      auth_cookies = test_config['auth_cookies']
+
+    return TestCase(
+        test_dictionary['data_str'][19:-1], test_dictionary['start_time'],
+        test_config, test_dictionary['key'], auth_domain=auth_domain,
+        auth_cookies=auth_cookies)
+
+  def _FetchLeasedTest(self):
+    """Return the next leased test case, leasing a new batch if necessary.
+
+    Returns:
+      A TestCase object, or None if there are no more tests to run.
+
+    Raises:
+      CommunicationError: There is an error in leasing the tests.
+    """
+    with self._lease_lock:
+      if not self._leased_test_cases:
+        self._leased_test_cases = self._LeaseTests()
+      if not self._leased_test_cases:
+        return None
+      return self._leased_test_cases.pop(0)
+
+  def _LeaseTests(self):
+    """Lease a batch of test cases from the test distributor.
+
+    Returns:
+      A list of TestCase objects, empty if there are no more tests to run.
+
+    Raises:
+      CommunicationError: There is an error in leasing the tests.
+    """
+    try:
+      data = urllib.urlencode({
+          'tokens': self._token, 'useragent': urllib.quote(self._useragent),
+          'instance_id': self._instance_id, 'count': self._lease_size})
+      response = http_transport.Post(_LEASE_TESTS_URL, data)
+    except http_transport.TransportError:
+      self._LogAndRaiseException('Failed to lease tests from app engine.')
+
+    test_cases = []
+    try:
+      for test_dictionary in json.loads(response.read()) or []:
+        test_cases.append(self._CreateTestCase(test_dictionary))
+    except (KeyError, TypeError, ValueError):
       logger.exception('Could not process the data from the test distributor.')
 
-    return self._current_test_case
+    logger.info('Leased %d test cases.', len(test_cases))
+    return test_cases
+
+  def ReturnTest(self, test_case):
+    """Give back a fetched test case that was not processed.
+
+    The test case is handed out again by FetchTest, or given back to the
+    queue of the distributor by ReleaseTests, so it is neither failed nor
+    retried.
+
+    Args:
+      test_case: A TestCase object fetched by this communicator.
+    """
+    with self._lease_lock:
+      self._leased_test_cases.insert(0, test_case)
+
+  def ReleaseTests(self):
+    """Give the leased test cases that were not fetched back to the queue.
+
+    Raises:
+      CommunicationError: There is an error communicating with the test
+        distributor. The test cases are kept to be released again.
+    """
+    with self._lease_lock:
+      if not self._leased_test_cases:
+        return
+
+      try:
+        data = urllib.urlencode(
+            {'key': [test_case.test_key
+                     for test_case in self._leased_test_cases],
+             'instance_id': self._instance_id}, True)
+        http_transport.Post(_RELEASE_TESTS_URL, data)
+      except http_transport.TransportError:
+        self._LogAndRaiseException('Failed to release the leased tests.')
+
+      logger.info('Released %d leased test cases.',
+                  len(self._leased_test_cases))
+      self._leased_test_cases = []
+
+  def FinishClient(self):
+    """Tell the distributor that the client is done, so its machine is stopped.
 
-  def FinishTest(self, result):
+    The client calls this once no test case is left and all its results are
+    uploaded; the distributor never stops a machine because a fetch found the
+    queue empty.
+
+    Raises:
+      CommunicationError: There is an error communicating with the test
+        distributor.
+    """
+    try:
+      http_transport.Post(_FINISH_CLIENT_URL,
+                          urllib.urlencode({'instance_id': self._instance_id}))
+    except http_transport.TransportError:
+      self._LogAndRaiseException('Failed to finish the client.')
+
+  def ExtendLease(self, test_case, seconds):
+    """Ask the distributor to keep a test case leased for longer.
+
+    Args:
+      test_case: A TestCase object whose results are not uploaded yet.
+      seconds: An int representing the number of seconds from now that the
+        test case should stay leased for.
+
+    Raises:
+      CommunicationError: There is an error communicating with the test
+        distributor.
+    """
+    try:
+      http_transport.Post(_EXTEND_LEASE_URL, urllib.urlencode(
+          {'key': test_case.test_key, 'instance_id': self._instance_id,
+           'seconds': int(seconds)}))
+    except http_transport.TransportError:
+      self._LogAndRaiseException('Failed to extend the lease of the test.')
+
+  def FinishTest(self, result, test_case=None):
     """Acknowledge that the current test case has been finished.
 
     Args:
      result: A string indicating the result of executing the test case.
+     test_case: An optional TestCase object to finish instead of the current
+       test case, e.g. when the next test case was already fetched.
 
     Raises:
       CommunicationError: There is an error communicating with
         the test distributor.
     """
-    # Make sure there is a current test case to finish.
-    if not self._current_test_case:
+    test_case = test_case or self._current_test_case
+    # Make sure there is a test case to finish.
+    if not test_case or test_case.finished:
       return
 
     try:
-      data = urllib.urlencode({'key': self._current_test_case.test_key,
-                               'result': result,
-                               'instance_id': self._instance_id})
-      urllib2.urlopen(_FINISH_TEST_URL, data)
-      self._current_test_case = None
-    except urllib2.URLError:
+      data = {'key': test_case.test_key,
+              'result': result,
+              'instance_id': self._instance_id}
+      duration = test_case.GetDuration()
+      if duration is not None:
+        data['duration'] = duration
+      http_transport.Post(_FINISH_TEST_URL, urllib.urlencode(data))
+      self._SetFinished(test_case)
+    except http_transport.TransportError:
       self._LogAndRaiseException('Failed acknowledging that the test finished.')
 
+  def _SetFinished(self, test_case):
+    """Mark the given test case as finished.
+
+    Args:
+      test_case: A TestCase object that the distributor acknowledged as
+        finished.
+    """
+    test_case.finished = True
+    if test_case is self._current_test_case:
+      self._current_test_case = None
+
   def _LogAndRaiseException(self, message):
     """Log the current exception being handled and raise a new exception.
 
@@ -213,50 +434,45 @@ class AppEngineCommunicator(object):
     raise CommunicationError(message)
 
   def UploadResults(self, nodes_table, layout_table, dynamic_content_table,
-                    png, channel=''):
+                    png, channel='', layout_format=None,
+                    upload_threads=_PIECES_UPLOAD_THREADS, test_case=None):
     """Upload the test case results to the results server.
 
     Args:
-      nodes_table: A list representing the node results from the test case.
+      nodes_table: The nodes table from the test case (see content_layout.js).
       layout_table: A list representing the layout results from the test case.
       dynamic_content_table: A list representing the dynamic content results
         from the test case.
       png: A string representing the binary data for a png image.
       channel: An optional string representing the channel for the browser.
+      layout_format: An optional string representing the format of the layout
+        table rows ('dense', 'rle' or 'blocks'). The server assumes the dense
+        format if it is not given.
+      upload_threads: An optional int representing the number of layout table
+        pieces to upload at the same time.
+      test_case: An optional TestCase object to upload the results of instead
+        of the current test case.
 
     Raises:
-      CommunicationError: The initial upload communication failed.
+      CommunicationError: The initial upload communication failed, some
+        pieces of the layout table could not be stored, or whether they were
+        stored is unknown.
     """
-    # Make sure there is a current test case to upload results for.
-    if not self._current_test_case:
+    test_case = test_case or self._current_test_case
+    # Make sure there is a test case to upload results for.
+    if not test_case:
       return
 
     # Format the results data for uploading.
-    suite_info = {
-        'date': self._current_test_case.start_time,
-        'key': self._current_test_case.test_key,
-        'refBrowser': self._current_test_case.config['refBrowser'],
-        'refBrowserChannel': self._current_test_case.config['refBrowserChannel']
-        }
-
-    data_to_send = {
-        'userAgent': self._useragent,
-        'url': self._current_test_case.url,
-        'nodesTable': base64.b64encode(
-            zlib.compress(json.dumps(nodes_table), 9)),
-        'dynamicContentTable': json.dumps(dynamic_content_table),
-        'width': self._current_test_case.config['width'],
-        'height': self._current_test_case.config['height'],
-        'channel': channel,
-        'suiteInfo': json.dumps(suite_info),
-        'instance_id': self._instance_id
-        }
+    data_to_send = self._GetResultsData(test_case, nodes_table,
+                                        dynamic_content_table, channel,
+                                        layout_format)
 
     # Upload the initial data.
     try:
-      initial_send = urllib2.urlopen(
+      initial_send = http_transport.Post(
           _RESULTS_UPLOAD_URL, urllib.urlencode(data_to_send))
-    except urllib2.URLError:
+    except http_transport.TransportError:
       self._LogAndRaiseException('Failed on the initial results upload.')
 
     response = initial_send.read()
@@ -267,42 +483,301 @@ class AppEngineCommunicator(object):
     response = json.loads(response)
     upload_key = response['key'].encode('ascii')
     num_pieces = int(response['nPieces'])
-    layout_table_length = len(layout_table)
 
+    # Thumbnails are only uploaded with the bundled upload.
+    image, image_format, _ = screenshot_transcode.Transcode(
+        png, image_format=self._screenshot_format,
+        quality=self._screenshot_quality)
     logger.info('Uploading the image to blobstore with key "%s".', upload_key)
     for attempt in range(_BLOBSTORE_UPLOAD_RETRIES):
       try:
-        blobstore_upload.UploadImageToBlobstore(upload_key, png)
+        blobstore_upload.UploadImageToBlobstore(
+            upload_key, image,
+            extension=screenshot_transcode.EXTENSIONS[image_format])
         break
       except blobstore_upload.BlobstoreUploadError:
         logger.exception('Blobstore upload failed, attempt %d.', attempt+1)
-        AppEngineCommunicator.ExponentialBackoff(attempt)
+        http_transport.ExponentialBackoff(attempt)
 
     # Send the layout table in the requested number of pieces.
     logger.info('Uploading remaining results in %d pieces.', num_pieces)
-    n_rows_per_piece = int(math.ceil(layout_table_length / (num_pieces * 1.0)))
-    start = 0
-    end = n_rows_per_piece
-    for i in range(num_pieces):
-      data_pieces_to_send = {
-          'key': upload_key,
-          'layoutTable': json.dumps(layout_table[start:end]),
-          'i': i,
-          'instance_id': self._instance_id
-          }
-
-      for attempt in range(_PIECES_UPLOAD_RETRIES):
+    pieces = self._SplitLayoutTable(layout_table, num_pieces, layout_format)
+    self._UploadPieces(upload_key, range(num_pieces), pieces, layout_format,
+                       upload_threads)
+
+    # Pieces can be stored even though their response was lost and the other
+    # way around, so ask the server which pieces landed and send the missing
+    # ones again.
+    missing = self._GetMissingPieces(upload_key, num_pieces)
+    if missing:
+      logger.info('Uploading %d missing pieces again.', len(missing))
+      self._UploadPieces(upload_key, missing, pieces, layout_format,
+                         upload_threads)
+      missing = self._GetMissingPieces(upload_key, num_pieces)
+      if missing:
+        raise CommunicationError(
+            'Pieces %s of the results were not stored.' % missing)
+
+  def UploadResultsBundle(self, nodes_table, layout_table,
+                          dynamic_content_table, png, channel='',
+                          layout_format=None, result=None, test_case=None):
+    """Upload the test case results to the results server with one request.
+
+    The results data, every layout table piece and the screenshot are streamed
+    as a single multipart message. The screenshot is transcoded to the
+    configured format first, and sent with its thumbnail if one is configured.
+    If a result is given, the server also finishes the current test case, as
+    FinishTest would.
+
+    Args:
+      nodes_table: The nodes table from the test case (see content_layout.js).
+      layout_table: A list representing the layout results from the test case.
+      dynamic_content_table: A list representing the dynamic content results
+        from the test case.
+      png: A string representing the binary data for a png image.
+      channel: An optional string representing the channel for the browser.
+      layout_format: An optional string representing the format of the layout
+        table rows ('dense', 'rle' or 'blocks'). The server assumes the dense
+        format if it is not given.
+      result: An optional string indicating the result of executing the test
+        case, to finish the test case with.
+      test_case: An optional TestCase object to upload the results of instead
+        of the current test case.
+
+    Raises:
+      CommunicationError: The upload failed.
+    """
+    test_case = test_case or self._current_test_case
+    # Make sure there is a test case to upload results for.
+    if not test_case:
+      return
+
+    data_to_send = self._GetResultsData(test_case, nodes_table,
+                                        dynamic_content_table, channel,
+                                        layout_format)
+    if result:
+      data_to_send['result'] = result
+    fields = data_to_send.items()
+    files = []
+
+    pieces = self._SplitLayoutTable(layout_table, _BUNDLE_NUM_PIECES,
+                                    layout_format)
+    for i in range(_BUNDLE_NUM_PIECES):
+      name = 'piece%d' % i
+      if layout_format == _LAYOUT_FORMAT_RLE:
+        files.append((name, '%s.bin' % name, layout_pack.Encode(pieces[i])))
+      else:
+        fields.append((name, json.dumps(pieces[i])))
+    if png:
+      image, image_format, thumbnail = screenshot_transcode.Transcode(
+          png, image_format=self._screenshot_format,
+          quality=self._screenshot_quality,
+          thumbnail_size=self._thumbnail_size)
+      files.append(('screenshot', screenshot_transcode.GetFilename(
+          'screenshot', image_format), image))
+      if thumbnail:
+        files.append(('thumbnail', screenshot_transcode.GetFilename(
+            'thumbnail', image_format), thumbnail))
+
+    fields = [(name, unicode(value).encode('utf-8')) for name, value in fields]
+    content_type, chunks = blobstore_upload.GetMultipartFormData(fields, files)
+    try:
+      response = http_transport.Post(_BUNDLE_UPLOAD_URL, chunks,
+                                     content_type=content_type)
+      upload_key = json.loads(response.read())['key']
+    except (http_transport.TransportError, ValueError, KeyError):
+      self._LogAndRaiseException('Failed on the bundled results upload.')
+
+    logger.info('Uploaded the results bundle with key "%s".', upload_key)
+    if result:
+      self._SetFinished(test_case)
+
+  def _GetResultsData(self, test_case, nodes_table, dynamic_content_table,
+                      channel, layout_format):
+    """Format the results data of a test case for uploading.
+
+    Args:
+      test_case: A TestCase object describing the test case.
+      nodes_table: The nodes table from the test case (see content_layout.js).
+      dynamic_content_table: A list representing the dynamic content results
+        from the test case.
+      channel: A string representing the channel for the browser.
+      layout_format: A string representing the format of the layout table
+        rows, or None.
+
+    Returns:
+      A dictionary of the upload arguments.
+    """
+    suite_info = {
+        'date': test_case.start_time,
+        'key': test_case.test_key,
+        'refBrowser': test_case.config['refBrowser'],
+        'refBrowserChannel': test_case.config['refBrowserChannel']
+        }
+
+    data_to_send = {
+        'userAgent': self._useragent,
+        'url': test_case.url,
+        'nodesTable': base64.b64encode(
+            zlib.compress(json.dumps(nodes_table), 9)),
+        'dynamicContentTable': json.dumps(dynamic_content_table),
+        'width': test_case.config['width'],
+        'height': test_case.config['height'],
+        'channel': channel,
+        'suiteInfo': json.dumps(suite_info),
+        'instance_id': self._instance_id
+        }
+    if layout_format:
+      data_to_send['layoutFormat'] = layout_format
+    if test_case.load_time is not None:
+      data_to_send['loadTime'] = '%.3f' % test_case.load_time
+    duration = test_case.GetDuration()
+    if duration is not None:
+      data_to_send['duration'] = duration
+    return data_to_send
+
+  def _UploadPieces(self, upload_key, indices, pieces, layout_format,
+                    num_threads):
+    """Upload pieces of the layout table concurrently.
+
+    The threads share the pooled keep-alive connections of the transport, and
+    each piece is retried with an exponential backoff. Failures are only
+    logged, the caller checks which pieces were stored.
+
+    Args:
+      upload_key: A string representing the key returned by the initial
+        results upload.
+      indices: A list of the indices of the pieces to upload.
+      pieces: A list of all the pieces of the layout table.
+      layout_format: A string representing the format of the layout table
+        rows, or None.
+      num_threads: An int representing the number of pieces to upload at the
+        same time.
+    """
+    pending = Queue.Queue()
+    for i in indices:
+      pending.put(i)
+
+    def Worker():
+      while True:
         try:
-          urllib2.urlopen(_RESULTS_UPLOAD_URL,
-                          urllib.urlencode(data_pieces_to_send))
-          break
-        except urllib2.URLError:
-          logger.exception('Piece "%d" upload failed, attempt %d.',
-                            i, attempt+1)
-          AppEngineCommunicator.ExponentialBackoff(attempt)
+          i = pending.get_nowait()
+        except Queue.Empty:
+          return
+        self._UploadPiece(upload_key, i, pieces[i], layout_format)
+
+    threads = []
+    for _ in range(max(1, min(num_threads, len(indices)))):
+      thread = threading.Thread(target=Worker)
+      thread.start()
+      threads.append(thread)
+    for thread in threads:
+      thread.join()
+
+  def _UploadPiece(self, upload_key, index, rows, layout_format):
+    """Upload one piece of the layout table, with retries.
+
+    Args:
+      upload_key: A string representing the key returned by the initial
+        results upload.
+      index: An int representing the index of the piece.
+      rows: A list of the layout table rows in the piece.
+      layout_format: A string representing the format of the layout table
+        rows, or None.
+
+    Returns:
+      True if the server accepted the piece, False otherwise.
+    """
+    url, body, content_type = self._CreatePieceRequest(upload_key, index,
+                                                       rows, layout_format)
+    try:
+      http_transport.Post(url, body, content_type=content_type,
+                          retries=_PIECES_UPLOAD_RETRIES)
+      return True
+    except http_transport.TransportError:
+      logger.exception('Piece "%d" upload failed.', index)
+      return False
+
+  def _GetMissingPieces(self, upload_key, num_pieces):
+    """Ask the results server which pieces of the layout table are missing.
+
+    Args:
+      upload_key: A string representing the key returned by the initial
+        results upload.
+      num_pieces: An int representing the number of pieces uploaded.
+
+    Returns:
+      A sorted list of the indices of the missing pieces.
+
+    Raises:
+      CommunicationError: The status of the pieces could not be got, so it is
+        unknown whether the results were stored.
+    """
+    for attempt in range(_PIECE_STATUS_RETRIES):
+      try:
+        response = http_transport.Get(_PIECE_STATUS_URL, {'key': upload_key})
+        received = set(json.loads(response.read())['received'])
+        return [i for i in range(num_pieces) if i not in received]
+      except (http_transport.TransportError, ValueError, KeyError):
+        logger.exception('Could not get the status of the pieces, attempt %d.',
+                         attempt+1)
+        http_transport.ExponentialBackoff(attempt)
+    raise CommunicationError(
+        'Could not get the status of the pieces of the results.')
+
+  def _SplitLayoutTable(self, layout_table, num_pieces, layout_format):
+    """Split the layout table into the pieces to upload.
+
+    Every piece covers the same number of pixel rows, whatever the format of
+    the layout table.
+
+    Args:
+      layout_table: A list representing the layout results from the test case.
+      num_pieces: An int representing the number of pieces to split into.
+      layout_format: A string representing the format of the layout table
+        rows, or None.
+
+    Returns:
+      A list of num_pieces lists of layout table rows (or blocks).
+    """
+    if layout_format == layout_blocks.LAYOUT_FORMAT_BLOCKS:
+      return layout_blocks.SplitBlocks(layout_table, num_pieces)
+
+    n_rows_per_piece = int(math.ceil(len(layout_table) / (num_pieces * 1.0)))
+    return [layout_table[i * n_rows_per_piece:(i + 1) * n_rows_per_piece]
+            for i in range(num_pieces)]
+
+  def _CreatePieceRequest(self, upload_key, index, rows, layout_format):
+    """Create the request to upload one piece of the layout table.
+
+    Run-length encoded pieces are sent as packed binary data (see layout_pack)
+    with the piece arguments in the query string. Other pieces are sent as
+    form-encoded JSON.
+
+    Args:
+      upload_key: A string representing the key returned by the initial
+        results upload.
+      index: An int representing the index of the piece.
+      rows: A list of the layout table rows in the piece.
+      layout_format: A string representing the format of the layout table
+        rows, or None.
+
+    Returns:
+      A tuple of the string URL, the string body and the content type of the
+      request.
+    """
+    arguments = {
+        'key': upload_key,
+        'i': index,
+        'instance_id': self._instance_id
+        }
+    if layout_format == _LAYOUT_FORMAT_RLE:
+      return ('%s?%s' % (_RESULTS_UPLOAD_URL, urllib.urlencode(arguments)),
+              layout_pack.Encode(rows), layout_pack.CONTENT_TYPE)
 
-      start = end
-      end = min(end+n_rows_per_piece, len(layout_table))
+    arguments['layoutTable'] = json.dumps(rows)
+    return (_RESULTS_UPLOAD_URL, urllib.urlencode(arguments),
+            http_transport.FORM_CONTENT_TYPE)
 
   def UploadLog(self, log):
     """Upload the test case results to the results server.
@@ -315,7 +790,7 @@ class AppEngineCommunicator(object):
       return
 
     try:
-      urllib2.urlopen(_LOG_UPLOAD_URL, urllib.urlencode(
+      http_transport.Post(_LOG_UPLOAD_URL, urllib.urlencode(
           {'log': base64.b64encode(zlib.compress(json.dumps(log), 9)),
            'instance_id': self._instance_id}))
       self._log_uploaded = True
@@ -27,11 +27,11 @@ import StringIO
 import time
 import unittest
 import urllib
-import urllib2
 
 import mox
 
 import appengine_communicator
+import http_transport
 
 
 class AppengineCommunicatorTest(unittest.TestCase):
@@ -44,22 +44,8 @@ class AppengineCommunicatorTest(unittest.TestCase):
   def tearDown(self):
     self.mox.UnsetStubs()
 
-  def testExponentialBackoff_FirstAttempt(self):
-    start = time.time()
-    appengine_communicator.AppEngineCommunicator.ExponentialBackoff(0)
-    finish = time.time()
-    self.assertTrue(start+1 < finish)
-    self.assertTrue(start+3 > finish)
-
-  def testExponentialBackoff_SecondAttempt(self):
-    start = time.time()
-    appengine_communicator.AppEngineCommunicator.ExponentialBackoff(1)
-    finish = time.time()
-    self.assertTrue(start+3 < finish)
-    self.assertTrue(start+10 > finish)
-
   def testFetchTest_HasTest(self):
-    self.mox.StubOutWithMock(urllib2, 'urlopen')
+    self.mox.StubOutWithMock(http_transport, 'Post')
     test_response = StringIO.StringIO(
         '{"data_str": "ContentMap[\\"URL\\"]=\\"http:\\/\\/finance.google.com'
         '\\"", "start_time": "2011-08-10 23:45:51.548554", "config": '
@@ -72,8 +58,8 @@ class AppengineCommunicatorTest(unittest.TestCase):
     data = urllib.urlencode({'tokens': 'chromedriver',
                              'useragent': 'chrome',
                              'instance_id': 'instance'})
-    urllib2.urlopen(appengine_communicator._FETCH_TEST_URL,
-                    data).AndReturn(test_response)
+    http_transport.Post(appengine_communicator._FETCH_TEST_URL,
+                        data).AndReturn(test_response)
 
     self.mox.ReplayAll()
     test_case = self._communicator.FetchTest()
@@ -90,7 +76,7 @@ class AppengineCommunicatorTest(unittest.TestCase):
     self.mox.VerifyAll()
 
   def testFetchTest_HasTestAndCookie(self):
-    self.mox.StubOutWithMock(urllib2, 'urlopen')
+    self.mox.StubOutWithMock(http_transport, 'Post')
     test_response = StringIO.StringIO(
         '{"data_str": "ContentMap[\\"URL\\"]=\\"http:\\/\\/finance.google.com'
         '\\"", "start_time": "2011-08-10 23:45:51.548554", "config": '
@@ -107,8 +93,8 @@ class AppengineCommunicatorTest(unittest.TestCase):
     data = urllib.urlencode({'tokens': 'chromedriver',
                              'useragent': 'chrome',
                              'instance_id': 'instance'})
-    urllib2.urlopen(appengine_communicator._FETCH_TEST_URL,
-                    data).AndReturn(test_response)
+    http_transport.Post(appengine_communicator._FETCH_TEST_URL,
+                        data).AndReturn(test_response)
 
     self.mox.ReplayAll()
     test_case = self._communicator.FetchTest()
@@ -133,14 +119,14 @@ class AppengineCommunicatorTest(unittest.TestCase):
     self.mox.VerifyAll()
 
   def testFetchTest_NoTest(self):
-    self.mox.StubOutWithMock(urllib2, 'urlopen')
+    self.mox.StubOutWithMock(http_transport, 'Post')
     test_response = StringIO.StringIO('null')
 
     data = urllib.urlencode({'tokens': 'chromedriver',
                              'useragent': 'chrome',
                              'instance_id': 'instance'})
-    urllib2.urlopen(appengine_communicator._FETCH_TEST_URL,
-                    data).AndReturn(test_response)
+    http_transport.Post(appengine_communicator._FETCH_TEST_URL,
+                        data).AndReturn(test_response)
 
     self.mox.ReplayAll()
     test_case = self._communicator.FetchTest()
@@ -148,15 +134,95 @@ class AppengineCommunicatorTest(unittest.TestCase):
     self.assertEqual(None, test_case)
     self.mox.VerifyAll()
 
+  def testFetchTest_Leased(self):
+    communicator = appengine_communicator.AppEngineCommunicator(
+        'chromedriver', 'chrome', 'instance', lease_size=2)
+    self.mox.StubOutWithMock(http_transport, 'Post')
+    test_response = StringIO.StringIO(
+        '[{"data_str": "ContentMap[\\"URL\\"]=\\"http:\\/\\/a.com\\"", '
+        '"start_time": "2011-08-10 23:45:51.548554", "config": "{}", '
+        '"key": "key1"}, '
+        '{"data_str": "ContentMap[\\"URL\\"]=\\"http:\\/\\/b.com\\"", '
+        '"start_time": "2011-08-10 23:45:51.548554", "config": "{}", '
+        '"key": "key2"}]')
+
+    http_transport.Post(appengine_communicator._LEASE_TESTS_URL,
+                        mox.IgnoreArg()).AndReturn(test_response)
+    http_transport.Post(appengine_communicator._LEASE_TESTS_URL,
+                        mox.IgnoreArg()).AndReturn(StringIO.StringIO('[]'))
+
+    self.mox.ReplayAll()
+    self.assertEqual('http://a.com', communicator.FetchTest().url)
+    self.assertEqual('key2', communicator.FetchTest().test_key)
+    self.assertEqual(None, communicator.FetchTest())
+    self.mox.VerifyAll()
+
+  def testReleaseTests(self):
+    communicator = appengine_communicator.AppEngineCommunicator(
+        'chromedriver', 'chrome', 'instance', lease_size=2)
+    communicator._leased_test_cases = [
+        appengine_communicator.TestCase('a.com', '123', {}, 'key1'),
+        appengine_communicator.TestCase('b.com', '123', {}, 'key2')]
+    self.mox.StubOutWithMock(http_transport, 'Post')
+
+    data = urllib.urlencode({'key': ['key1', 'key2'],
+                             'instance_id': 'instance'}, True)
+    http_transport.Post(appengine_communicator._RELEASE_TESTS_URL,
+                        data).AndReturn(None)
+
+    self.mox.ReplayAll()
+    communicator.ReleaseTests()
+    # Nothing is left to release.
+    communicator.ReleaseTests()
+    self.mox.VerifyAll()
+
+  def testReturnTest(self):
+    test_case = appengine_communicator.TestCase('a.com', '123', {}, 'key1')
+    self._communicator.ReturnTest(test_case)
+    self.assertEqual(test_case, self._communicator.FetchTest())
+
+    self._communicator.ReturnTest(test_case)
+    self.mox.StubOutWithMock(http_transport, 'Post')
+    data = urllib.urlencode({'key': ['key1'], 'instance_id': 'instance'}, True)
+    http_transport.Post(appengine_communicator._RELEASE_TESTS_URL,
+                        data).AndReturn(None)
+
+    self.mox.ReplayAll()
+    self._communicator.ReleaseTests()
+    self.mox.VerifyAll()
+
+  def testFinishClient(self):
+    self.mox.StubOutWithMock(http_transport, 'Post')
+    http_transport.Post(appengine_communicator._FINISH_CLIENT_URL,
+                        urllib.urlencode({'instance_id': 'instance'})).AndRaise(
+                            http_transport.TransportError('failed'))
+
+    self.mox.ReplayAll()
+    self.assertRaises(appengine_communicator.CommunicationError,
+                      self._communicator.FinishClient)
+    self.mox.VerifyAll()
+
+  def testExtendLease(self):
+    test_case = appengine_communicator.TestCase('a.com', '123', {}, 'key1')
+    self.mox.StubOutWithMock(http_transport, 'Post')
+    data = urllib.urlencode({'key': 'key1', 'instance_id': 'instance',
+                             'seconds': 60})
+    http_transport.Post(appengine_communicator._EXTEND_LEASE_URL,
+                        data).AndReturn(None)
+
+    self.mox.ReplayAll()
+    self._communicator.ExtendLease(test_case, 60)
+    self.mox.VerifyAll()
+
   def testFinishTest_HasTest(self):
     self._communicator._current_test_case = appengine_communicator.TestCase(
         'www.google.com', '123', [], 1234)
-    self.mox.StubOutWithMock(urllib2, 'urlopen')
+    self.mox.StubOutWithMock(http_transport, 'Post')
 
     data = urllib.urlencode({'key': 1234, 'result': 'success',
                              'instance_id': 'instance'})
-    urllib2.urlopen(appengine_communicator._FINISH_TEST_URL,
-                    data).AndReturn(None)
+    http_transport.Post(appengine_communicator._FINISH_TEST_URL,
+                        data).AndReturn(None)
 
     self.mox.ReplayAll()
     self._communicator.FinishTest('success')
@@ -167,6 +233,70 @@ class AppengineCommunicatorTest(unittest.TestCase):
     self.assertEqual(None, self._communicator.FinishTest('success'))
 
 
+  def testGetMissingPieces(self):
+    self.mox.StubOutWithMock(http_transport, 'Get')
+    http_transport.Get(
+        appengine_communicator._PIECE_STATUS_URL, {'key': 'abc'}).AndReturn(
+            StringIO.StringIO('{"nPieces": 4, "received": [0, 2]}'))
+
+    self.mox.ReplayAll()
+    self.assertEqual([1, 3], self._communicator._GetMissingPieces('abc', 4))
+    self.mox.VerifyAll()
+
+  def testGetMissingPieces_StatusRetried(self):
+    self.mox.StubOutWithMock(http_transport, 'Get')
+    self.mox.StubOutWithMock(http_transport, 'ExponentialBackoff')
+    http_transport.Get(
+        appengine_communicator._PIECE_STATUS_URL, {'key': 'abc'}).AndReturn(
+            StringIO.StringIO('<html>Server Error</html>'))
+    http_transport.ExponentialBackoff(0)
+    http_transport.Get(
+        appengine_communicator._PIECE_STATUS_URL, {'key': 'abc'}).AndReturn(
+            StringIO.StringIO('{"nPieces": 4, "received": [0, 1, 2, 3]}'))
+
+    self.mox.ReplayAll()
+    self.assertEqual([], self._communicator._GetMissingPieces('abc', 4))
+    self.mox.VerifyAll()
+
+  def testGetMissingPieces_StatusFailed(self):
+    self.mox.StubOutWithMock(http_transport, 'Get')
+    self.mox.StubOutWithMock(http_transport, 'ExponentialBackoff')
+    for attempt in range(appengine_communicator._PIECE_STATUS_RETRIES):
+      http_transport.Get(
+          appengine_communicator._PIECE_STATUS_URL, {'key': 'abc'}).AndRaise(
+              http_transport.TransportError('failed'))
+      http_transport.ExponentialBackoff(attempt)
+
+    self.mox.ReplayAll()
+    self.assertRaises(appengine_communicator.CommunicationError,
+                      self._communicator._GetMissingPieces, 'abc', 4)
+    self.mox.VerifyAll()
+
+  def testGetResultsData_LoadTime(self):
+    test_case = appengine_communicator.TestCase(
+        'http://www.google.com', 'start', {
+            'width': 1024, 'height': 512, 'refBrowser': 'Chrome/1.0',
+            'refBrowserChannel': 'stable'}, 'key')
+    data = self._communicator._GetResultsData(test_case, [], [], 'dev', None)
+    self.assertFalse('loadTime' in data)
+
+    test_case.load_time = 1.5
+    data = self._communicator._GetResultsData(test_case, [], [], 'dev', None)
+    self.assertEqual('1.500', data['loadTime'])
+
+  def testGetResultsData_Duration(self):
+    test_case = appengine_communicator.TestCase(
+        'http://www.google.com', 'start', {
+            'width': 1024, 'height': 512, 'refBrowser': 'Chrome/1.0',
+            'refBrowserChannel': 'stable'}, 'key')
+    data = self._communicator._GetResultsData(test_case, [], [], 'dev', None)
+    self.assertFalse('duration' in data)
+
+    test_case.fetch_time = time.time() - 12.3456
+    data = self._communicator._GetResultsData(test_case, [], [], 'dev', None)
+    self.assertTrue(12345 <= data['duration'] < 13345)
+
+
 def main():
   unittest.main()
 
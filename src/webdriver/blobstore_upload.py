@@ -22,13 +22,10 @@ This is specifically used to upload a screenshot to blobstore.
 
 
 
-import httplib
 import mimetypes
-import socket
-import urllib2
-import urlparse
 
 import client_logging
+import http_transport
 
 BLOBSTORE_UPLOAD_URL = 'http://YOUR_APPENGINE_SERVER_HERE/getuploadurl'
 _MULTIPART_BOUNDARY = '----------Boundary_$#$%_783659204_boundarY'
@@ -55,28 +52,60 @@ def _PostMultipartData(url, fields, files):
   Returns:
     Returns the server's response status code as an integer.
   """
-  # Split the host and selector parts of the URL
-  urlparts = urlparse.urlsplit(url)
-  host = urlparts[1]
-  selector = urlparts[2]
-
-  # Create the message body
-  content_type, body = _EncodeMultipartFormData(fields, files)
+  content_type, chunks = GetMultipartFormData(fields, files)
 
   # Send the message
   try:
-    connection = httplib.HTTPConnection(host)
-    headers = {'User-Agent': 'Python Blobstore Uploader',
-               'Content-Type': content_type}
-    connection.request('POST', selector, body, headers)
-    result = connection.getresponse()
-    return result.status
-  except (socket.error, httplib.HTTPException):
+    return http_transport.Post(
+        url, chunks, content_type=content_type,
+        headers={'User-Agent': 'Python Blobstore Uploader'}).status
+  except http_transport.TransportError, e:
     logger.exception('Error uploading the image to blobstore.')
-    return None
+    return e.status
+
+
+def _IterMultipartFormData(fields, files):
+  """Generate the chunks of a multipart message.
+
+  The field and file values are generated as they are, without copying them.
 
+  Args:
+    fields: A list of (name, value) tuples describing form field data.
+    files: A list of (name, filename, value) tuples describing the files to
+      be uploaded.
 
-def _EncodeMultipartFormData(fields, files):
+  Yields:
+    The strings making up the message body, in order.
+  """
+  crlf = '\r\n'
+
+  # Add the fields
+  for (key, value) in fields:
+    yield crlf.join(['--' + _MULTIPART_BOUNDARY,
+                     'Content-Disposition: form-data; name="%s"' % key,
+                     '', ''])
+    yield value
+    yield crlf
+
+  # Add the files
+  for (key, filename, value) in files:
+    yield crlf.join([
+        '--' + _MULTIPART_BOUNDARY,
+        'Content-Disposition: form-data; name="%s"; filename="%s"' % (
+            key, filename),
+        'Content-Type: %s' % _GetContentType(filename),
+        '', ''])
+    yield value
+    yield crlf
+
+  yield '--' + _MULTIPART_BOUNDARY + '--' + crlf
+
+
+def _GetMultipartContentType():
+  return 'multipart/form-data; boundary=%s' % _MULTIPART_BOUNDARY
+
+
+def EncodeMultipartFormData(fields, files):
   """Encode the given data into a multipart message.
 
   This function encodes the data to upload a multipart message. See
@@ -91,32 +120,27 @@ def _EncodeMultipartFormData(fields, files):
   Returns:
     A (content_type, body) tuple that can be uploaded as a multipart message.
   """
-  crlf = '\r\n'
-  body = []
+  body = ''.join(_IterMultipartFormData(fields, files))
+  return _GetMultipartContentType(), body
 
-  # Add the fields
-  for (key, value) in fields:
-    body.append('--' + _MULTIPART_BOUNDARY)
-    body.append('Content-Disposition: form-data; name="%s"' % key)
-    body.append('')
-    body.append(value)
 
-  # Add the files
-  for (key, filename, value) in files:
-    body.append('--' + _MULTIPART_BOUNDARY)
-    body.append('Content-Disposition: form-data; name="%s"; filename="%s"' % (
-        key, filename))
-    body.append('Content-Type: %s' % _GetContentType(filename))
-    body.append('')
-    body.append(value)
+def GetMultipartFormData(fields, files):
+  """Split the given data into the chunks of a multipart message.
 
-  body.append('--' + _MULTIPART_BOUNDARY + '--')
-  body.append('')
+  The chunks can be sent one after the other (see http_transport), which
+  avoids building the message body in memory.
 
-  body = crlf.join(body)
-  content_type = 'multipart/form-data; boundary=%s' % _MULTIPART_BOUNDARY
+  Args:
+    fields: A list of (name, value) tuples describing form field data.
+    files: A list of (name, filename, value) tuples describing the files to
+      be uploaded.
 
-  return content_type, body
+  Returns:
+    A (content_type, chunks) tuple, where chunks is a list of strings. The
+    field and file values are chunks of their own, they are not copied.
+  """
+  return _GetMultipartContentType(), list(_IterMultipartFormData(fields,
+                                                                 files))
 
 
 def _GetContentType(filename):
@@ -145,20 +169,22 @@ def _GetBlobstoreUploadUrl():
     is returned.
   """
   try:
-    return urllib2.urlopen(BLOBSTORE_UPLOAD_URL).read()
-  except urllib2.URLError:
+    return http_transport.Get(BLOBSTORE_UPLOAD_URL).read()
+  except http_transport.TransportError:
     logger.exception('Error retrieving the blobstore upload url.')
     return None
 
 
 # TODO(user): Consider adding a variation of this function with retries.
-def UploadImageToBlobstore(key, png):
+def UploadImageToBlobstore(key, png, extension='png'):
   """Upload PNG image data and the corresponding test key to blobstore.
 
   Args:
     key: A string representing the app engine key for the result to associate
       the image data with.
     png: A string representing the binary data for a PNG image to upload.
+    extension: An optional string representing the file name extension of the
+      image format, when the image is not a PNG image.
 
   Raises:
     BlobstoreUploadError: This exception is raised if either the upload URL
@@ -177,7 +203,7 @@ def UploadImageToBlobstore(key, png):
     raise BlobstoreUploadError('Could not retrieve the blobstore upload url.')
 
   fields = [('key', key)]
-  files = [('file', '%s.png' % key, png)]
+  files = [('file', '%s.%s' % (key, extension), png)]
 
   # Post the image as a multipart message to blobstore
   result = _PostMultipartData(upload_url, fields, files)
@@ -84,7 +84,7 @@ class BlobstoreUploadTest(unittest.TestCase):
     self.assertEqual(
         ('multipart/form-data; boundary=----------'
          'Boundary_$#$%_783659204_boundarY'),
-        blobstore_upload._EncodeMultipartFormData(fields, files)[0])
+        blobstore_upload.EncodeMultipartFormData(fields, files)[0])
 
   def testEncodeMultipartFormData_FieldAndFile(self):
     fields = [('key', '1234')]
@@ -92,28 +92,39 @@ class BlobstoreUploadTest(unittest.TestCase):
     self.assertEqual(
         '\r\n'.join([self.expected_result_field, self.expected_result_file,
                      self.expected_result_body]),
-        blobstore_upload._EncodeMultipartFormData(fields, files)[1])
+        blobstore_upload.EncodeMultipartFormData(fields, files)[1])
 
   def testEncodeMultipartFormData_File(self):
     fields = []
     files = [('file', '1234.png', base64.b64decode(self.base64_png))]
     self.assertEqual(
         '\r\n'.join([self.expected_result_file, self.expected_result_body]),
-        blobstore_upload._EncodeMultipartFormData(fields, files)[1])
+        blobstore_upload.EncodeMultipartFormData(fields, files)[1])
 
   def testEncodeMultipartFormData_Field(self):
     fields = [('key', '1234')]
     files = []
     self.assertEqual(
         '\r\n'.join([self.expected_result_field, self.expected_result_body]),
-        blobstore_upload._EncodeMultipartFormData(fields, files)[1])
+        blobstore_upload.EncodeMultipartFormData(fields, files)[1])
 
   def testEncodeMultipartFormData_NoData(self):
     fields = []
     files = []
     self.assertEqual(
         self.expected_result_body,
-        blobstore_upload._EncodeMultipartFormData(fields, files)[1])
+        blobstore_upload.EncodeMultipartFormData(fields, files)[1])
+
+  def testGetMultipartFormData(self):
+    fields = [('key', '1234')]
+    files = [('file', '1234.png', base64.b64decode(self.base64_png))]
+    content_type, chunks = blobstore_upload.GetMultipartFormData(fields,
+                                                                 files)
+    self.assertEqual(
+        blobstore_upload.EncodeMultipartFormData(fields, files),
+        (content_type, ''.join(chunks)))
+    # The file value is a chunk of its own, it is not copied into the body.
+    self.assertTrue(files[0][2] in chunks)
 
 
 def main():
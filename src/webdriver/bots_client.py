@@ -24,13 +24,17 @@ import base64
 import json
 import logging
 import optparse
+import Queue
 import sys
+import threading
 import time
-import urllib
-import urllib2
 
 import appengine_communicator
 import client_logging
+import http_transport
+import layout_blocks
+import screenshot_transcode
+import upload_spool
 import webdriver_wrapper
 
 
@@ -39,14 +43,52 @@ BROWSER_OPTIONS = ['chrome', 'firefox']
 COMMUNICATION_RETRIES = 3
 EXECUTION_RETRIES = 3
 
-# The amount of time to wait for the page to load in seconds.
-WEBSITE_LOAD_TIME = 5
+# The maximum amount of time to wait for the page to be ready in seconds.
+WEBSITE_MAX_LOAD_TIME = 30
 
+# The results of the test cases, as the distributor accepts them.
 SUCCESS = 'success'
-FAILURE = 'failure'
+FAILURE = 'failed'
 UPLOAD_ERROR = 'upload_error'
 TIMEOUT_ERROR = 'timeout_error'
 
+# Results are uploaded either with one bundled request, which also finishes the
+# test case, or with an initial request followed by the layout table pieces.
+UPLOAD_MODE_BUNDLE = 'bundle'
+UPLOAD_MODE_PIECES = 'pieces'
+UPLOAD_MODE_OPTIONS = [UPLOAD_MODE_BUNDLE, UPLOAD_MODE_PIECES]
+
+# The formats the content script can capture the layout table in. Blocks need
+# the fewest hit-tests but are only exact with a block size of 1.
+LAYOUT_FORMAT_DENSE = 'dense'
+LAYOUT_FORMAT_RLE = 'rle'
+LAYOUT_FORMAT_OPTIONS = [LAYOUT_FORMAT_DENSE, LAYOUT_FORMAT_RLE,
+                         layout_blocks.LAYOUT_FORMAT_BLOCKS]
+
+# In the pipelined mode, the maximum number of processed test cases waiting for
+# their upload. Capturing blocks while the queue is full.
+PIPELINE_QUEUE_SIZE = 2
+
+# The default number of browser workers, when neither the --workers flag nor
+# the user data specify it.
+DEFAULT_WORKERS = 1
+
+# The number of test cases leased from the distributor at once. The leased test
+# cases that are not processed are given back when the client stops.
+DEFAULT_LEASE_SIZE = 4
+
+# Results that fail to upload are spooled to this directory and uploaded in
+# the background, so the test cases do not have to be captured again.
+DEFAULT_SPOOL_DIR = 'upload_spool'
+# The time between two checks of the spool for new items in seconds.
+SPOOL_POLL_SECONDS = 10
+# The maximum time between two upload attempts of the spool in seconds.
+SPOOL_MAX_BACKOFF_SECONDS = 300
+# The time to keep draining the spool for when the client stops in seconds.
+SPOOL_DRAIN_TIMEOUT = 300
+# Spooled items older than this, e.g. from a previous test run, are dropped.
+SPOOL_MAX_AGE_SECONDS = 24 * 60 * 60
+
 _INSTANCE_ID_URL = 'http://169.254.169.254/latest/meta-data/instance-id'
 _USER_DATA_URL = 'http://169.254.169.254/latest/user-data'
 
@@ -69,6 +111,23 @@ def _LoadFileToString(filename):
     return f.read()
 
 
+def _ConfigureTestScript(test_script, layout_format, block_size):
+  """Return the test script with the capture options set.
+
+  Args:
+    test_script: A string representing the javascript to run against the URLs.
+    layout_format: A string representing the format to capture the layout
+      table in, one of LAYOUT_FORMAT_OPTIONS.
+    block_size: An int representing the size of the blocks of the blocks
+      format in pixels, or 0 for the default of the content script.
+
+  Returns:
+    A string representing the javascript to run against the URLs.
+  """
+  return '%s\nappcompat.webdiff.webdriver.setOptions(%s, %d);\n' % (
+      test_script, json.dumps(layout_format), block_size)
+
+
 def _GetDataFromUrl(url, params=None):
   """Get and return data from the given URL.
 
@@ -81,16 +140,9 @@ def _GetDataFromUrl(url, params=None):
   """
   response = None
 
-  if params:
-    params = urllib.urlencode(params)
-  else:
-    params = ''
-
   try:
-    # Let the server know that this instance is starting up.
-    response = urllib2.urlopen(url+'?'+params)
-    response = response.read()
-  except urllib2.URLError:
+    response = http_transport.Get(url, params).read()
+  except http_transport.TransportError:
     logger.error('Failed to connect to "%s".', url)
 
   return response
@@ -111,7 +163,7 @@ def _FetchData(data_url):
 
     if not data:
       logger.error('Failed to get the data from the EC2 server.')
-      appengine_communicator.AppEngineCommunicator.ExponentialBackoff(attempt)
+      http_transport.ExponentialBackoff(attempt)
     else:
       break
 
@@ -128,12 +180,13 @@ def _FetchInstanceId():
   return _FetchData(_INSTANCE_ID_URL)
 
 
-def _FetchUserDataTokenAndChannel():
-  """Fetch the instance id from the internal Amazon server.
+def _FetchUserData():
+  """Fetch the user data from the internal Amazon server.
 
   Returns:
-    A tuple of strings representing the token and channel. If there are any
-    failures or the data is not available, either of the values can be None.
+    A tuple of the token and channel strings and the number of browser workers
+    to run. If there are any failures or the data is not available, any of the
+    values can be None.
   """
   user_data = None
   try:
@@ -149,7 +202,11 @@ def _FetchUserDataTokenAndChannel():
   if user_data and 'channel' in user_data:
     channel = user_data['channel']
 
-  return (token, channel)
+  workers = None
+  if user_data and 'workers' in user_data:
+    workers = user_data['workers']
+
+  return (token, channel, workers)
 
 
 def _SpawnWebdriver(driver, browser):
@@ -184,11 +241,28 @@ def _FetchTestCase(communicator):
       break
     except appengine_communicator.CommunicationError:
       logger.exception('Failed to load the test on attempt "%d".', attempt+1)
-      appengine_communicator.AppEngineCommunicator.ExponentialBackoff(attempt)
+      http_transport.ExponentialBackoff(attempt)
 
   return test_case
 
 
+def _ReleaseTestCases(communicator):
+  """Give the leased test cases that were not processed back to the queue.
+
+  Args:
+    communicator: An appengine_communicator.AppEngineCommunicator object that
+      leased the test cases.
+  """
+  for attempt in range(COMMUNICATION_RETRIES):
+    try:
+      communicator.ReleaseTests()
+      return
+    except appengine_communicator.CommunicationError:
+      logger.exception('Failed to release the test cases on attempt "%d".',
+                       attempt+1)
+      http_transport.ExponentialBackoff(attempt)
+
+
 def _Authenticate(driver, test_case):
   """Authenticate the browser if necessary for the test case.
 
@@ -223,6 +297,7 @@ def _ProcessTestCase(driver, test_case, test_script):
   status = SUCCESS
   results = None
   base64_png = None
+  start_time = time.time()
   for attempt in range(EXECUTION_RETRIES):
     try:
       driver.ResizeBrowser(int(test_case.config['width']),
@@ -231,7 +306,11 @@ def _ProcessTestCase(driver, test_case, test_script):
       logger.info('Navigating to the "%s" and waiting for it to load.',
                   test_case.url)
       driver.NavigateToSite(test_case.url)
-      time.sleep(WEBSITE_LOAD_TIME)
+      load_time, ready = driver.WaitForPageReady(
+          max_wait=WEBSITE_MAX_LOAD_TIME)
+      test_case.load_time = load_time
+      logger.info('Waited %.2f seconds for "%s" (ready: %s).', load_time,
+                  test_case.url, ready)
 
       # Insert the script into the browser and run it.
       logger.info('Executing the processing script.')
@@ -265,10 +344,13 @@ def _ProcessTestCase(driver, test_case, test_script):
           'Failed to process URL "%s" on attempt "%d" due to timeout.',
           test_case.url, attempt+1)
 
+  test_case.process_time = time.time() - start_time
   return (status, results, base64_png)
 
 
-def _UploadTestResults(communicator, test_case, results, base64_png, channel):
+def _UploadTestResults(communicator, test_case, results, base64_png, channel,
+                       upload_mode=UPLOAD_MODE_BUNDLE,
+                       retries=COMMUNICATION_RETRIES):
   """Process a test case.
 
   Args:
@@ -279,6 +361,10 @@ def _UploadTestResults(communicator, test_case, results, base64_png, channel):
     results: A list of dictionaries describing the test results.
     base64_png: A string respresenting a base64 png screenshot.
     channel: A string representing the channel for the browser under test.
+    upload_mode: An optional string indicating how to upload the results. In
+      the UPLOAD_MODE_BUNDLE mode, the results are uploaded with one request
+      that also finishes the test case.
+    retries: An optional number of upload attempts.
 
   Returns:
     A string indicating whether the test was a SUCCESS, FAILURE, or experienced
@@ -286,24 +372,33 @@ def _UploadTestResults(communicator, test_case, results, base64_png, channel):
   """
   test_result = FAILURE
   if results:
-    for attempt in range(COMMUNICATION_RETRIES):
+    for attempt in range(retries):
       try:
-        communicator.UploadResults(
-            results['nodes_table'], results['layout_table'],
-            results['dynamic_content_table'],
-            base64.b64decode(base64_png), channel=channel)
+        if upload_mode == UPLOAD_MODE_BUNDLE:
+          communicator.UploadResultsBundle(
+              results['nodes_table'], results['layout_table'],
+              results['dynamic_content_table'],
+              base64.b64decode(base64_png), channel=channel,
+              layout_format=results.get('layout_format'), result=SUCCESS,
+              test_case=test_case)
+        else:
+          communicator.UploadResults(
+              results['nodes_table'], results['layout_table'],
+              results['dynamic_content_table'],
+              base64.b64decode(base64_png), channel=channel,
+              layout_format=results.get('layout_format'), test_case=test_case)
         test_result = SUCCESS
         break
       except appengine_communicator.CommunicationError:
         logger.exception('Failed to upload test results on attempt "%d".',
                          attempt+1)
         test_result = UPLOAD_ERROR
-        appengine_communicator.AppEngineCommunicator.ExponentialBackoff(attempt)
+        http_transport.ExponentialBackoff(attempt)
       except KeyError:
         logger.exception('Failed to upload test results on attempt "%d".',
                          attempt+1)
         test_result = FAILURE
-        appengine_communicator.AppEngineCommunicator.ExponentialBackoff(attempt)
+        http_transport.ExponentialBackoff(attempt)
   else:
     logger.error(
         'Did not get the results from executing the test script for "%s".',
@@ -312,25 +407,379 @@ def _UploadTestResults(communicator, test_case, results, base64_png, channel):
   return test_result
 
 
-def _FinishTestCase(communicator, test_result):
+def _SpoolTestResults(communicator, spool, test_case, results, base64_png):
+  """Spool the results of a test case that failed to upload.
+
+  The lease of a spooled test case is extended for as long as the spool keeps
+  its results, so it is not leased to another client meanwhile.
+
+  Args:
+    communicator: An appengine_communicator.AppEngineCommunicator object to
+      use for extending the lease of the test case.
+    spool: An upload_spool.UploadSpool object, or None if spooling is disabled.
+    test_case: An appengine_communicator.TestCase object describing the test
+      case.
+    results: A list of dictionaries describing the test results.
+    base64_png: A string respresenting a base64 png screenshot.
+
+  Returns:
+    A boolean indicating whether the results were spooled. The test case is
+    then finished once the spool uploaded the results.
+  """
+  if not spool:
+    return False
+
+  try:
+    spool.Add(test_case, results, base64_png)
+  except upload_spool.SpoolError:
+    return False
+
+  logger.info('Spooled the results for "%s".', test_case.url)
+  try:
+    communicator.ExtendLease(test_case, SPOOL_MAX_AGE_SECONDS)
+  except appengine_communicator.CommunicationError:
+    # The upload of the spooled results is dropped if the test case was
+    # leased again meanwhile.
+    logger.warning('Could not extend the lease of "%s".', test_case.url)
+  return True
+
+
+def _FinishTestCase(communicator, test_result, test_case=None):
   """Report that a test case is finished.
 
   Args:
     communicator: An appengine_communicator.AppEngineCommunicator object to
       use for requesting a test case.
     test_result: A string indicating the test result.
+    test_case: An optional appengine_communicator.TestCase object to finish
+      instead of the current test case of the communicator.
   """
   for attempt in range(COMMUNICATION_RETRIES):
     try:
-      communicator.FinishTest(test_result)
+      communicator.FinishTest(test_result, test_case=test_case)
       break
     except appengine_communicator.CommunicationError:
       logger.exception('Failed to finish the test on attempt "%d".',
                        attempt+1)
-      appengine_communicator.AppEngineCommunicator.ExponentialBackoff(attempt)
+      http_transport.ExponentialBackoff(attempt)
+
+
+class _TestCasePrefetcher(object):
+  """Fetches the next test case in the background.
+
+  Attributes:
+    _communicator: An appengine_communicator.AppEngineCommunicator object to
+      use for requesting test cases.
+    _thread: The thread fetching the next test case, or None.
+    _test_case: The last fetched test case, or None.
+  """
+
+  def __init__(self, communicator):
+    self._communicator = communicator
+    self._thread = None
+    self._test_case = None
+
+  def Start(self):
+    """Start fetching the next test case."""
+    self._thread = threading.Thread(target=self._Fetch)
+    self._thread.start()
+
+  def Get(self):
+    """Wait for the test case being fetched and return it.
+
+    Returns:
+      An appengine_communicator.TestCase object, or None if no test case is
+      available or none is being fetched.
+    """
+    if not self._thread:
+      return None
+    self._thread.join()
+    self._thread = None
+    test_case = self._test_case
+    self._test_case = None
+    return test_case
+
+  def _Fetch(self):
+    self._test_case = _FetchTestCase(self._communicator)
+
+
+class _ResultsUploader(threading.Thread):
+  """Uploads the results and finishes the test cases in the background.
+
+  Test cases are uploaded and finished in the order they were added, and each
+  test case is finished only after its results were uploaded. Adding blocks
+  while queue_size test cases are waiting, which bounds the memory held by the
+  pending results.
+
+  Attributes:
+    _communicator: An appengine_communicator.AppEngineCommunicator object to
+      use for uploading.
+    _channel: A string representing the channel for the browser under test.
+    _upload_mode: A string indicating how to upload the results.
+    _spool: An upload_spool.UploadSpool object for the results that fail to
+      upload, or None.
+    _queue: A Queue.Queue of the test cases waiting for their upload.
+  """
+
+  def __init__(self, communicator, channel, upload_mode,
+               queue_size=PIPELINE_QUEUE_SIZE, spool=None):
+    threading.Thread.__init__(self)
+    self.daemon = True
+    self._communicator = communicator
+    self._channel = channel
+    self._upload_mode = upload_mode
+    self._spool = spool
+    self._queue = Queue.Queue(queue_size)
+
+  def Add(self, test_case, status, results, base64_png):
+    """Queue a processed test case for upload.
+
+    Args:
+      test_case: An appengine_communicator.TestCase object describing the
+        processed test case.
+      status: A string indicating the status of processing the test case.
+      results: A list of dictionaries describing the test results.
+      base64_png: A string respresenting a base64 png screenshot.
+    """
+    self._queue.put((test_case, status, results, base64_png))
+
+  def Stop(self):
+    """Wait for the queued test cases to be finished and stop the thread."""
+    self._queue.put(None)
+    self.join()
+
+  def run(self):
+    while True:
+      item = self._queue.get()
+      if item is None:
+        return
+
+      test_case, status, results, base64_png = item
+      try:
+        if status == SUCCESS:
+          logger.info('Uploading the results for "%s".', test_case.url)
+          status = _UploadTestResults(self._communicator, test_case, results,
+                                      base64_png, self._channel,
+                                      upload_mode=self._upload_mode)
+          if (status == UPLOAD_ERROR and
+              _SpoolTestResults(self._communicator, self._spool, test_case,
+                                results, base64_png)):
+            continue
+        else:
+          logger.info('Test case status is "%s", not uploading results.',
+                      status)
+
+        logger.info('Finishing the test case for "%s" with status "%s".',
+                    test_case.url, status)
+        _FinishTestCase(self._communicator, status, test_case=test_case)
+      except Exception:  # pylint: disable-msg=W0703
+        # Keep uploading the following test cases.
+        logger.exception('Failed to upload and finish "%s".', test_case.url)
+
+
+class _SpoolDrainer(threading.Thread):
+  """Uploads the spooled results in the background.
+
+  Spooled test cases are uploaded oldest first and finished once uploaded, so
+  a spooled test case is only finished after the spool acknowledged it. After
+  an upload error, uploading is retried with an exponential backoff.
+
+  Attributes:
+    _communicator: An appengine_communicator.AppEngineCommunicator object to
+      use for uploading.
+    _spool: The upload_spool.UploadSpool object to drain.
+    _channel: A string representing the channel for the browser under test.
+    _upload_mode: A string indicating how to upload the results.
+    _stop_event: A threading.Event set when the drainer should stop.
+    _deadline: The time until which the spool is drained after stopping.
+  """
+
+  def __init__(self, communicator, spool, channel, upload_mode):
+    threading.Thread.__init__(self)
+    self.daemon = True
+    self._communicator = communicator
+    self._spool = spool
+    self._channel = channel
+    self._upload_mode = upload_mode
+    self._stop_event = threading.Event()
+    self._deadline = None
+
+  def Stop(self, timeout=SPOOL_DRAIN_TIMEOUT):
+    """Drain the spool for at most timeout seconds and stop the thread.
+
+    Items that are still spooled afterwards are uploaded by the next client
+    started with the same spool directory.
+
+    Args:
+      timeout: An optional number of seconds to keep draining the spool for.
+
+    Returns:
+      A boolean indicating whether the spool is empty.
+    """
+    self._deadline = time.time() + timeout
+    self._stop_event.set()
+    self.join()
+    return not self._spool.GetItems()
+
+  def _Drain(self):
+    """Upload the spooled items until an upload fails.
+
+    Returns:
+      A boolean indicating whether all the spooled items were handled.
+    """
+    for path in self._spool.GetItems():
+      try:
+        test_case, results, base64_png = self._spool.Load(path)
+      except upload_spool.SpoolError:
+        self._spool.Remove(path)
+        continue
+
+      if self._spool.GetAge(path) > SPOOL_MAX_AGE_SECONDS:
+        logger.warning('Dropping the spooled results for "%s".', test_case.url)
+        status = UPLOAD_ERROR
+      else:
+        logger.info('Uploading the spooled results for "%s".', test_case.url)
+        status = _UploadTestResults(self._communicator, test_case, results,
+                                    base64_png, self._channel,
+                                    upload_mode=self._upload_mode, retries=1)
+        if status == UPLOAD_ERROR:
+          return False
+
+      _FinishTestCase(self._communicator, status, test_case=test_case)
+      self._spool.Remove(path)
+    return True
+
+  def run(self):
+    attempt = 0
+    while True:
+      try:
+        drained = self._Drain()
+      except Exception:  # pylint: disable-msg=W0703
+        # Keep the thread alive, the items are still spooled.
+        logger.exception('Failed to drain the upload spool.')
+        drained = False
+
+      if drained:
+        attempt = 0
+        wait_time = SPOOL_POLL_SECONDS
+      else:
+        wait_time = min(SPOOL_POLL_SECONDS * 2 ** attempt,
+                        SPOOL_MAX_BACKOFF_SECONDS)
+        attempt += 1
+
+      if self._stop_event.isSet():
+        if drained or time.time() >= self._deadline:
+          return
+        wait_time = min(wait_time, self._deadline - time.time())
+      self._stop_event.wait(wait_time)
+
+
+class _BrowserWorker(threading.Thread):
+  """Processes test cases with its own browser until none is left.
+
+  Every worker drives its own browser, with its own profile, and leases its own
+  test cases. The processed test cases are handed to the shared uploader.
+
+  Attributes:
+    _worker_id: An int identifying the worker.
+    _communicator: An appengine_communicator.AppEngineCommunicator object to
+      use for requesting test cases.
+    _test_script: A string representing the javascript to run against the URLs.
+    _browser: A string representing the browser under test.
+    _uploader: The _ResultsUploader uploading the processed test cases.
+    finished: A boolean indicating whether the worker stopped because no test
+      case was left.
+  """
+
+  def __init__(self, worker_id, communicator, test_script, browser, uploader):
+    threading.Thread.__init__(self)
+    self.daemon = True
+    self._worker_id = worker_id
+    self._communicator = communicator
+    self._test_script = test_script
+    self._browser = browser
+    self._uploader = uploader
+    self.finished = False
+
+  def run(self):
+    driver = webdriver_wrapper.WebdriverWrapper(worker_id=self._worker_id)
+    test_case = None
+    try:
+      while True:
+        # Check webdriver status.
+        if not driver.IsRunning():
+          logger.info('Spawning the browser of worker %d.', self._worker_id)
+          _SpawnWebdriver(driver, self._browser)
+          if not driver.IsRunning():
+            logger.fatal('Could not start the browser of worker %d.',
+                         self._worker_id)
+            return
+
+        test_case = _FetchTestCase(self._communicator)
+        if not test_case or not test_case.url:
+          logger.info('No more URLs were available to worker %d.',
+                      self._worker_id)
+          self.finished = True
+          return
+
+        _Authenticate(driver, test_case)
+
+        logger.info('Worker %d is processing the test case: %s',
+                    self._worker_id, test_case.url)
+        status, results, base64_png = _ProcessTestCase(driver, test_case,
+                                                       self._test_script)
+        self._uploader.Add(test_case, status, results, base64_png)
+        test_case = None
+    except Exception:  # pylint: disable-msg=W0703
+      logger.exception('Worker %d stopped unexpectedly.', self._worker_id)
+    finally:
+      # Give back the test case leased but not processed, another worker
+      # processes it or it is released to the queue when the client stops.
+      if test_case and test_case.url:
+        self._communicator.ReturnTest(test_case)
+      driver.KillDriver()
+
 
+def _RunWorkerPool(communicator, test_script, channel, browser, upload_mode,
+                   num_workers, spool=None):
+  """Process test cases with several browsers at once until none is left.
 
-def _ShutdownClient(communicator, instance_id=''):
+  Args:
+    communicator: An appengine_communicator.AppEngineCommunicator object to
+      use for requesting test cases and uploading results. It is shared by all
+      the workers.
+    test_script: A string representing the javascript to run against the URLs.
+    channel: A string representing the channel for the browser under test.
+    browser: A string representing the browser under test.
+    upload_mode: A string indicating how to upload the results.
+    num_workers: The number of browser workers to run.
+    spool: An optional upload_spool.UploadSpool object for the results that
+      fail to upload.
+
+  Returns:
+    True if every worker stopped because no test case was left. This is only
+    known once all the workers have exited and their results were uploaded.
+  """
+  uploader = _ResultsUploader(communicator, channel, upload_mode,
+                              queue_size=max(PIPELINE_QUEUE_SIZE, num_workers),
+                              spool=spool)
+  uploader.start()
+
+  logger.info('Starting %d browser workers.', num_workers)
+  workers = [_BrowserWorker(worker_id, communicator, test_script, browser,
+                            uploader)
+             for worker_id in range(num_workers)]
+  try:
+    for worker in workers:
+      worker.start()
+    for worker in workers:
+      worker.join()
+  finally:
+    uploader.Stop()
+  return not [worker for worker in workers if not worker.finished]
+
+
+def _ShutdownClient(communicator, instance_id='', finished=False):
   """Shutdown the client and upload the current client log.
 
   Args:
@@ -338,6 +787,8 @@ def _ShutdownClient(communicator, instance_id=''):
       use for requesting a test case.
     instance_id: An optional string that specifies the machine's instance id
       if a communicator object has not been provided.
+    finished: An optional boolean indicating whether no test case is left and
+      all the results were uploaded, so the machine can be stopped.
   """
   # After logging is shutdown, no more logging should be done.
   logging.shutdown()
@@ -356,7 +807,81 @@ def _ShutdownClient(communicator, instance_id=''):
         communicator.UploadLog(log)
         break
       except appengine_communicator.CommunicationError:
-        appengine_communicator.AppEngineCommunicator.ExponentialBackoff(attempt)
+        http_transport.ExponentialBackoff(attempt)
+
+  if finished:
+    for attempt in range(COMMUNICATION_RETRIES):
+      try:
+        communicator.FinishClient()
+        break
+      except appengine_communicator.CommunicationError:
+        http_transport.ExponentialBackoff(attempt)
+
+
+def _RunPipelinedLoop(driver, communicator, test_script, channel, browser,
+                      upload_mode, spool=None):
+  """Process test cases until none is left, pipelining the communication.
+
+  The next test case is fetched while the current one is processed, and the
+  results are uploaded by a background thread, so the browser and the network
+  are busy at the same time.
+
+  Args:
+    driver: A webdriver_wrapper.WebdriverWrapper object for the browser under
+      test.
+    communicator: An appengine_communicator.AppEngineCommunicator object to
+      use for requesting test cases and uploading results.
+    test_script: A string representing the javascript to run against the URLs.
+    channel: A string representing the channel for the browser under test.
+    browser: A string representing the browser under test.
+    upload_mode: A string indicating how to upload the results.
+    spool: An optional upload_spool.UploadSpool object for the results that
+      fail to upload.
+
+  Returns:
+    True if the loop stopped because no test case was left.
+  """
+  uploader = _ResultsUploader(communicator, channel, upload_mode, spool=spool)
+  uploader.start()
+  prefetcher = _TestCasePrefetcher(communicator)
+  test_case = None
+
+  logger.info('Starting the pipelined test case fetching loop.')
+  try:
+    logger.info('Fetching a test case.')
+    prefetcher.Start()
+    while True:
+      # Check webdriver status.
+      if not driver.IsRunning():
+        logger.error('The webdriver browser is not running, restarting.')
+        _SpawnWebdriver(driver, browser)
+        if not driver.IsRunning():
+          logger.fatal('Could not restart the webdriver browser.')
+          return
+
+      test_case = prefetcher.Get()
+      if not test_case or not test_case.url:
+        logger.info('No more URLs were available to process.')
+        return True
+
+      # Fetch the next URL while processing this one.
+      prefetcher.Start()
+
+      logger.info('Authenticating if necessary.')
+      _Authenticate(driver, test_case)
+
+      logger.info('Processing the test case: %s', test_case.url)
+      status, results, base64_png = _ProcessTestCase(driver, test_case,
+                                                     test_script)
+      uploader.Add(test_case, status, results, base64_png)
+      test_case = None
+  finally:
+    # Give back the test cases fetched but not processed, they are released to
+    # the queue when the client stops.
+    for unprocessed in [test_case, prefetcher.Get()]:
+      if unprocessed and unprocessed.url:
+        communicator.ReturnTest(unprocessed)
+    uploader.Stop()
 
 
 def main():
@@ -373,6 +898,52 @@ def main():
   parser.add_option(
       '--browser', action='store', type='string', dest='browser',
       default='chrome', help='The browser to use for testing URLs.')
+  parser.add_option(
+      '--upload_mode', action='store', type='string', dest='upload_mode',
+      default=UPLOAD_MODE_BUNDLE,
+      help='How to upload the results: "bundle" or "pieces".')
+  parser.add_option(
+      '--pipelined', action='store_true', dest='pipelined', default=False,
+      help='Upload the results and fetch the next test case in the background '
+      'while processing the current test case.')
+  parser.add_option(
+      '--workers', action='store', type='int', dest='workers', default=0,
+      help='The number of browsers processing test cases at once. Defaults to '
+      'the number given by the user data, or %d.' % DEFAULT_WORKERS)
+  parser.add_option(
+      '--lease_size', action='store', type='int', dest='lease_size',
+      default=DEFAULT_LEASE_SIZE,
+      help='The number of test cases to lease from the distributor at once.')
+  parser.add_option(
+      '--spool_dir', action='store', type='string', dest='spool_dir',
+      default=DEFAULT_SPOOL_DIR,
+      help='The directory to spool the results that fail to upload to. An '
+      'empty string disables spooling.')
+  parser.add_option(
+      '--layout_format', action='store', type='string', dest='layout_format',
+      default=LAYOUT_FORMAT_RLE,
+      help='The format to capture the layout table in: "dense", "rle" or '
+      '"blocks". The blocks format samples the corners and the center of '
+      'every block, so it only captures every pixel with --block_size=1.')
+  parser.add_option(
+      '--block_size', action='store', type='int', dest='block_size', default=0,
+      help='The size of the blocks of the blocks layout format in pixels. '
+      'Defaults to the size of the content script.')
+  parser.add_option(
+      '--screenshot_format', action='store', type='string',
+      dest='screenshot_format', default=screenshot_transcode.FORMAT_PNG,
+      help='The format to upload the screenshots in: "png" or "jpeg". Needs '
+      'the Python Imaging Library for formats other than "png".')
+  parser.add_option(
+      '--screenshot_quality', action='store', type='int',
+      dest='screenshot_quality', default=screenshot_transcode.DEFAULT_QUALITY,
+      help='The quality of the uploaded JPEG screenshots, from 1 to 100.')
+  parser.add_option(
+      '--thumbnail_size', action='store', type='int', dest='thumbnail_size',
+      default=screenshot_transcode.DEFAULT_THUMBNAIL_SIZE,
+      help='The maximum width and height of the screenshot thumbnails to '
+      'upload, in pixels. 0 disables the thumbnails. Needs the Python Imaging '
+      'Library.')
 
   (FLAGS, args) = parser.parse_args()
 
@@ -380,8 +951,35 @@ def main():
     parser.error('The --browser option must be one of: %s' %
                  str(BROWSER_OPTIONS))
 
+  if FLAGS.upload_mode not in UPLOAD_MODE_OPTIONS:
+    parser.error('The --upload_mode option must be one of: %s' %
+                 str(UPLOAD_MODE_OPTIONS))
+
+  if FLAGS.layout_format not in LAYOUT_FORMAT_OPTIONS:
+    parser.error('The --layout_format option must be one of: %s' %
+                 str(LAYOUT_FORMAT_OPTIONS))
+
+  if FLAGS.block_size < 0:
+    parser.error('The --block_size option must not be negative.')
+
+  if FLAGS.screenshot_format not in screenshot_transcode.FORMATS:
+    parser.error('The --screenshot_format option must be one of: %s' %
+                 str(screenshot_transcode.FORMATS))
+
+  if not 1 <= FLAGS.screenshot_quality <= 100:
+    parser.error('The --screenshot_quality option must be from 1 to 100.')
+
+  if FLAGS.thumbnail_size < 0:
+    parser.error('The --thumbnail_size option must not be negative.')
+
+  if FLAGS.lease_size < 1:
+    parser.error('The --lease_size option must be at least 1.')
+
   instance_id = None
   communicator = None
+  spool_drainer = None
+  # Whether the run ended because no test case was left.
+  finished = False
   try:
     logger.info('Starting client initialization.')
 
@@ -391,15 +989,18 @@ def main():
       return
 
     # Verify the flags.
+    channel = ''
+    workers = None
     if FLAGS.token:
       token = FLAGS.token
     else:
-      token, channel = _FetchUserDataTokenAndChannel()
+      token, channel, workers = _FetchUserData()
       if not token:
         logger.error('Could not get a valid token.')
         return
       if not channel:
         channel = ''
+    workers = FLAGS.workers or workers or DEFAULT_WORKERS
 
     logger.info('Instance id and user data were loaded.')
 
@@ -418,14 +1019,40 @@ def main():
     logger.info('The useragent string was loaded: "%s".', useragent)
 
     communicator = appengine_communicator.AppEngineCommunicator(
-        token, useragent, instance_id)
+        token, useragent, instance_id,
+        screenshot_format=FLAGS.screenshot_format,
+        screenshot_quality=FLAGS.screenshot_quality,
+        thumbnail_size=FLAGS.thumbnail_size, lease_size=FLAGS.lease_size)
 
     # Register our atexit handler now that the communicator has been created.
     atexit.register(_ShutdownClient, communicator)
 
     # Load the test script.
     logger.info('Loading the test script.')
-    test_script = _LoadFileToString(FLAGS.test_script)
+    test_script = _ConfigureTestScript(_LoadFileToString(FLAGS.test_script),
+                                       FLAGS.layout_format, FLAGS.block_size)
+
+    # Start uploading the results spooled by this or a previous client.
+    spool = None
+    if FLAGS.spool_dir:
+      spool = upload_spool.UploadSpool(FLAGS.spool_dir)
+      spool_drainer = _SpoolDrainer(communicator, spool, channel,
+                                    FLAGS.upload_mode)
+      spool_drainer.start()
+
+    if workers > 1:
+      # Every worker spawns its own browser.
+      driver.KillDriver()
+      finished = _RunWorkerPool(communicator, test_script, channel,
+                                FLAGS.browser, FLAGS.upload_mode, workers,
+                                spool=spool)
+      return
+
+    if FLAGS.pipelined:
+      finished = _RunPipelinedLoop(driver, communicator, test_script, channel,
+                                   FLAGS.browser, FLAGS.upload_mode,
+                                   spool=spool)
+      return
 
     logger.info('Starting the test case fetching loop.')
     while True:
@@ -443,6 +1070,7 @@ def main():
 
       if not test_case or not test_case.url:
         logger.info('No more URLs were available to process.')
+        finished = True
         return
 
       # Authenticate if necessary.
@@ -458,17 +1086,30 @@ def main():
       if status == SUCCESS:
         logger.info('Uploading the results.')
         status = _UploadTestResults(communicator, test_case, results,
-                                    base64_png, channel)
+                                    base64_png, channel,
+                                    upload_mode=FLAGS.upload_mode)
+        if (status == UPLOAD_ERROR and
+            _SpoolTestResults(communicator, spool, test_case, results,
+                              base64_png)):
+          # The spool finishes the test case once the results are uploaded.
+          continue
       else:
         logger.info('Test case status is "%s", not uploading results.', status)
 
-      # Finish the URL.
+      # Finish the URL. This does nothing if the bundled upload finished it.
       logger.info('Finishing the test case for "%s" with status "%s".',
                   test_case.url, status)
       _FinishTestCase(communicator, status)
   finally:
+    if communicator:
+      _ReleaseTestCases(communicator)
+    if spool_drainer:
+      logger.info('Uploading the spooled results.')
+      if not spool_drainer.Stop():
+        # Keep the machine, the next client uploads the spooled results.
+        finished = False
     logger.info('Shutting down the client.')
-    _ShutdownClient(communicator, instance_id=instance_id)
+    _ShutdownClient(communicator, instance_id=instance_id, finished=finished)
 
 
 if __name__ == '__main__':
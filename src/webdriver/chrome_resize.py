@@ -34,6 +34,9 @@ CHROME_WINDOWS_USER_DATA = ('C:\\Users\\%s\\AppData\\Local\\Google\\Chrome\\'
                             'User Data\\')
 CHROME_LINUX_USER_DATA = '~/.config/google-chrome/'
 
+# Directory of the profile of each browser worker, in the Chrome user data.
+WORKER_PROFILE_DIR = 'Worker %d'
+
 
 CHROME_WINDOWS_EXECUTABLE = ('C:\\Program Files\\Google\\Chrome\\'
                              'Application\\chrome.exe')
@@ -63,28 +66,42 @@ LOGGER_NAME = 'chrome_resize'
 logger = client_logging.GetLogger(LOGGER_NAME)
 
 
-def GetChromeProfilePath():
+def GetChromeProfilePath(worker_id=None):
   """Return the path the to the Chrome profile.
 
+  Args:
+    worker_id: An optional int identifying the browser worker. Every worker
+      has its own profile, inside the default profile directory.
+
   Returns:
     A string representing the path to the Chrome profile for the current OS.
   """
   operating_system = platform.uname()[0]
 
   if operating_system == 'Windows':
-    return CHROME_WINDOWS_USER_DATA % getpass.getuser()
+    profile_path = CHROME_WINDOWS_USER_DATA % getpass.getuser()
   elif operating_system == 'Linux':
-    return CHROME_LINUX_USER_DATA
+    profile_path = CHROME_LINUX_USER_DATA
+  else:
+    return None
 
+  if worker_id is not None:
+    profile_path = os.path.join(profile_path, WORKER_PROFILE_DIR % worker_id)
+  return profile_path
 
-def GetChromeProfilePreferences():
+
+def GetChromeProfilePreferences(worker_id=None):
   """Return the path the to the Chrome profile preferences file.
 
+  Args:
+    worker_id: An optional int identifying the browser worker.
+
   Returns:
     A string representing the path to the Chrome profile preferences file
     for the current OS.
   """
-  return os.path.join(GetChromeProfilePath(), 'Default', 'Preferences')
+  return os.path.join(GetChromeProfilePath(worker_id), 'Default',
+                      'Preferences')
 
 
 def _GetChromeExecutable():
@@ -101,15 +118,24 @@ def _GetChromeExecutable():
     return CHROME_LINUX_EXECUTABLE
 
 
-def _SpawnAndKillChrome():
-  """Spawn and kill Chrome in order to set up the profile."""
+def _SpawnAndKillChrome(worker_id=None):
+  """Spawn and kill Chrome in order to set up the profile.
+
+  Args:
+    worker_id: An optional int identifying the browser worker whose profile
+      to set up.
+  """
+  command = [_GetChromeExecutable()]
+  if worker_id is not None:
+    command.append('--user-data-dir=%s' % GetChromeProfilePath(worker_id))
+
   # Spawn and kill chrome to set up the profile
-  chrome_process = subprocess.Popen(_GetChromeExecutable())
+  chrome_process = subprocess.Popen(command)
   time.sleep(10)
   chrome_process.terminate()
 
 
-def SetChromeWindowSize(width, height):
+def SetChromeWindowSize(width, height, worker_id=None):
   """Set the default size for the Chrome window.
 
   The Chrome window size must be set before Chrome is opened.
@@ -117,15 +143,17 @@ def SetChromeWindowSize(width, height):
   Args:
     width: An integer representing the width for the browser.
     height: An integer representing the height for the browser.
+    worker_id: An optional int identifying the browser worker whose profile
+      to update.
   """
   try:
-    with open(GetChromeProfilePreferences(), 'r') as f:
+    with open(GetChromeProfilePreferences(worker_id), 'r') as f:
       file_contents = f.read()
   except IOError:
     logger.info('The Preferences file does not exist, spawning Chrome.')
-    _SpawnAndKillChrome()
+    _SpawnAndKillChrome(worker_id)
 
-  _SetChromeWindowPreferences(GetChromeProfilePreferences(),
+  _SetChromeWindowPreferences(GetChromeProfilePreferences(worker_id),
                               width, height)
 
 
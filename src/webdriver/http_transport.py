@@ -0,0 +1,425 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Shared HTTP transport for the communication of the bots with the servers.
+
+All requests go through one session that keeps a pool of idle keep-alive
+connections per host, so consecutive requests to a server reuse the TCP (and
+TLS) connection. Requests have a timeout, ask for gzip compressed responses
+and are retried on connection failures and server errors with an exponential
+backoff, the retry policy shared by all the client modules.
+
+The module only depends on the standard library, because it is shared by the
+bots client and the client setup scripts.
+"""
+
+
+
+import errno
+import gzip
+import httplib
+import math
+import random
+import socket
+import StringIO
+import threading
+import time
+import urllib
+import urlparse
+import zlib
+
+
+DEFAULT_TIMEOUT = 60
+DEFAULT_RETRIES = 1
+
+# The maximum base time to wait between retries in seconds.
+MAX_WAIT_TIME = 3
+
+# The maximum number of idle connections kept per host.
+MAX_IDLE_CONNECTIONS = 8
+
+# App Engine only compresses the responses to user agents containing "gzip".
+USER_AGENT = 'QualityBots (gzip)'
+
+# Request bodies smaller than this are not worth compressing.
+GZIP_MIN_SIZE = 1024
+
+FORM_CONTENT_TYPE = 'application/x-www-form-urlencoded'
+
+# The redirect statuses followed by the requests that follow redirects. Only
+# 307 redirects keep the method and the body, the others are followed with a
+# GET, like urllib2 does.
+REDIRECT_STATUSES = [301, 302, 303, 307]
+REDIRECT_KEEP_METHOD_STATUS = 307
+MAX_REDIRECTS = 5
+
+
+class TransportError(Exception):
+  """A request failed.
+
+  Attributes:
+    status: The int HTTP status of the response, or None if no response was
+      received.
+  """
+
+  def __init__(self, message, status=None):
+    Exception.__init__(self, message)
+    self.status = status
+
+
+class Response(object):
+  """The response to a request.
+
+  Attributes:
+    status: An int representing the HTTP status.
+    headers: A dictionary of the response headers, with lowercase names.
+    body: A string representing the (decompressed) response body.
+  """
+
+  def __init__(self, status, headers, body):
+    self.status = status
+    self.headers = headers
+    self.body = body
+
+  def read(self):
+    """Return the response body, like the responses of urllib2."""
+    return self.body
+
+
+def ExponentialBackoff(attempt, max_wait_time=MAX_WAIT_TIME):
+  """Wait a time that increases exponentially with the attempt number.
+
+  Args:
+    attempt: The most recent attempt number (starting at 0).
+    max_wait_time: An optional int that specifies the max base time to wait
+      in seconds.
+  """
+  sleep_time = math.pow(2, attempt) * random.uniform(0.5, 1.0) * max_wait_time
+  time.sleep(sleep_time)
+
+
+def _IsClosedConnectionError(error):
+  """Return whether a request failed because the server closed the connection.
+
+  Args:
+    error: The httplib.HTTPException or socket.error raised by the request,
+      before any byte of the response was read.
+
+  Returns:
+    True if the connection was reset or closed without a response, False
+    otherwise. Timeouts are not connection closes.
+  """
+  if isinstance(error, httplib.BadStatusLine):
+    # Python 2.7 sets a message instead of the empty status line.
+    return not error.line or error.line.startswith('No status line received')
+  if isinstance(error, socket.timeout):
+    return False
+  if isinstance(error, socket.error):
+    return error.args and error.args[0] in (errno.ECONNRESET, errno.EPIPE)
+  return False
+
+
+def _GzipCompress(data):
+  output = StringIO.StringIO()
+  gzip_file = gzip.GzipFile(fileobj=output, mode='wb')
+  try:
+    gzip_file.write(data)
+  finally:
+    gzip_file.close()
+  return output.getvalue()
+
+
+class Session(object):
+  """Sends requests over pooled keep-alive connections.
+
+  Sessions can be used from several threads at once; every request uses its
+  own connection.
+
+  Attributes:
+    _timeout: The default request timeout in seconds.
+    _max_idle_connections: The maximum number of idle connections per host.
+    _lock: A threading.Lock protecting the pools.
+    _pools: A dictionary from (scheme, host) tuples to lists of the idle
+      httplib connections to the host.
+  """
+
+  def __init__(self, timeout=DEFAULT_TIMEOUT,
+               max_idle_connections=MAX_IDLE_CONNECTIONS):
+    self._timeout = timeout
+    self._max_idle_connections = max_idle_connections
+    self._lock = threading.Lock()
+    self._pools = {}
+
+  def _GetConnection(self, scheme, host, timeout):
+    """Return an idle connection to the host, or a new one.
+
+    Returns:
+      A tuple of the httplib connection and a boolean indicating whether the
+      connection was used before.
+    """
+    self._lock.acquire()
+    try:
+      pool = self._pools.get((scheme, host))
+      connection = pool and pool.pop()
+    finally:
+      self._lock.release()
+
+    if connection:
+      connection.timeout = timeout
+      if connection.sock:
+        connection.sock.settimeout(timeout)
+      return (connection, True)
+
+    if scheme == 'https':
+      return (httplib.HTTPSConnection(host, timeout=timeout), False)
+    return (httplib.HTTPConnection(host, timeout=timeout), False)
+
+  def _ReleaseConnection(self, scheme, host, connection):
+    """Return a connection to the pool once its response was read."""
+    self._lock.acquire()
+    try:
+      pool = self._pools.setdefault((scheme, host), [])
+      if len(pool) < self._max_idle_connections:
+        pool.append(connection)
+        return
+    finally:
+      self._lock.release()
+    connection.close()
+
+  def Close(self):
+    """Close all the idle connections."""
+    self._lock.acquire()
+    try:
+      pools = self._pools
+      self._pools = {}
+    finally:
+      self._lock.release()
+    for pool in pools.values():
+      for connection in pool:
+        connection.close()
+
+  def _Send(self, method, url, chunks, headers, timeout):
+    """Send a request once and read its response.
+
+    A request on a reused connection is sent again on a new connection if the
+    server had closed the idle connection, that is if the connection was
+    reset or closed before any byte of the response was read. Requests are
+    not sent again after other failures, like timeouts, since the server may
+    have processed them.
+
+    Returns:
+      A Response object.
+
+    Raises:
+      TransportError: The request could not be sent or the response could not
+        be read.
+    """
+    scheme, host, path, query = urlparse.urlsplit(url)[:4]
+    if query:
+      path = '%s?%s' % (path, query)
+
+    reused = True
+    while reused:
+      connection, reused = self._GetConnection(scheme, host, timeout)
+      response = None
+      try:
+        connection.putrequest(method, path or '/', skip_accept_encoding=True)
+        connection.putheader('Accept-Encoding', 'gzip')
+        if chunks is not None:
+          connection.putheader('Content-Length',
+                               str(sum([len(chunk) for chunk in chunks])))
+        for name, value in headers.items():
+          connection.putheader(name, value)
+        connection.endheaders()
+        for chunk in chunks or []:
+          connection.send(chunk)
+
+        response = connection.getresponse()
+        body = response.read()
+      except (httplib.HTTPException, socket.error), e:
+        connection.close()
+        if reused and not response and _IsClosedConnectionError(e):
+          continue
+        raise TransportError('Request to "%s" failed: %s' % (url, e))
+
+      response_headers = dict(response.getheaders())
+      if response.will_close:
+        connection.close()
+      else:
+        self._ReleaseConnection(scheme, host, connection)
+
+      if response_headers.get('content-encoding') == 'gzip':
+        try:
+          body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        except zlib.error:
+          raise TransportError('Invalid gzip response from "%s".' % url,
+                               response.status)
+      return Response(response.status, response_headers, body)
+
+  def _FollowRedirects(self, response, method, url, chunks, headers, timeout):
+    """Follow the redirects of a response.
+
+    Args:
+      response: The Response object to the request.
+      method: A string representing the HTTP method of the request.
+      url: A string representing the URL of the request.
+      chunks: A list of the strings of the request body, or None.
+      headers: A dictionary of the request headers.
+      timeout: The timeout of the requests in seconds.
+
+    Returns:
+      The Response object to the last request, which is not a redirect.
+
+    Raises:
+      TransportError: A request failed, or there are too many redirects.
+    """
+    for _ in range(MAX_REDIRECTS + 1):
+      location = response.headers.get('location')
+      if response.status not in REDIRECT_STATUSES or not location:
+        return response
+
+      url = urlparse.urljoin(url, location)
+      if response.status != REDIRECT_KEEP_METHOD_STATUS:
+        method = 'GET'
+        chunks = None
+        headers = dict([(name, value) for name, value in headers.items()
+                        if name.lower() not in ('content-type',
+                                                'content-encoding')])
+      response = self._Send(method, url, chunks, headers, timeout)
+    raise TransportError('Too many redirects to "%s".' % url, response.status)
+
+  def Request(self, method, url, body=None, headers=None, gzip_body=False,
+              retries=DEFAULT_RETRIES, timeout=None, follow_redirects=False):
+    """Send a request, with retries.
+
+    Requests are retried after connection failures and server errors (5xx).
+    Redirects are only followed if asked, otherwise the redirect response is
+    returned (e.g. the blobstore upload redirect).
+
+    Args:
+      method: A string representing the HTTP method.
+      url: A string representing the URL to request.
+      body: An optional string, or list of strings sent one after the other,
+        representing the request body. The strings are sent as they are,
+        without joining them.
+      headers: An optional dictionary of the request headers.
+      gzip_body: An optional boolean indicating whether to gzip compress the
+        body. The server must accept compressed request bodies.
+      retries: An optional number of attempts.
+      timeout: An optional timeout in seconds, instead of the session one.
+      follow_redirects: An optional boolean indicating whether to follow the
+        redirects (REDIRECT_STATUSES), like urllib2.
+
+    Returns:
+      A Response object with a status below 400.
+
+    Raises:
+      TransportError: The request failed after all the attempts, or the server
+        responded with an error status.
+    """
+    headers = dict(headers or {})
+    headers.setdefault('User-Agent', USER_AGENT)
+    chunks = body
+    if isinstance(body, basestring):
+      chunks = [body]
+    if gzip_body and chunks and sum([len(c) for c in chunks]) >= GZIP_MIN_SIZE:
+      chunks = [_GzipCompress(''.join(chunks))]
+      headers['Content-Encoding'] = 'gzip'
+    if timeout is None:
+      timeout = self._timeout
+
+    error = None
+    for attempt in range(retries):
+      if attempt:
+        ExponentialBackoff(attempt - 1)
+      try:
+        response = self._Send(method, url, chunks, headers, timeout)
+        if follow_redirects:
+          response = self._FollowRedirects(response, method, url, chunks,
+                                           headers, timeout)
+      except TransportError, e:
+        error = e
+        continue
+
+      if response.status < 400:
+        return response
+      error = TransportError('Request to "%s" failed with status %d.' % (
+          url, response.status), response.status)
+      if response.status < 500:
+        break
+    raise error
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def GetSession():
+  """Return the session shared by all the client modules."""
+  global _session
+  _session_lock.acquire()
+  try:
+    if not _session:
+      _session = Session()
+    return _session
+  finally:
+    _session_lock.release()
+
+
+def Get(url, params=None, **kwargs):
+  """GET a URL with the shared session.
+
+  Args:
+    url: A string representing the URL to request.
+    params: An optional dictionary of URL params to send with the request.
+    kwargs: Optional arguments of Session.Request.
+
+  Returns:
+    A Response object.
+
+  Raises:
+    TransportError: The request failed.
+  """
+  if params:
+    url = '%s?%s' % (url, urllib.urlencode(params))
+  return GetSession().Request('GET', url, **kwargs)
+
+
+def Post(url, data, content_type=FORM_CONTENT_TYPE, headers=None, **kwargs):
+  """POST data to a URL with the shared session.
+
+  Args:
+    url: A string representing the URL to post to.
+    data: A dictionary of form fields to send form-encoded, or the string (or
+      list of strings) body.
+    content_type: An optional string representing the content type of the
+      body.
+    headers: An optional dictionary of additional request headers.
+    kwargs: Optional arguments of Session.Request.
+
+  Returns:
+    A Response object.
+
+  Raises:
+    TransportError: The request failed.
+  """
+  if isinstance(data, dict):
+    data = urllib.urlencode(data)
+  headers = dict(headers or {})
+  headers['Content-Type'] = content_type
+  return GetSession().Request('POST', url, body=data, headers=headers,
+                              **kwargs)
@@ -0,0 +1,211 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Tests for http_transport."""
+
+
+
+import BaseHTTPServer
+import threading
+import time
+import unittest
+import zlib
+
+import http_transport
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+  """Answers with the request path and body, and records the requests."""
+
+  protocol_version = 'HTTP/1.1'
+
+  def log_message(self, *args):
+    pass
+
+  def _Respond(self, body):
+    self.server.requests.append((self.command, self.path, self.client_address,
+                                 dict(self.headers.items()), body))
+    status = 200
+    if self.server.statuses:
+      status = self.server.statuses.pop(0)
+
+    if self.path.startswith('/slow'):
+      time.sleep(0.5)
+
+    if self.path.startswith('/redirect'):
+      self.send_response(302)
+      self.send_header('Location', '/target')
+      self.send_header('Content-Length', '0')
+      self.end_headers()
+      return
+
+    response = '%s %s %s' % (self.command, self.path, body)
+    self.send_response(status)
+    if 'gzip' in self.headers.get('accept-encoding', ''):
+      compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+      response = compressor.compress(response) + compressor.flush()
+      self.send_header('Content-Encoding', 'gzip')
+    self.send_header('Content-Length', str(len(response)))
+    self.end_headers()
+    self.wfile.write(response)
+
+    if self.path.startswith('/close'):
+      # Close the connection without telling the client, like a server closing
+      # an idle keep-alive connection.
+      self.close_connection = 1
+
+  # Disable 'Invalid method name' lint error.
+  # pylint: disable-msg=C6409
+  def do_GET(self):
+    self._Respond('')
+
+  # Disable 'Invalid method name' lint error.
+  # pylint: disable-msg=C6409
+  def do_POST(self):
+    body = self.rfile.read(int(self.headers['content-length']))
+    if self.headers.get('content-encoding') == 'gzip':
+      body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    self._Respond(body)
+
+
+class ExponentialBackoffTest(unittest.TestCase):
+
+  def testExponentialBackoff_FirstAttempt(self):
+    start = time.time()
+    http_transport.ExponentialBackoff(0)
+    finish = time.time()
+    self.assertTrue(start+1 < finish)
+    self.assertTrue(start+3 > finish)
+
+  def testExponentialBackoff_SecondAttempt(self):
+    start = time.time()
+    http_transport.ExponentialBackoff(1)
+    finish = time.time()
+    self.assertTrue(start+3 < finish)
+    self.assertTrue(start+10 > finish)
+
+
+class HttpTransportTest(unittest.TestCase):
+
+  def setUp(self):
+    self._server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), _Handler)
+    self._server.requests = []
+    self._server.statuses = []
+    self._thread = threading.Thread(target=self._server.serve_forever)
+    self._thread.daemon = True
+    self._thread.start()
+    self._url = 'http://127.0.0.1:%d' % self._server.server_address[1]
+    self._session = http_transport.Session(timeout=5)
+    self._backoff = http_transport.ExponentialBackoff
+    http_transport.ExponentialBackoff = lambda attempt: None
+
+  def tearDown(self):
+    http_transport.ExponentialBackoff = self._backoff
+    self._session.Close()
+    self._server.shutdown()
+    self._server.server_close()
+
+  def testRequest_ReusesConnection(self):
+    for i in range(3):
+      response = self._session.Request('GET', self._url + '/get?i=%d' % i)
+      self.assertEqual(200, response.status)
+      self.assertEqual('GET /get?i=%d ' % i, response.read())
+
+    # All the requests came from the same client socket.
+    self.assertEqual(1, len(set([r[2] for r in self._server.requests])))
+    self.assertEqual(http_transport.USER_AGENT,
+                     self._server.requests[0][3]['user-agent'])
+
+  def testRequest_Chunks(self):
+    response = self._session.Request('POST', self._url + '/post',
+                                     body=['abc', '', 'def'])
+    self.assertEqual('POST /post abcdef', response.body)
+
+  def testRequest_GzipBody(self):
+    body = 'x' * http_transport.GZIP_MIN_SIZE
+    response = self._session.Request('POST', self._url, body=body,
+                                     gzip_body=True)
+    self.assertEqual('POST / ' + body, response.body)
+    headers = self._server.requests[0][3]
+    self.assertEqual('gzip', headers['content-encoding'])
+    self.assertTrue(int(headers['content-length']) < len(body))
+
+  def testRequest_RetriesServerErrors(self):
+    self._server.statuses = [503, 500]
+    response = self._session.Request('GET', self._url, retries=3)
+    self.assertEqual(200, response.status)
+    self.assertEqual(3, len(self._server.requests))
+
+  def testRequest_ErrorStatus(self):
+    self._server.statuses = [503, 404]
+    try:
+      self._session.Request('GET', self._url, retries=3)
+      self.fail('No error was raised.')
+    except http_transport.TransportError, e:
+      self.assertEqual(404, e.status)
+    # Client errors are not retried.
+    self.assertEqual(2, len(self._server.requests))
+
+  def testRequest_ClosedConnection(self):
+    self._session.Request('GET', self._url + '/close')
+    response = self._session.Request('POST', self._url + '/post', body='abc')
+    self.assertEqual('POST /post abc', response.body)
+
+    # The request was sent again on a new connection.
+    self.assertEqual(2, len(self._server.requests))
+    self.assertNotEqual(self._server.requests[0][2],
+                        self._server.requests[1][2])
+
+  def testRequest_TimeoutNotResent(self):
+    self._session.Request('GET', self._url + '/get')
+    self.assertRaises(http_transport.TransportError, self._session.Request,
+                      'POST', self._url + '/slow', body='abc', timeout=0.1)
+
+    # Give a request sent again the time to reach the server.
+    time.sleep(1.5)
+    self.assertEqual(['/get', '/slow'],
+                     [r[1] for r in self._server.requests])
+
+  def testRequest_Redirect(self):
+    response = self._session.Request('GET', self._url + '/redirect')
+    self.assertEqual(302, response.status)
+    self.assertEqual('/target', response.headers['location'])
+
+  def testRequest_FollowRedirects(self):
+    response = self._session.Request('GET', self._url + '/redirect',
+                                     follow_redirects=True)
+    self.assertEqual(200, response.status)
+    self.assertEqual('GET /target ', response.body)
+
+    # Posts are sent again as a GET.
+    response = self._session.Request('POST', self._url + '/redirect',
+                                     body='abc', follow_redirects=True)
+    self.assertEqual('GET /target ', response.body)
+
+  def testRequest_ConnectionFailed(self):
+    self._server.shutdown()
+    self._server.server_close()
+    self.assertRaises(http_transport.TransportError, self._session.Request,
+                      'GET', self._url, retries=2)
+
+
+def main():
+  unittest.main()
+
+
+if __name__ == '__main__':
+  main()
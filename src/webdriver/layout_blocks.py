@@ -0,0 +1,68 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Splits block-structured layout tables into pieces for upload.
+
+The adaptive capture mode of the content script produces a list of uniform
+blocks, each a [nid, x, y, width, height] list. The server stores and
+compares the layout table by pieces of pixel rows, so the blocks are split at
+the same rows as the rows of the other formats: blocks crossing a piece
+boundary are clipped into one block per piece, and the y coordinates are made
+relative to the first row of the piece (see
+src/appengine/common/layout_blocks.py).
+"""
+
+
+
+import math
+
+
+LAYOUT_FORMAT_BLOCKS = 'blocks'
+
+
+def GetRowCount(blocks):
+  """Returns the number of pixel rows covered by a list of blocks."""
+  count = 0
+  for block in blocks:
+    count = max(count, block[2] + block[4])
+  return count
+
+
+def SplitBlocks(blocks, num_pieces):
+  """Splits a block-structured layout table into pieces of pixel rows.
+
+  Args:
+    blocks: A list of [nid, x, y, width, height] blocks.
+    num_pieces: The number of pieces to split the table into.
+
+  Returns:
+    A list of num_pieces lists of blocks.
+  """
+  pieces = [[] for _ in range(num_pieces)]
+  n_rows_per_piece = int(math.ceil(GetRowCount(blocks) / (num_pieces * 1.0)))
+  if not n_rows_per_piece:
+    return pieces
+
+  for nid, x, y, width, height in blocks:
+    first = y // n_rows_per_piece
+    last = (y + height - 1) // n_rows_per_piece
+    for piece in range(first, last + 1):
+      piece_top = piece * n_rows_per_piece
+      top = max(y, piece_top)
+      bottom = min(y + height, piece_top + n_rows_per_piece)
+      pieces[piece].append([nid, x, top - piece_top, width, bottom - top])
+  return pieces
@@ -0,0 +1,49 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Tests for layout_blocks."""
+
+
+
+import unittest
+
+import layout_blocks
+
+
+class LayoutBlocksTest(unittest.TestCase):
+
+  def testSplitBlocks(self):
+    blocks = [[1, 0, 0, 4, 3], [2, 4, 0, 2, 2], [3, 4, 2, 2, 1],
+              [4, 0, 3, 6, 1]]
+    self.assertEqual([[[1, 0, 0, 4, 2], [2, 4, 0, 2, 2]],
+                      [[1, 0, 0, 4, 1], [3, 4, 0, 2, 1], [4, 0, 1, 6, 1]]],
+                     layout_blocks.SplitBlocks(blocks, 2))
+
+  def testSplitBlocks_MorePiecesThanRows(self):
+    self.assertEqual([[[7, 0, 0, 2, 1]], [[7, 0, 0, 2, 1]], [], []],
+                     layout_blocks.SplitBlocks([[7, 0, 0, 2, 2]], 4))
+
+  def testSplitBlocks_Empty(self):
+    self.assertEqual([[], []], layout_blocks.SplitBlocks([], 2))
+
+
+def main():
+  unittest.main()
+
+
+if __name__ == '__main__':
+  main()
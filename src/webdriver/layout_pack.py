@@ -0,0 +1,96 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Packs pieces of run-length encoded layout tables for upload.
+
+A packed piece is a fixed little-endian header followed by the (optionally
+zlib compressed) payload:
+    magic 'LPCK', version, value type code, compression, padding, row count
+    row lengths (uint32, one per row)
+    row values (int16 or int32, all rows concatenated)
+
+Row values are the flat run-length encoded rows. They are stored signed
+because the content script uses negative node ids for pixels without an
+element. The server decodes the pieces with its own copy of this format (see
+src/appengine/common/layout_pack.py).
+"""
+
+
+
+import array
+import struct
+import sys
+import zlib
+
+
+CONTENT_TYPE = 'application/octet-stream'
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+
+_MAGIC = 'LPCK'
+_VERSION = 1
+_HEADER_FORMAT = '<4sBcBxI'
+
+# Array type codes of the row values, from the smallest.
+_VALUE_TYPES = ['h', 'i']
+_LENGTH_TYPE = 'I'
+
+
+def _ToLittleEndian(values):
+  """Converts an array between native and little-endian byte order in place."""
+  if sys.byteorder == 'big':
+    values.byteswap()
+  return values
+
+
+def Encode(rows, compression=COMPRESSION_ZLIB):
+  """Packs run-length encoded layout table rows.
+
+  Args:
+    rows: A list of flat run-length encoded rows of integers.
+    compression: An optional compression, COMPRESSION_ZLIB or
+      COMPRESSION_NONE.
+
+  Returns:
+    The packed piece as a binary string.
+  """
+  lengths = array.array(_LENGTH_TYPE, [len(row) for row in rows])
+  flat = []
+  for row in rows:
+    flat.extend(row)
+
+  value_type = _VALUE_TYPES[-1]
+  if flat:
+    low = min(flat)
+    high = max(flat)
+  else:
+    low = high = 0
+  for type_code in _VALUE_TYPES:
+    bits = array.array(type_code).itemsize * 8
+    if -(1 << (bits - 1)) <= low and high < (1 << (bits - 1)):
+      value_type = type_code
+      break
+  values = array.array(value_type, flat)
+
+  payload = (_ToLittleEndian(lengths).tostring() +
+             _ToLittleEndian(values).tostring())
+  if compression == COMPRESSION_ZLIB:
+    payload = zlib.compress(payload)
+  header = struct.pack(_HEADER_FORMAT, _MAGIC, _VERSION, value_type,
+                       compression, len(rows))
+  return header + payload
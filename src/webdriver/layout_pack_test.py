@@ -0,0 +1,51 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Tests for layout_pack."""
+
+
+
+import struct
+import unittest
+import zlib
+
+import layout_pack
+
+
+class LayoutPackTest(unittest.TestCase):
+
+  def testEncode(self):
+    data = layout_pack.Encode([[5, 3, -1, 2], [7, 1]],
+                              layout_pack.COMPRESSION_NONE)
+    self.assertEqual(('LPCK', 1, 'h', 0, 2), struct.unpack('<4sBcBxI',
+                                                           data[:12]))
+    self.assertEqual(struct.pack('<II6h', 4, 2, 5, 3, -1, 2, 7, 1), data[12:])
+
+  def testEncode_Compressed(self):
+    data = layout_pack.Encode([[70000, 2]])
+    self.assertEqual(('LPCK', 1, 'i', 1, 1), struct.unpack('<4sBcBxI',
+                                                           data[:12]))
+    self.assertEqual(struct.pack('<I2i', 2, 70000, 2),
+                     zlib.decompress(data[12:]))
+
+
+def main():
+  unittest.main()
+
+
+if __name__ == '__main__':
+  main()
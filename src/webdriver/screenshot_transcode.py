@@ -0,0 +1,126 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Transcodes the PNG screenshots before they are uploaded.
+
+Screenshots can be converted to a smaller format and a small thumbnail can be
+created for them. Both need the Python Imaging Library; without it the PNG
+screenshots are uploaded as they are and no thumbnails are created.
+"""
+
+
+
+import StringIO
+
+import client_logging
+
+# The Python Imaging Library is optional; screenshots are not transcoded
+# without it.
+try:
+  from PIL import Image
+except ImportError:
+  try:
+    import Image
+  except ImportError:
+    Image = None
+
+
+FORMAT_PNG = 'png'
+FORMAT_JPEG = 'jpeg'
+FORMATS = [FORMAT_PNG, FORMAT_JPEG]
+
+# File name extension of each format, from which the upload content type is
+# guessed.
+EXTENSIONS = {FORMAT_PNG: 'png', FORMAT_JPEG: 'jpg'}
+
+DEFAULT_QUALITY = 85
+# The maximum width and height of the thumbnails in pixels.
+DEFAULT_THUMBNAIL_SIZE = 160
+
+LOGGER_NAME = 'screenshot_transcode'
+
+# Initialize the logger for this module
+logger = client_logging.GetLogger(LOGGER_NAME)
+
+
+def GetFilename(name, image_format):
+  """Return the file name to upload an image of the given format with."""
+  return '%s.%s' % (name, EXTENSIONS[image_format])
+
+
+def _Save(image, image_format, quality):
+  """Encode an image in the given format.
+
+  Args:
+    image: A PIL image.
+    image_format: A string from FORMATS.
+    quality: An int from 1 to 100 representing the JPEG quality.
+
+  Returns:
+    A string representing the binary image data.
+  """
+  output = StringIO.StringIO()
+  if image_format == FORMAT_JPEG:
+    if image.mode != 'RGB':
+      image = image.convert('RGB')
+    image.save(output, 'JPEG', quality=quality, optimize=True)
+  else:
+    image.save(output, 'PNG', optimize=True)
+  return output.getvalue()
+
+
+def Transcode(png, image_format=FORMAT_PNG, quality=DEFAULT_QUALITY,
+              thumbnail_size=0):
+  """Convert a PNG screenshot and create its thumbnail.
+
+  Args:
+    png: A string representing the binary data of a PNG image.
+    image_format: An optional string from FORMATS to convert the image to.
+    quality: An optional int from 1 to 100 representing the JPEG quality.
+    thumbnail_size: An optional int representing the maximum width and height
+      of the thumbnail in pixels. No thumbnail is created if it is 0.
+
+  Returns:
+    A tuple of the binary image data, its format and the binary thumbnail data
+    in the same format. The thumbnail is None if it was not created. If the
+    image cannot be transcoded, the PNG image is returned unchanged.
+  """
+  if not png or Image is None or (image_format == FORMAT_PNG and
+                                  not thumbnail_size):
+    return (png, FORMAT_PNG, None)
+
+  try:
+    image = Image.open(StringIO.StringIO(png))
+    image.load()
+
+    data = png
+    if image_format != FORMAT_PNG:
+      data = _Save(image, image_format, quality)
+      if len(data) >= len(png):
+        # The conversion does not pay off, e.g. for a blank page.
+        data = png
+        image_format = FORMAT_PNG
+
+    thumbnail = None
+    if thumbnail_size:
+      image.thumbnail((thumbnail_size, thumbnail_size), Image.ANTIALIAS)
+      thumbnail = _Save(image, image_format, quality)
+  except (IOError, ValueError):
+    logger.exception('Failed to transcode the screenshot.')
+    return (png, FORMAT_PNG, None)
+
+  return (data, image_format, thumbnail)
@@ -0,0 +1,88 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Tests for screenshot_transcode."""
+
+
+
+import random
+import StringIO
+import unittest
+
+import screenshot_transcode
+
+
+def _CreatePng(width, height):
+  image = screenshot_transcode.Image.new('RGB', (width, height))
+  rng = random.Random(3)
+  image.putdata([(rng.randint(0, 255), rng.randint(0, 255), 128)
+                 for _ in range(width * height)])
+  output = StringIO.StringIO()
+  image.save(output, 'PNG')
+  return output.getvalue()
+
+
+class ScreenshotTranscodeTest(unittest.TestCase):
+
+  def testGetFilename(self):
+    self.assertEqual('screenshot.png', screenshot_transcode.GetFilename(
+        'screenshot', screenshot_transcode.FORMAT_PNG))
+    self.assertEqual('screenshot.jpg', screenshot_transcode.GetFilename(
+        'screenshot', screenshot_transcode.FORMAT_JPEG))
+
+  def testTranscode_Png(self):
+    self.assertEqual(('png-data', screenshot_transcode.FORMAT_PNG, None),
+                     screenshot_transcode.Transcode('png-data'))
+
+  def testTranscode_Invalid(self):
+    self.assertEqual(('png-data', screenshot_transcode.FORMAT_PNG, None),
+                     screenshot_transcode.Transcode(
+                         'png-data', screenshot_transcode.FORMAT_JPEG,
+                         thumbnail_size=10))
+
+  def testTranscode_Jpeg(self):
+    if screenshot_transcode.Image is None:
+      return
+    png = _CreatePng(200, 100)
+    data, image_format, thumbnail = screenshot_transcode.Transcode(
+        png, screenshot_transcode.FORMAT_JPEG, quality=50, thumbnail_size=40)
+    self.assertEqual(screenshot_transcode.FORMAT_JPEG, image_format)
+    self.assertTrue(len(data) < len(png))
+
+    image = screenshot_transcode.Image.open(StringIO.StringIO(data))
+    self.assertEqual(('JPEG', (200, 100)), (image.format, image.size))
+    image = screenshot_transcode.Image.open(StringIO.StringIO(thumbnail))
+    self.assertEqual(('JPEG', (40, 20)), (image.format, image.size))
+
+  def testTranscode_PngThumbnail(self):
+    if screenshot_transcode.Image is None:
+      return
+    png = _CreatePng(50, 100)
+    data, image_format, thumbnail = screenshot_transcode.Transcode(
+        png, thumbnail_size=20)
+    self.assertEqual((png, screenshot_transcode.FORMAT_PNG),
+                     (data, image_format))
+    image = screenshot_transcode.Image.open(StringIO.StringIO(thumbnail))
+    self.assertEqual(('PNG', (10, 20)), (image.format, image.size))
+
+
+def main():
+  unittest.main()
+
+
+if __name__ == '__main__':
+  main()
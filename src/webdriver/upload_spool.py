@@ -0,0 +1,174 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Local spool of the test results that could not be uploaded yet.
+
+Every spooled test case is a JSON file in the spool directory. Files are
+written to a temporary name and renamed once complete, so a spooled item is
+either complete or absent, even if the client dies while writing it. Items are
+named after the time they were spooled and are returned oldest first.
+"""
+
+
+
+import json
+import os
+import threading
+import time
+import uuid
+
+import appengine_communicator
+import client_logging
+
+
+ITEM_EXTENSION = '.json'
+_TEMP_EXTENSION = '.tmp'
+
+LOGGER_NAME = 'upload_spool'
+
+# Initialize the logger for this module
+logger = client_logging.GetLogger(LOGGER_NAME)
+
+
+class SpoolError(Exception):
+  pass
+
+
+class UploadSpool(object):
+  """Stores test results on disk until they are uploaded.
+
+  Attributes:
+    _directory: A string representing the spool directory.
+    _lock: A threading.Lock making item names unique within the process.
+    _last_time: The time in milliseconds the last item was named after.
+  """
+
+  def __init__(self, directory):
+    """Open the spool, creating its directory if necessary.
+
+    Incomplete items left behind by a previous client are removed.
+
+    Args:
+      directory: A string representing the spool directory.
+    """
+    self._directory = directory
+    self._lock = threading.Lock()
+    self._last_time = 0
+
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    for name in os.listdir(directory):
+      if name.endswith(_TEMP_EXTENSION):
+        logger.info('Removing the incomplete spool item "%s".', name)
+        os.remove(os.path.join(directory, name))
+
+  def _CreateItemName(self):
+    with self._lock:
+      item_time = max(int(time.time() * 1000), self._last_time + 1)
+      self._last_time = item_time
+    return '%015d-%s' % (item_time, uuid.uuid4().hex)
+
+  def Add(self, test_case, results, base64_png):
+    """Spool the results of a test case.
+
+    Args:
+      test_case: An appengine_communicator.TestCase object describing the test
+        case.
+      results: A dictionary of the test script results.
+      base64_png: A string respresenting a base64 png screenshot.
+
+    Returns:
+      A string representing the path of the spooled item.
+
+    Raises:
+      SpoolError: The item could not be written.
+    """
+    item = {'test_case': {'url': test_case.url,
+                          'start_time': test_case.start_time,
+                          'config': test_case.config,
+                          'test_key': test_case.test_key,
+                          'load_time': test_case.load_time,
+                          'process_time': test_case.process_time},
+            'results': results,
+            'png': base64_png}
+
+    name = self._CreateItemName()
+    temp_path = os.path.join(self._directory, name + _TEMP_EXTENSION)
+    path = os.path.join(self._directory, name + ITEM_EXTENSION)
+    try:
+      with open(temp_path, 'wb') as f:
+        json.dump(item, f)
+        f.flush()
+        os.fsync(f.fileno())
+      os.rename(temp_path, path)
+    except (IOError, OSError, TypeError, ValueError):
+      logger.exception('Failed to spool the results for "%s".', test_case.url)
+      if os.path.exists(temp_path):
+        os.remove(temp_path)
+      raise SpoolError('Failed to spool the results for "%s".' % test_case.url)
+
+    return path
+
+  def GetItems(self):
+    """Return the paths of the spooled items, oldest first."""
+    return [os.path.join(self._directory, name)
+            for name in sorted(os.listdir(self._directory))
+            if name.endswith(ITEM_EXTENSION)]
+
+  def GetAge(self, path):
+    """Return the number of seconds since the given item was spooled."""
+    item_time = int(os.path.basename(path).split('-', 1)[0])
+    return time.time() - item_time / 1000.0
+
+  def Load(self, path):
+    """Load a spooled item.
+
+    Args:
+      path: A string representing the path of the spooled item.
+
+    Returns:
+      A tuple of an appengine_communicator.TestCase object, the test script
+      results and the base64 png screenshot.
+
+    Raises:
+      SpoolError: The item could not be read.
+    """
+    try:
+      with open(path, 'rb') as f:
+        item = json.load(f)
+      test_case_data = item['test_case']
+      test_case = appengine_communicator.TestCase(
+          test_case_data['url'], test_case_data['start_time'],
+          test_case_data['config'], test_case_data['test_key'])
+      test_case.load_time = test_case_data['load_time']
+      # Items spooled by older clients have no process time.
+      test_case.process_time = test_case_data.get('process_time')
+      return (test_case, item['results'], item['png'])
+    except (IOError, KeyError, TypeError, ValueError):
+      logger.exception('Failed to load the spool item "%s".', path)
+      raise SpoolError('Failed to load the spool item "%s".' % path)
+
+  def Remove(self, path):
+    """Remove a spooled item once it was uploaded.
+
+    Args:
+      path: A string representing the path of the spooled item.
+    """
+    try:
+      os.remove(path)
+    except OSError:
+      logger.exception('Failed to remove the spool item "%s".', path)
@@ -0,0 +1,90 @@
+#!/usr/bin/python2.6
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Tests for upload_spool."""
+
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import appengine_communicator
+import upload_spool
+
+
+class UploadSpoolTest(unittest.TestCase):
+
+  def setUp(self):
+    self._directory = tempfile.mkdtemp()
+    self._test_case = appengine_communicator.TestCase(
+        'http://www.google.com', 'start', {'width': 1024}, 'key')
+    self._test_case.load_time = 1.5
+    self._test_case.process_time = 12.25
+
+  def tearDown(self):
+    shutil.rmtree(self._directory)
+
+  def testAddAndLoad(self):
+    spool = upload_spool.UploadSpool(self._directory)
+    path = spool.Add(self._test_case, {'layout_table': [[1, 2]]}, 'png')
+    self.assertEqual([path], spool.GetItems())
+
+    test_case, results, base64_png = spool.Load(path)
+    self.assertEqual('http://www.google.com', test_case.url)
+    self.assertEqual('start', test_case.start_time)
+    self.assertEqual({'width': 1024}, test_case.config)
+    self.assertEqual('key', test_case.test_key)
+    self.assertEqual(1.5, test_case.load_time)
+    self.assertEqual(12.25, test_case.process_time)
+    self.assertEqual({'layout_table': [[1, 2]]}, results)
+    self.assertEqual('png', base64_png)
+    self.assertTrue(0 <= spool.GetAge(path) < 60)
+
+    spool.Remove(path)
+    self.assertEqual([], spool.GetItems())
+
+  def testGetItems_OldestFirst(self):
+    spool = upload_spool.UploadSpool(self._directory)
+    paths = [spool.Add(self._test_case, {}, str(i)) for i in range(5)]
+    self.assertEqual(paths, spool.GetItems())
+
+  def testInit_SurvivesRestart(self):
+    path = upload_spool.UploadSpool(self._directory).Add(
+        self._test_case, {}, 'png')
+    incomplete = os.path.join(self._directory, 'item.tmp')
+    open(incomplete, 'w').close()
+
+    spool = upload_spool.UploadSpool(self._directory)
+    self.assertEqual([path], spool.GetItems())
+    self.assertFalse(os.path.exists(incomplete))
+
+  def testLoad_Invalid(self):
+    spool = upload_spool.UploadSpool(self._directory)
+    path = os.path.join(self._directory, '1-item.json')
+    with open(path, 'w') as f:
+      f.write('{"test_case": ')
+    self.assertRaises(upload_spool.SpoolError, spool.Load, path)
+
+
+def main():
+  unittest.main()
+
+
+if __name__ == '__main__':
+  main()
@@ -20,6 +20,8 @@
 
 
 
+import time
+
 from selenium import webdriver
 from selenium.common import exceptions
 from selenium.webdriver.common import desired_capabilities
@@ -34,6 +36,39 @@ DEFAULT_TEST_TIMEOUT = 600
 DEFAULT_WIDTH = 1024
 DEFAULT_HEIGHT = 512
 
+# The maximum time to wait for a page to be ready in seconds.
+DEFAULT_MAX_READY_WAIT = 30
+# The time between two checks of the page readiness in seconds.
+READY_POLL_INTERVAL = 0.25
+# The number of consecutive checks the page layout must be unchanged in.
+READY_STABLE_FRAMES = 3
+
+# Returns a snapshot of the page loading progress and layout: the document
+# ready state, the number of images still loading, the number of resources
+# fetched so far, the number of elements and the bounding box of the body.
+_READY_STATE_SCRIPT = """
+var resources = 0;
+if (window.performance && window.performance.getEntriesByType) {
+  resources = window.performance.getEntriesByType('resource').length;
+}
+var pending = 0;
+for (var i = 0; i < document.images.length; i++) {
+  if (!document.images[i].complete) {
+    pending++;
+  }
+}
+var box = null;
+if (document.body) {
+  var rect = document.body.getBoundingClientRect();
+  box = [rect.left, rect.top, rect.width, rect.height];
+}
+return {'readyState': document.readyState,
+        'pending': pending,
+        'resources': resources,
+        'elements': document.getElementsByTagName('*').length,
+        'box': box};
+"""
+
 LOGGER_NAME = 'webdriver_wrapper'
 
 # Initialize the logger for this module
@@ -55,13 +90,14 @@ class TimeoutError(Exception):
 class ChromeWithProfile(webdriver.Chrome):
   """
   """
-  def __init__(self, executable_path="chromedriver", port=0):
+  def __init__(self, executable_path="chromedriver", port=0, worker_id=None):
     self.service = webdriver.chrome.service.Service('chromedriver', port=0)
     self.service.start()
 
-    caps = desired_capabilities.DesiredCapabilities.CHROME
-    caps.update({'chrome.switches': ['--user-data-dir=%s' %
-                                     chrome_resize.GetChromeProfilePath()]})
+    # The capabilities are copied, the workers each have their own profile.
+    caps = dict(desired_capabilities.DesiredCapabilities.CHROME)
+    caps.update({'chrome.switches': [
+        '--user-data-dir=%s' % chrome_resize.GetChromeProfilePath(worker_id)]})
 
     webdriver.remote.webdriver.WebDriver.__init__(
         self, command_executor=self.service.service_url,
@@ -73,10 +109,13 @@ class WebdriverWrapper(object):
 
   Attributes:
     _driver: The webdriver object used to control the browser.
+    _worker_id: An int identifying the browser worker using this wrapper, or
+      None. Every worker uses its own browser profile.
   """
 
-  def __init__(self):
+  def __init__(self, worker_id=None):
     self._driver = None
+    self._worker_id = worker_id
 
   def __del__(self):
     self.KillDriver()
@@ -193,6 +232,55 @@ class WebdriverWrapper(object):
     if self._driver:
       self._driver.refresh()
 
+  def WaitForPageReady(self, max_wait=DEFAULT_MAX_READY_WAIT,
+                       poll_interval=READY_POLL_INTERVAL,
+                       stable_frames=READY_STABLE_FRAMES):
+    """Wait until the current page has loaded and its layout is stable.
+
+    The page is ready once the document is complete, no image is loading and
+    neither the fetched resources nor the layout (the element count and the
+    body bounding box) changed for stable_frames consecutive checks.
+
+    Args:
+      max_wait: An optional number of seconds to wait at most.
+      poll_interval: An optional number of seconds between two checks.
+      stable_frames: An optional number of consecutive checks the page must be
+        unchanged in.
+
+    Returns:
+      A tuple of the number of seconds waited and a boolean indicating whether
+      the page became ready before max_wait elapsed.
+    """
+    start_time = time.time()
+    if not self._driver:
+      return (0, False)
+
+    last_snapshot = None
+    unchanged = 0
+    while True:
+      try:
+        snapshot = self.ExecuteScript(_READY_STATE_SCRIPT)
+      except ExecutionError:
+        # The page may be navigating, e.g. because of a redirect.
+        snapshot = None
+
+      if (snapshot and snapshot.get('readyState') == 'complete' and
+          not snapshot.get('pending')):
+        if snapshot == last_snapshot:
+          unchanged += 1
+        else:
+          unchanged = 0
+        if unchanged >= stable_frames:
+          return (time.time() - start_time, True)
+      else:
+        unchanged = 0
+      last_snapshot = snapshot
+
+      if time.time() - start_time + poll_interval > max_wait:
+        logger.warning('The page was not ready after %d seconds.', max_wait)
+        return (time.time() - start_time, False)
+      time.sleep(poll_interval)
+
   def ResizeBrowser(self, width, height):
     """Attempt to resize the browser to the given width and height.
 
@@ -219,9 +307,10 @@ class WebdriverWrapper(object):
       SpawnException: There is an error spawning the instance.
     """
     # Resize the browser through the profile
-    chrome_resize.SetChromeWindowSize(width, height)
+    chrome_resize.SetChromeWindowSize(width, height, worker_id=self._worker_id)
 
-    self._SpawnWebDriver(ChromeWithProfile)
+    self._SpawnWebDriver(
+        lambda: ChromeWithProfile(worker_id=self._worker_id))
 
   def SpawnFirefoxDriver(self):
     """Spawns a Firefox webdriver instance.